@@ -1,8 +1,8 @@
 from django.contrib.auth import get_user_model
-from django.http import JsonResponse
 from rest_framework.request import Request
 from rest_framework.views import APIView
 
+from ..serialization import JsonResponse
 from . import serializers as s
 
 User = get_user_model()
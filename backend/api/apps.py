@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self) -> None:
+        # Keeps the friendship graph cache and the player statistics up to date with the friendships
+        from .friends import signals as friends_signals  # noqa: F401
+        from .play import signals  # noqa: F401
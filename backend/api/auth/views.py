@@ -1,9 +1,9 @@
 from django.contrib.auth import authenticate, get_user_model, login, logout
-from django.http import JsonResponse
 from rest_framework.request import Request
 from rest_framework.throttling import ScopedRateThrottle
 from rest_framework.views import APIView
 
+from ..serialization import JsonResponse
 from . import serializers as s
 
 User = get_user_model()
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Collection
+
+from django.db.models import Q
+
+from .models import FriendRequest, Friendship
+
+TimeS = float
+
+
+class UserConnections:
+    """Friends and pending friend requests of one user, as sets of user IDs"""
+
+    __slots__ = ("friends", "sent", "received", "loaded_at")
+
+    def __init__(self, loaded_at: TimeS) -> None:
+        self.friends: set[int] = set()
+        self.sent: set[int] = set()
+        self.received: set[int] = set()
+        self.loaded_at = loaded_at
+
+
+class FriendGraph:
+    """
+    In-memory cache of the friendship graph, holding the adjacency sets of the recently used users.
+    - Adjacency sets of any number of users are loaded in two queries, status lookups are then O(1)
+    - Entries are dropped when a friendship or friend request of the user changes in this process,
+      and expire after `TTL` seconds, which bounds how stale changes made by other workers can be
+    - Holds at most `MAX_USERS` users, the least recently used are evicted
+    - Users are loaded outside of the lock. A user invalidated while being loaded is returned but not cached, the
+      loaded state may predate the change. The invalidations are counted in `generations` while any load is running
+    """
+
+    MAX_USERS = 10_000
+    TTL: TimeS = 30
+
+    def __init__(self, time_source: Callable[[], TimeS] = time.monotonic) -> None:
+        self.time_source = time_source
+        self.lock = threading.Lock()
+        self.users: OrderedDict[int, UserConnections] = OrderedDict()
+        self.generations: dict[int, int] = {}
+        """Number of invalidations of every user since the running loads started, cleared once none is running"""
+        self.loads = 0
+
+    def get(self, userId: int) -> UserConnections:
+        return self.get_many([userId])[userId]
+
+    def get_many(self, userIds: Collection[int]) -> dict[int, UserConnections]:
+        now = self.time_source()
+        connections: dict[int, UserConnections] = {}
+        with self.lock:
+            for userId in userIds:
+                userConnections = self.users.get(userId)
+                if userConnections is not None and now - userConnections.loaded_at < self.TTL:
+                    self.users.move_to_end(userId)
+                    connections[userId] = userConnections
+
+            missing = set(userIds) - connections.keys()
+            if not missing:
+                return connections
+
+            self.loads += 1
+            generations = {userId: self.generations.get(userId, 0) for userId in missing}
+
+        loaded: dict[int, UserConnections] = {}
+        try:
+            loaded = self.load(missing, now)
+        finally:
+            with self.lock:
+                for userId, userConnections in loaded.items():
+                    if self.generations.get(userId, 0) == generations[userId]:
+                        self.users[userId] = userConnections
+                while len(self.users) > self.MAX_USERS:
+                    self.users.popitem(last=False)
+
+                self.loads -= 1
+                if not self.loads:
+                    self.generations.clear()
+
+        connections.update(loaded)
+        return connections
+
+    def load(self, userIds: set[int], now: TimeS) -> dict[int, UserConnections]:
+        connections = {userId: UserConnections(now) for userId in userIds}
+
+        friendships = Friendship.objects.filter(Q(user1_id__in=userIds) | Q(user2_id__in=userIds))
+        for user1Id, user2Id in friendships.values_list("user1_id", "user2_id"):
+            if user1Id in connections:
+                connections[user1Id].friends.add(user2Id)
+            if user2Id in connections:
+                connections[user2Id].friends.add(user1Id)
+
+        friendRequests = FriendRequest.objects.filter(Q(fromUser_id__in=userIds) | Q(toUser_id__in=userIds))
+        for fromUserId, toUserId in friendRequests.values_list("fromUser_id", "toUser_id"):
+            if fromUserId in connections:
+                connections[fromUserId].sent.add(toUserId)
+            if toUserId in connections:
+                connections[toUserId].received.add(fromUserId)
+
+        return connections
+
+    def invalidate(self, *userIds: int) -> None:
+        with self.lock:
+            for userId in userIds:
+                self.users.pop(userId, None)
+                if self.loads:
+                    self.generations[userId] = self.generations.get(userId, 0) + 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.users.clear()
+
+
+FRIEND_GRAPH = FriendGraph()
+"""Friendship graph cache of this process"""
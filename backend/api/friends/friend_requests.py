@@ -1,22 +1,20 @@
-from django.contrib.auth.models import AnonymousUser
 from users.models import User
 
+from .friend_graph import FRIEND_GRAPH
 from .models import FriendRequest, Friendship
 
 
-def getFriendRequests(user: User | AnonymousUser) -> list[User]:
+def getFriendRequests(user: User) -> list[User]:
     """Returns a list of users that have sent friend requests to the user"""
-    requests = FriendRequest.objects.filter(toUser=user)
-    return [request.fromUser for request in requests]
+    return list(User.objects.filter(pk__in=FRIEND_GRAPH.get(user.pk).received).order_by("pk"))
 
 
-def getFriendRequestsSent(user: User | AnonymousUser) -> list[User]:
+def getFriendRequestsSent(user: User) -> list[User]:
     """Returns a list of users that the user has sent friend requests to"""
-    requests = FriendRequest.objects.filter(fromUser=user)
-    return [request.toUser for request in requests]
+    return list(User.objects.filter(pk__in=FRIEND_GRAPH.get(user.pk).sent).order_by("pk"))
 
 
-def getFriendRequest(fromUser: User | AnonymousUser, toUser: User | AnonymousUser) -> FriendRequest | None:
+def getFriendRequest(fromUser: User, toUser: User) -> FriendRequest | None:
     """Returns the friend request if it exists, otherwise None"""
     friendRequest = FriendRequest.objects.filter(fromUser=fromUser, toUser=toUser)
     if friendRequest.exists():
@@ -24,7 +22,7 @@ def getFriendRequest(fromUser: User | AnonymousUser, toUser: User | AnonymousUse
     return None
 
 
-def sendFriendRequest(fromUser: User | AnonymousUser, toUser: User) -> None:
+def sendFriendRequest(fromUser: User, toUser: User) -> None:
     """Sends a friend request from fromUser to toUser"""
     oppositeRequest = getFriendRequest(toUser, fromUser)
     if oppositeRequest:
@@ -1,24 +1,22 @@
 from enum import Enum
+from typing import Iterable
 
-from django.db.models import Q
 from users.models import User
 
-from . import friend_requests
+from .friend_graph import FRIEND_GRAPH, UserConnections
 from .models import Friendship
 
 
 def getFriends(user: User) -> list[User]:
     """Returns a list of users that are friends with the user"""
-    friendships = Friendship.objects.filter(Q(user1=user) | Q(user2=user))
-    return [friendship.get_friend(user) for friendship in friendships]
+    friendIds = FRIEND_GRAPH.get(user.pk).friends
+    return list(User.objects.filter(pk__in=friendIds).order_by("pk"))
 
 
 def getFriendship(user1: User, user2: User) -> Friendship | None:
     """Return the friendship between user1 and user2 if it exists, otherwise None"""
-    friendships = Friendship.objects.filter(Q(user1=user1, user2=user2) | Q(user1=user2, user2=user1))
-    if not friendships.exists():
-        return None
-    return friendships.first()
+    user1Id, user2Id = Friendship.ordered_ids(user1.pk, user2.pk)
+    return Friendship.objects.filter(user1_id=user1Id, user2_id=user2Id).first()
 
 
 class FriendStatus(Enum):
@@ -28,21 +26,34 @@ class FriendStatus(Enum):
     friendRequestReceived = "friend_request_received"
 
 
-def getFriendStatus(fromUser: User, toUser: User) -> FriendStatus:
-    """Returns the status of the friendship between user1 and user2, raises an error if both users are the same user"""
-    if fromUser == toUser:
-        raise ValueError("User cannot be friends with itself")
-
-    if getFriendship(fromUser, toUser):
+def connectionStatus(connections: UserConnections, toUserId: int) -> FriendStatus:
+    if toUserId in connections.friends:
         return FriendStatus.friends
-    elif friend_requests.getFriendRequest(fromUser, toUser):
+    elif toUserId in connections.sent:
         return FriendStatus.friendRequestSent
-    elif friend_requests.getFriendRequest(toUser, fromUser):
+    elif toUserId in connections.received:
         return FriendStatus.friendRequestReceived
     else:
         return FriendStatus.notFriends
 
 
+def getFriendStatus(fromUser: User, toUser: User) -> FriendStatus:
+    """Returns the status of the friendship between user1 and user2, raises an error if both users are the same user"""
+    if fromUser == toUser:
+        raise ValueError("User cannot be friends with itself")
+
+    return connectionStatus(FRIEND_GRAPH.get(fromUser.pk), toUser.pk)
+
+
+def getFriendStatuses(fromUser: User, toUsers: Iterable[User]) -> dict[int, FriendStatus]:
+    """
+    Returns the statuses of the friendships between fromUser and each of toUsers, keyed by the user IDs
+    - Looks the users up in the friendship graph of fromUser, `fromUser` itself is left out
+    """
+    connections = FRIEND_GRAPH.get(fromUser.pk)
+    return {toUser.pk: connectionStatus(connections, toUser.pk) for toUser in toUsers if toUser.pk != fromUser.pk}
+
+
 def getFriendsWithStatuses(user: User, referenceStatusUser: User) -> list[tuple[User, FriendStatus | None]]:
     """
     Returns a list of users that are friends with the given user
@@ -50,6 +61,7 @@ def getFriendsWithStatuses(user: User, referenceStatusUser: User) -> list[tuple[
     """
 
     friends = getFriends(user)
+    statuses = getFriendStatuses(fromUser=referenceStatusUser, toUsers=friends)
 
     friendsWithStatuses: list[tuple[User, FriendStatus | None]] = []
     for friend in friends:
@@ -58,7 +70,6 @@ def getFriendsWithStatuses(user: User, referenceStatusUser: User) -> list[tuple[
             friendsWithStatuses.append((friend, None))
             continue
 
-        status = getFriendStatus(fromUser=referenceStatusUser, toUser=friend)
-        friendsWithStatuses.append((friend, status))
+        friendsWithStatuses.append((friend, statuses[friend.pk]))
 
     return friendsWithStatuses
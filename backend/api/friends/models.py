@@ -1,12 +1,17 @@
 from __future__ import annotations
 
-import typing
+from typing import Any
 
 from django.db import models
 from users.models import User
 
 
 class Friendship(models.Model):
+    """
+    Undirected friendship between two users, stored once with the lower user ID as `user1`.
+    - The order is enforced on save, so that a pair is looked up with a single probe of the unique index
+    """
+
     friend_id = models.AutoField(primary_key=True)
     user1 = models.ForeignKey(User, related_name="user1", on_delete=models.CASCADE)
     user2 = models.ForeignKey(User, related_name="user2", on_delete=models.CASCADE)
@@ -15,16 +20,32 @@ class Friendship(models.Model):
 
     class Meta:
         unique_together = ("user1", "user2")
+        # `check` is renamed to `condition` in Django 5.1, which older versions don't accept
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(user1__lt=models.F("user2")), name="friendship_ordered"
+            ),  # type: ignore[call-arg]
+        ]
 
     def __str__(self) -> str:
         return f"{self.user1.username} - {self.user2.username}"
 
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        if self.user1_id > self.user2_id:
+            self.user1_id, self.user2_id = self.user2_id, self.user1_id
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def ordered_ids(user1Id: int, user2Id: int) -> tuple[int, int]:
+        """Returns the user IDs in the order the friendship of the users is stored in"""
+        return (user1Id, user2Id) if user1Id < user2Id else (user2Id, user1Id)
+
     def get_friend(self, user: User) -> User:
         """Returns the other user in the friendship"""
         if self.user1 == user:
-            return typing.cast(User, self.user2)
+            return self.user2
         else:
-            return typing.cast(User, self.user1)
+            return self.user1
 
 
 class FriendRequest(models.Model):
@@ -0,0 +1,29 @@
+from typing import Any
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .friend_graph import FRIEND_GRAPH
+from .models import FriendRequest, Friendship
+
+
+def invalidate_users(*userIds: int) -> None:
+    """
+    Drops the users from the friendship graph cache.
+    - Dropped again once the transaction commits, so that a lookup made before the commit can't keep the old state
+    """
+    FRIEND_GRAPH.invalidate(*userIds)
+    transaction.on_commit(lambda: FRIEND_GRAPH.invalidate(*userIds))
+
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def friendship_changed(sender: type[Friendship], instance: Friendship, **kwargs: Any) -> None:
+    invalidate_users(instance.user1_id, instance.user2_id)
+
+
+@receiver(post_save, sender=FriendRequest)
+@receiver(post_delete, sender=FriendRequest)
+def friend_request_changed(sender: type[FriendRequest], instance: FriendRequest, **kwargs: Any) -> None:
+    invalidate_users(instance.fromUser_id, instance.toUser_id)
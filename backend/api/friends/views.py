@@ -1,10 +1,10 @@
 from typing import Any, Callable
 
-from django.http import JsonResponse
 from rest_framework.request import Request
 from rest_framework.views import APIView
 from users.models import User
 
+from ..serialization import JsonResponse
 from . import friend_requests, friends
 from .friends import FriendStatus
 
@@ -161,21 +161,21 @@ def friendRequestValid(func: Callable[..., JsonResponse | None]) -> JsonResponse
 
 class FriendRequests(APIView):
     @userAuthenticated
-    def get(self, request: Request) -> JsonResponse:
+    def get(self, request: AuthenticatedUserRequest) -> JsonResponse:
         users = friend_requests.getFriendRequests(request.user)
         return JsonResponse({"friend_requests": [user.username for user in users]})
 
 
 class FriendRequestsSent(APIView):
     @userAuthenticated
-    def get(self, request: Request) -> JsonResponse:
+    def get(self, request: AuthenticatedUserRequest) -> JsonResponse:
         users = friend_requests.getFriendRequestsSent(request.user)
         return JsonResponse({"friend_requests": [user.username for user in users]})
 
 
 class FriendRequest(APIView):
     @friendRequestValid
-    def post(self, request: Request, user: User) -> JsonResponse:
+    def post(self, request: AuthenticatedUserRequest, user: User) -> JsonResponse:
         if friend_requests.getFriendRequest(request.user, user):
             return JsonResponse({"error": "Friend request already sent"}, status=400)
 
@@ -183,7 +183,7 @@ class FriendRequest(APIView):
         return JsonResponse({"success": True})
 
     @friendRequestValid
-    def delete(self, request: Request, user: User) -> JsonResponse:
+    def delete(self, request: AuthenticatedUserRequest, user: User) -> JsonResponse:
         friendRequest = friend_requests.getFriendRequest(request.user, user)
         if not friendRequest:
             return JsonResponse({"error": "Friend request does not exist"}, status=404)
@@ -194,7 +194,7 @@ class FriendRequest(APIView):
 
 class DeclineFriendRequest:
     @friendRequestValid
-    def post(self, request: Request, user: User) -> JsonResponse:
+    def post(self, request: AuthenticatedUserRequest, user: User) -> JsonResponse:
         friendRequest = friend_requests.getFriendRequest(user, request.user)
         if not friendRequest:
             return JsonResponse({"error": "Friend request does not exist"}, status=404)
@@ -0,0 +1,71 @@
+from itertools import groupby
+from typing import Any
+
+from api.play.models import Game, Move
+from api.play.move_encoding import encode_moves
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection, transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Encodes the moves of the games saved as `Move` rows into `Game.encoded_moves`. "
+        "The games are processed in chunks of ascending game IDs, so the command can be interrupted and run again. "
+        "The migration adding the column backfills the existing games, afterwards the command deletes their moves."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Number of games encoded in one transaction")
+        parser.add_argument(
+            "--delete-moves", action="store_true", help="Delete the `Move` rows of the games once they are encoded"
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        chunkSize: int = options["chunk_size"]
+        deleteMoves: bool = options["delete_moves"]
+        if not self.has_encoded_moves_column():
+            raise CommandError(
+                "The games table has no encoded_moves column, run `python manage.py migrate --fake-initial` first"
+            )
+
+        encodedGames = 0
+        lastGameId = 0
+        while True:
+            gameIds = list(
+                Game.objects.filter(encoded_moves__isnull=True, game_id__gt=lastGameId)
+                .order_by("game_id")
+                .values_list("game_id", flat=True)[:chunkSize]
+            )
+            if not gameIds:
+                break
+
+            self.encode_games(gameIds, deleteMoves)
+            encodedGames += len(gameIds)
+            lastGameId = gameIds[-1]
+            self.stdout.write(f"Encoded {encodedGames} games", ending="\r")
+
+        self.stdout.write(self.style.SUCCESS(f"Encoded {encodedGames} games"))
+
+    def has_encoded_moves_column(self) -> bool:
+        with connection.cursor() as cursor:
+            columns = connection.introspection.get_table_description(cursor, Game._meta.db_table)
+        return any(column.name == "encoded_moves" for column in columns)
+
+    def encode_games(self, gameIds: list[int], deleteMoves: bool) -> None:
+        moves = (
+            Move.objects.filter(game_id__in=gameIds)
+            .order_by("game_id", "order")
+            .values_list("game_id", "move")
+            .iterator(chunk_size=10_000)
+        )
+        movesByGame = {
+            gameId: [move for _, move in gameMoves] for gameId, gameMoves in groupby(moves, lambda row: row[0])
+        }
+
+        with transaction.atomic():
+            Game.objects.bulk_update(
+                [Game(game_id=gameId, encoded_moves=encode_moves(movesByGame.get(gameId, []))) for gameId in gameIds],
+                ["encoded_moves"],
+            )
+            if deleteMoves:
+                Move.objects.filter(game_id__in=gameIds).delete()
@@ -0,0 +1,35 @@
+from typing import Any
+
+from api.play.reaper import ANONYMOUS_USER_REAPER
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes the expired sessions and the anonymous users whose session is gone and who didn't play any saved "
+        "game, together with their players. Safe to run while the game servers are running, the rows are deleted in "
+        "short transactions of bounded size."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=ANONYMOUS_USER_REAPER.BATCH_SIZE,
+            help="Number of rows deleted in one transaction",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        ANONYMOUS_USER_REAPER.BATCH_SIZE = options["batch_size"]
+        try:
+            stats = ANONYMOUS_USER_REAPER.reap()
+        except ImproperlyConfigured as error:
+            raise CommandError(error) from error
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {stats['sessions']} expired sessions and {stats['anonymous_users']} anonymous users "
+                f"in {stats['batches']} batches"
+            )
+        )
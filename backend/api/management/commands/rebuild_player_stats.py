@@ -0,0 +1,36 @@
+from typing import Any
+
+from api.play.models import Player
+from api.play.stats import rebuild_player_stats
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the statistics of all players from their games and friendships, repairing any drift of the "
+        "incrementally updated counters. The players are processed in chunks of ascending IDs."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Number of players rebuilt in one transaction")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        chunkSize: int = options["chunk_size"]
+
+        rebuiltPlayers = 0
+        lastPlayerId = 0
+        while True:
+            playerIds = list(
+                Player.objects.filter(pk__gt=lastPlayerId).order_by("pk").values_list("pk", flat=True)[:chunkSize]
+            )
+            if not playerIds:
+                break
+
+            with transaction.atomic():
+                rebuild_player_stats(playerIds)
+            rebuiltPlayers += len(playerIds)
+            lastPlayerId = playerIds[-1]
+            self.stdout.write(f"Rebuilt {rebuiltPlayers} players", ending="\r")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuiltPlayers} players"))
@@ -0,0 +1,48 @@
+from itertools import islice
+from typing import Any, Iterator
+
+from api.play.game_modes import get_game_mode_by_time_control
+from api.play.models import Game, Rating
+from api.play.ratings import RatedGame, apply_rating_updates
+from django.core.management.base import BaseCommand, CommandParser
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the ratings of all players from the finished games, in the order the games were played. "
+        "The games are streamed in chunks, so the memory use does not grow with the number of games. "
+        "Ratings updated while the command runs are overwritten, run it while the game servers are stopped."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Number of games rated in one transaction")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        chunkSize: int = options["chunk_size"]
+
+        deleted, _ = Rating.objects.all().delete()
+        self.stdout.write(f"Deleted {deleted} ratings")
+
+        ratedGames = 0
+        games = self.iter_rated_games(chunkSize)
+        while chunk := list(islice(games, chunkSize)):
+            ratedGames += apply_rating_updates(chunk)
+            self.stdout.write(f"Rated {ratedGames} games", ending="\r")
+
+        self.stdout.write(self.style.SUCCESS(f"Rated {ratedGames} games"))
+
+    def iter_rated_games(self, chunkSize: int) -> Iterator[RatedGame]:
+        """Streams the rateable games, skipping games of deleted players and of inactive time controls"""
+        games = (
+            Game.objects.filter(player_white__isnull=False, player_black__isnull=False)
+            .order_by("date", "game_id")
+            .values_list("player_white_id", "player_black_id", "time_control", "winner_color")
+            .iterator(chunk_size=chunkSize)
+        )
+
+        for whiteId, blackId, timeControl, winnerColor in games:
+            gameMode = get_game_mode_by_time_control(timeControl)
+            if gameMode is None:
+                continue
+
+            yield {"white_id": whiteId, "black_id": blackId, "game_mode": gameMode.name, "winner": winnerColor}
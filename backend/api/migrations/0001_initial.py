@@ -0,0 +1,139 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("users", "__first__"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Player",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "anonymousUser",
+                    models.ForeignKey(
+                        null=True, on_delete=django.db.models.deletion.CASCADE, to="users.anonymoussessionuser"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Game",
+            fields=[
+                ("game_id", models.AutoField(primary_key=True, serialize=False)),
+                (
+                    "termination",
+                    models.IntegerField(
+                        choices=[
+                            (0, "CHECKMATE"),
+                            (1, "STALEMATE"),
+                            (2, "INSUFFICIENT_MATERIAL"),
+                            (3, "FIFTY_MOVES"),
+                            (4, "THREEFOLD_REPETITION"),
+                            (5, "TIMEOUT"),
+                            (6, "RESIGNATION"),
+                            (7, "AGREEMENT"),
+                        ]
+                    ),
+                ),
+                ("winner_color", models.BooleanField(null=True)),
+                ("time_control", models.PositiveBigIntegerField()),
+                ("date", models.DateTimeField(auto_now_add=True)),
+                (
+                    "player_black",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="player_black",
+                        to="api.player",
+                    ),
+                ),
+                (
+                    "player_white",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="player_white",
+                        to="api.player",
+                    ),
+                ),
+            ],
+            options={
+                "get_latest_by": ["date"],
+            },
+        ),
+        migrations.CreateModel(
+            name="FriendRequest",
+            fields=[
+                ("friend_request_id", models.AutoField(primary_key=True, serialize=False)),
+                ("date", models.DateTimeField(auto_now_add=True)),
+                (
+                    "fromUser",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="fromUser",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "toUser",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="toUser", to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("fromUser", "toUser")},
+            },
+        ),
+        migrations.CreateModel(
+            name="Friendship",
+            fields=[
+                ("friend_id", models.AutoField(primary_key=True, serialize=False)),
+                (
+                    "user1",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="user1", to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+                (
+                    "user2",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="user2", to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("user1", "user2")},
+            },
+        ),
+        migrations.CreateModel(
+            name="Move",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("order", models.PositiveIntegerField()),
+                ("move", models.CharField(max_length=5)),
+                ("game", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to="api.game")),
+            ],
+            options={
+                "get_latest_by": ("game", "order"),
+                "unique_together": {("game", "order")},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_rating"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="encoded_moves",
+            field=models.BinaryField(null=True),
+        ),
+    ]
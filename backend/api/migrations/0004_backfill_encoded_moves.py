@@ -0,0 +1,51 @@
+from itertools import groupby
+from typing import Any
+
+from api.play.move_encoding import encode_moves
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 1000
+
+
+def backfill_encoded_moves(apps: Any, schema_editor: Any) -> None:
+    """
+    Encodes the moves of the existing games, which are kept as `Move` rows until `backfill_encoded_moves --delete-moves`.
+    - The games are encoded in chunks of ascending game IDs, one transaction per chunk, so an interrupted migration
+      continues with the games that are not encoded yet
+    """
+    Game = apps.get_model("api", "Game")
+    Move = apps.get_model("api", "Move")
+
+    lastGameId = 0
+    while True:
+        gameIds = list(
+            Game.objects.filter(encoded_moves__isnull=True, game_id__gt=lastGameId)
+            .order_by("game_id")
+            .values_list("game_id", flat=True)[:CHUNK_SIZE]
+        )
+        if not gameIds:
+            break
+
+        moves = Move.objects.filter(game_id__in=gameIds).order_by("game_id", "order").values_list("game_id", "move")
+        movesByGame = {
+            gameId: [move for _, move in gameMoves] for gameId, gameMoves in groupby(moves, lambda row: row[0])
+        }
+        with transaction.atomic():
+            Game.objects.bulk_update(
+                [Game(game_id=gameId, encoded_moves=encode_moves(movesByGame.get(gameId, []))) for gameId in gameIds],
+                ["encoded_moves"],
+            )
+        lastGameId = gameIds[-1]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("api", "0003_game_encoded_moves"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_encoded_moves, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_backfill_encoded_moves"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="game",
+            index=models.Index(fields=["player_white", "date", "game_id"], name="game_white_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="game",
+            index=models.Index(fields=["player_black", "date", "game_id"], name="game_black_date_idx"),
+        ),
+    ]
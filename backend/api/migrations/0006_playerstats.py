@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_game_date_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlayerStats",
+            fields=[
+                (
+                    "player",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="api.player",
+                    ),
+                ),
+                ("games", models.PositiveIntegerField(default=0)),
+                ("wins", models.PositiveIntegerField(default=0)),
+                ("losses", models.PositiveIntegerField(default=0)),
+                ("draws", models.PositiveIntegerField(default=0)),
+                ("modes", models.JSONField(default=dict)),
+                ("friends", models.PositiveIntegerField(default=0)),
+                ("friend_requests", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
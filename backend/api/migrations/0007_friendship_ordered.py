@@ -0,0 +1,34 @@
+from typing import Any
+
+from django.db import migrations, models
+from django.db.models import Exists, F, OuterRef
+
+
+def normalize_friendships(apps: Any, schema_editor: Any) -> None:
+    """
+    Stores the friendships saved before the order was enforced with the lower user ID as `user1`.
+    - Friendships saved in both orders are kept once, the reversed row is deleted
+    """
+    Friendship = apps.get_model("api", "Friendship")
+
+    reversedFriendships = Friendship.objects.filter(user1_id__gt=F("user2_id"))
+    ordered = Friendship.objects.filter(user1_id=OuterRef("user2_id"), user2_id=OuterRef("user1_id"))
+    reversedFriendships.filter(Exists(ordered)).delete()
+    reversedFriendships.update(user1_id=F("user2_id"), user2_id=F("user1_id"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_playerstats"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_friendships, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="friendship",
+            constraint=models.CheckConstraint(
+                check=models.Q(user1__lt=models.F("user2")), name="friendship_ordered"
+            ),  # type: ignore[call-arg]
+        ),
+    ]
@@ -0,0 +1,104 @@
+from typing import Any
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_players(apps: Any, keptId: int, duplicateIds: list[int]) -> None:
+    """
+    Moves the games and ratings of the duplicate players to the kept player and deletes the duplicates.
+    - A rating of a game mode the kept player already has is dropped
+    - The statistics of the players are deleted, they are rebuilt from the merged games once they are needed
+    """
+    Game = apps.get_model("api", "Game")
+    Rating = apps.get_model("api", "Rating")
+    PlayerStats = apps.get_model("api", "PlayerStats")
+    Player = apps.get_model("api", "Player")
+
+    Game.objects.filter(player_white_id__in=duplicateIds).update(player_white_id=keptId)
+    Game.objects.filter(player_black_id__in=duplicateIds).update(player_black_id=keptId)
+
+    gameModes = set(Rating.objects.filter(player_id=keptId).values_list("game_mode", flat=True))
+    for rating in Rating.objects.filter(player_id__in=duplicateIds).order_by("-games"):
+        if rating.game_mode in gameModes:
+            rating.delete()
+        else:
+            gameModes.add(rating.game_mode)
+            rating.player_id = keptId
+            rating.save(update_fields=["player"])
+
+    PlayerStats.objects.filter(player_id__in=[keptId, *duplicateIds]).delete()
+    Player.objects.filter(pk__in=duplicateIds).delete()
+
+
+def merge_duplicates(apps: Any, schema_editor: Any) -> None:
+    """
+    Keeps a single anonymous user per session key and a single player per user, the one created first.
+    - Databases created before the unique constraints could get duplicates from concurrent connects
+    """
+    AnonymousSessionUser = apps.get_model("users", "AnonymousSessionUser")
+    Player = apps.get_model("api", "Player")
+
+    duplicateSessions = (
+        AnonymousSessionUser.objects.values("session_key")
+        .annotate(count=Count("id"), keptId=Min("id"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for row in duplicateSessions:
+        duplicates = AnonymousSessionUser.objects.filter(session_key=row["session_key"]).exclude(id=row["keptId"])
+        Player.objects.filter(anonymousUser__in=duplicates).update(anonymousUser_id=row["keptId"])
+        duplicates.delete()
+
+    for userField in ("user_id", "anonymousUser_id"):
+        duplicatePlayers = (
+            Player.objects.filter(**{f"{userField}__isnull": False})
+            .values(userField)
+            .annotate(count=Count("id"), keptId=Min("id"))
+            .filter(count__gt=1)
+            .order_by()
+        )
+        for row in duplicatePlayers:
+            duplicateIds = Player.objects.filter(**{userField: row[userField]}).exclude(id=row["keptId"])
+            merge_players(apps, row["keptId"], list(duplicateIds.values_list("id", flat=True)))
+
+
+def add_session_key_unique(apps: Any, schema_editor: Any) -> None:
+    """
+    Makes the session keys of the anonymous users unique.
+    - The users app has no migrations, its tables are created by `migrate --run-syncdb` and are never altered by it.
+      A database created before the session keys were unique gets the unique constraint here
+    """
+    AnonymousSessionUser = apps.get_model("users", "AnonymousSessionUser")
+    table = AnonymousSessionUser._meta.db_table
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table).values()
+    if any(constraint["unique"] and constraint["columns"] == ["session_key"] for constraint in constraints):
+        return
+
+    uniqueField = AnonymousSessionUser._meta.get_field("session_key")
+    field = models.CharField(max_length=255)
+    field.set_attributes_from_name("session_key")
+    field.model = AnonymousSessionUser
+    schema_editor.alter_field(AnonymousSessionUser, field, uniqueField)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_friendship_ordered"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.RunPython(add_session_key_unique, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="player",
+            constraint=models.UniqueConstraint(fields=("user",), name="player_unique_user"),
+        ),
+        migrations.AddConstraint(
+            model_name="player",
+            constraint=models.UniqueConstraint(fields=("anonymousUser",), name="player_unique_anonymous_user"),
+        ),
+    ]
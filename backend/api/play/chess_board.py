@@ -2,20 +2,67 @@ from __future__ import annotations
 
 import enum
 import typing
+from collections import Counter
 from typing import Literal
 
 import chess
 
+PositionKey = tuple[int, int, int, int, int, int, int, int, bool, int, int | None]
+
+
+def get_position_key(board: chess.Board) -> PositionKey:
+    """Returns the key under which the repetitions of the position are counted, as in `chess.Board`'s own detection"""
+    return (
+        board.pawns,
+        board.knights,
+        board.bishops,
+        board.rooks,
+        board.queens,
+        board.kings,
+        board.occupied_co[chess.WHITE],
+        board.occupied_co[chess.BLACK],
+        board.turn,
+        board.clean_castling_rights(),
+        board.ep_square if board.has_legal_en_passant() else None,
+    )
+
 
 class ChessBoard:
+    """
+    Chess board of a game, detecting the end of the game in constant time per move however long the game gets.
+    - The legal moves of a position are generated at most once, and only when a check needs all of them
+    - The positions since the last irreversible move are counted as they are reached, instead of replaying the moves
+    """
+
     def __init__(self) -> None:
         self.board = chess.Board()
         self.color_to_move: chess.Color = chess.WHITE
+        self._legal_moves: set[chess.Move] | None = None
+        self.repetitions: Counter[PositionKey] = Counter([get_position_key(self.board)])
+        self.repeated_positions: set[PositionKey] = set()
+        """Positions reached at least twice, a move into one of them can be claimed as a threefold repetition"""
 
     @property
     def moves(self) -> list[chess.Move]:
         return self.board.move_stack
 
+    @property
+    def legal_moves(self) -> set[chess.Move]:
+        """Legal moves of the current position, cached until the next move"""
+        if self._legal_moves is None:
+            self._legal_moves = set(self.board.generate_legal_moves())
+        return self._legal_moves
+
+    def is_legal(self, move: chess.Move) -> bool:
+        if self._legal_moves is not None and move in self._legal_moves:
+            return True
+        return self.board.is_legal(move)
+
+    def has_legal_moves(self) -> bool:
+        if self._legal_moves is not None:
+            return bool(self._legal_moves)
+        return any(self.board.generate_legal_moves())
+
     def switch_color_to_move(self) -> None:
         self.color_to_move = chess.WHITE if self.color_to_move == chess.BLACK else chess.BLACK
 
@@ -34,13 +81,64 @@ class ChessBoard:
         if isinstance(move, str):
             move = chess.Move.from_uci(move)
 
-        if not self.board.is_legal(move):
+        if not self.is_legal(move):
             return ChessBoard.ILLEGAL_MOVE
 
+        if self.board.is_irreversible(move):
+            self.repetitions.clear()
+            self.repeated_positions.clear()
+
         self.board.push(move)
         self.switch_color_to_move()
-
-        return typing.cast(CustomOutcome, self.board.outcome(claim_draw=True))
+        self._legal_moves = None
+
+        positionKey = get_position_key(self.board)
+        self.repetitions[positionKey] += 1
+        if self.repetitions[positionKey] >= 2:
+            self.repeated_positions.add(positionKey)
+
+        return typing.cast(CustomOutcome, self.outcome(positionKey))
+
+    def outcome(self, positionKey: PositionKey) -> chess.Outcome | None:
+        """Same as `chess.Board.outcome(claim_draw=True)` of a standard game, in the order of its checks"""
+        hasLegalMoves = self.has_legal_moves()
+        if not hasLegalMoves and self.board.is_check():
+            return chess.Outcome(chess.Termination.CHECKMATE, not self.board.turn)
+        if self.board.is_insufficient_material():
+            return chess.Outcome(chess.Termination.INSUFFICIENT_MATERIAL, None)
+        if not hasLegalMoves:
+            return chess.Outcome(chess.Termination.STALEMATE, None)
+
+        # The seventy-five move rule and fivefold repetition can't be reached, the claimable draws always come first
+        if self.board.halfmove_clock >= 99 and self.board.can_claim_fifty_moves():
+            return chess.Outcome(chess.Termination.FIFTY_MOVES, None)
+        if self.can_claim_threefold_repetition(positionKey):
+            return chess.Outcome(chess.Termination.THREEFOLD_REPETITION, None)
+
+        return None
+
+    def can_claim_threefold_repetition(self, positionKey: PositionKey) -> bool:
+        """The position is repeated for the third time, or a legal move repeats a position for the third time"""
+        if self.repetitions[positionKey] >= 3:
+            return True
+        if not self.repeated_positions:
+            return False
+
+        # Only reversible moves can lead back to a counted position, they change the occupied squares they move between
+        occupied = self.board.occupied
+        movedSquares = {(key[6] | key[7]) ^ occupied for key in self.repeated_positions if key[8] != self.board.turn}
+        for move in self.legal_moves:
+            if chess.BB_SQUARES[move.from_square] | chess.BB_SQUARES[move.to_square] not in movedSquares:
+                continue
+
+            self.board.push(move)
+            try:
+                if get_position_key(self.board) in self.repeated_positions:
+                    return True
+            finally:
+                self.board.pop()
+
+        return False
 
     ILLEGAL_MOVE_TYPE = Literal["ILLEGAL_MOVE"]
     ILLEGAL_MOVE: ChessBoard.ILLEGAL_MOVE_TYPE = "ILLEGAL_MOVE"
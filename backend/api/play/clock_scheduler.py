@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, TypedDict
+
+logger = logging.getLogger(__name__)
+
+TimeS = float
+DeadlineCallback = Callable[[], None]
+
+
+class ClockSchedulerStats(TypedDict):
+    pending: int
+    """Deadlines that are scheduled and neither fired nor cancelled yet"""
+    scheduled: int
+    fired: int
+    cancelled: int
+    next_deadline_in: TimeS | None
+    """Seconds until the earliest pending deadline, `None` if nothing is pending"""
+
+
+class ScheduledDeadline:
+    """Handle to a deadline registered in a `ClockScheduler`. Can be used to cancel or reschedule the deadline."""
+
+    __slots__ = ("scheduler", "deadline", "callback", "cancelled", "fired")
+
+    def __init__(self, scheduler: ClockScheduler, deadline: TimeS, callback: DeadlineCallback):
+        self.scheduler = scheduler
+        self.deadline = deadline
+        self.callback = callback
+
+        self.cancelled = False
+        self.fired = False
+
+    @property
+    def active(self) -> bool:
+        return not self.cancelled and not self.fired
+
+    def cancel(self) -> None:
+        """Cancels the deadline. Does nothing if the deadline already fired or was cancelled."""
+        self.scheduler.cancel(self)
+
+
+class ClockScheduler:
+    """
+    Single deadline queue for all game clocks and abort timers.
+    - Deadlines are kept in a binary heap, so scheduling is O(log n)
+    - Cancelling is O(1), cancelled entries are removed lazily and the heap is compacted
+      once they make up more than half of it, which keeps rescheduling amortized O(log n)
+    - All deadlines are fired from one daemon thread, instead of one `threading.Timer` thread per clock
+    """
+
+    COMPACT_MIN_SIZE = 64
+
+    def __init__(self, time_source: Callable[[], TimeS] = time.monotonic, autostart: bool = True) -> None:
+        self.time_source = time_source
+        self.autostart = autostart
+
+        self._heap: list[tuple[TimeS, int, ScheduledDeadline]] = []
+        self._sequence = itertools.count()
+        self._cancelled_in_heap = 0
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+        self._scheduled_count = 0
+        self._fired_count = 0
+        self._cancelled_count = 0
+
+    def schedule(self, delay: TimeS, callback: DeadlineCallback) -> ScheduledDeadline:
+        """Schedules the callback to be called after `delay` seconds"""
+        with self._condition:
+            deadline = ScheduledDeadline(self, self.time_source() + max(delay, 0), callback)
+            heapq.heappush(self._heap, (deadline.deadline, next(self._sequence), deadline))
+            self._scheduled_count += 1
+
+            # Wake the worker up only if the new deadline is the earliest one
+            if self._heap[0][2] is deadline:
+                self._condition.notify()
+
+        if self.autostart:
+            self._ensure_thread()
+        return deadline
+
+    def cancel(self, deadline: ScheduledDeadline) -> None:
+        """Cancels the given deadline. Does nothing if the deadline already fired or was cancelled."""
+        with self._condition:
+            if not deadline.active:
+                return
+
+            deadline.cancelled = True
+            self._cancelled_in_heap += 1
+            self._cancelled_count += 1
+            self._maybe_compact()
+
+    def reschedule(self, deadline: ScheduledDeadline, delay: TimeS) -> ScheduledDeadline:
+        """Cancels the given deadline and schedules its callback again after `delay` seconds"""
+        self.cancel(deadline)
+        return self.schedule(delay, deadline.callback)
+
+    def run_pending(self) -> int:
+        """Fires all deadlines that are due in the calling thread. Returns the number of fired deadlines."""
+        fired = 0
+        while True:
+            with self._condition:
+                deadline = self._pop_due()
+            if deadline is None:
+                return fired
+
+            self._fire(deadline)
+            fired += 1
+
+    def stats(self) -> ClockSchedulerStats:
+        with self._condition:
+            self._drop_cancelled_head()
+            nextDeadlineIn = self._heap[0][0] - self.time_source() if self._heap else None
+
+            return {
+                "pending": len(self._heap) - self._cancelled_in_heap,
+                "scheduled": self._scheduled_count,
+                "fired": self._fired_count,
+                "cancelled": self._cancelled_count,
+                "next_deadline_in": nextDeadlineIn,
+            }
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="clock-scheduler", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                deadline = self._pop_due()
+                while deadline is None:
+                    self._condition.wait(self._time_until_next_deadline())
+                    deadline = self._pop_due()
+
+            self._fire(deadline)
+
+    def _fire(self, deadline: ScheduledDeadline) -> None:
+        try:
+            deadline.callback()
+        except Exception:
+            logger.exception("Clock scheduler callback failed")
+
+    def _pop_due(self) -> ScheduledDeadline | None:
+        """Pops the earliest deadline if it is due, the caller must hold the lock"""
+        self._drop_cancelled_head()
+        if not self._heap or self._heap[0][0] > self.time_source():
+            return None
+
+        _, _, deadline = heapq.heappop(self._heap)
+        deadline.fired = True
+        self._fired_count += 1
+        return deadline
+
+    def _time_until_next_deadline(self) -> TimeS | None:
+        self._drop_cancelled_head()
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - self.time_source(), 0)
+
+    def _drop_cancelled_head(self) -> None:
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled_in_heap -= 1
+
+    def _maybe_compact(self) -> None:
+        heapSize = len(self._heap)
+        if heapSize < self.COMPACT_MIN_SIZE or self._cancelled_in_heap * 2 <= heapSize:
+            return
+
+        self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+        heapq.heapify(self._heap)
+        self._cancelled_in_heap = 0
+
+
+CLOCK_SCHEDULER = ClockScheduler()
+"""Scheduler that owns all flag-fall and abort deadlines of the running games"""
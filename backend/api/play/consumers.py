@@ -1,151 +1,402 @@
-import json
+import asyncio
+import logging
 import re
-from typing import Any
+import time
+from typing import Any, Awaitable, Callable
 
+import chess
 from api.play.models import Player
-from channels.generic.websocket import WebsocketConsumer  # type: ignore
+from channels.generic.websocket import AsyncWebsocketConsumer  # type: ignore
 
 from ..consumers import error
+from ..serialization import dumps, loads
+from ..utils import in_db_thread
 from . import serializers as s
 from .chess_board import ChessBoard, CustomOutcome, CustomTermination, get_opposite_color
-from .game import ALL_ACTIVE_GAMES_MANAGER, Game, GameStatus
-from .game_queue import GROUP_QUEUE_MANAGER, GameQueueManager, Group
-from .utils import handleGetAnonymousSessionUser
+from .events import GAME_EVENTS, GameEvent, game_group_name
+from .game import ALL_ACTIVE_GAMES_MANAGER, Game, GameManager, GameStatus
+from .game_queue import GROUP_QUEUE_MANAGER
+from .identity import aget_scope_player, has_identity
+from .latency import RttEstimator, TimeS
+from .messages import (
+    GAME_FOUND_MESSAGE,
+    GAME_RESULT_MESSAGE,
+    GAME_STARTED_MESSAGE,
+    MOVE_MESSAGE,
+    OFFER_DRAW_MESSAGE,
+    PING_MESSAGE,
+    PREMOVE_CANCELLED_MESSAGE,
+    RESUME_MESSAGE,
+)
+from .ratings import get_rating
+from .relay import ForwardedConnection, WorkerRelay
+from .spectators import SPECTATORS, Spectator
+
+logger = logging.getLogger(__name__)
+
+PendingHandler = tuple[Callable[..., Awaitable[None]], tuple[Any, ...]]
+
+
+def validate_game_id(json_data: Any) -> str | None:
+    """Returns the error message if the game ID of the request is invalid"""
+    if "game_id" not in json_data:
+        return "Game ID is missing"
+
+    game_id = json_data["game_id"]
+    if not isinstance(game_id, str):
+        return "Game ID must be a string"
+    if not len(game_id) == 8:
+        return "Invalid game ID length, must be 8 characters long"
+    if re.search(r"[^a-zA-Z0-9]", game_id):
+        return "Invalid game ID, must only contain alphanumeric characters"
+
+    return None
+
+
+def get_relayed_player(player_id: int) -> Player:
+    return Player.objects.select_related("user", "anonymousUser").get(pk=player_id)
+
+
+class PlayerWebsocketConsumer(AsyncWebsocketConsumer):  # type: ignore
+    """
+    Base consumer for websockets of a player.
+    - Synchronous callbacks into the consumer, which may come from any thread, are handed over with `call_soon`
+      and processed in order on the event loop.
+    - A websocket that belongs to another worker, e.g. to the owner of the game, is forwarded to the relay of that
+      worker. The relay serves it with the consumer named `RELAYED_AS`, which gets the player in `relayed_player_id`
+      of its scope. Relayed websockets are never forwarded again
+    """
+
+    RELAYED_AS: str
+    GAME_MOVED_CLOSE_CODE = WorkerRelay.GONE_CLOSE_CODE
+    """The game or the queue moved to another worker, the player reconnects to continue there"""
 
-
-class PlayerWebsocketConsumer(WebsocketConsumer):  # type: ignore
     player: Player
+    forwarded: ForwardedConnection | None = None
+
+    def __init__(self, manager: GameManager = ALL_ACTIVE_GAMES_MANAGER, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.manager = manager
+
+    @property
+    def is_relayed(self) -> bool:
+        return "relayed_player_id" in self.scope
+
+    async def connect(self) -> None:
+        if self.is_relayed:
+            # The player was identified by the worker the websocket is connected to
+            self.player = await in_db_thread(get_relayed_player, self.scope["relayed_player_id"])
+        elif not has_identity(self.scope["user"], self.scope["session"]):
+            # The session is created over HTTP, once the visitor needs an identity to play
+            await self.accept()
+            return await error(self, message="Session is missing", code=4001)  # 401 Unauthorized
+        else:
+            self.player = await aget_scope_player(self.scope)
+
+        self.loop = asyncio.get_running_loop()
+        GAME_EVENTS.bind_loop(self.loop)
+        self.pending: asyncio.Queue[PendingHandler] = asyncio.Queue()
+        self.pending_task = self.loop.create_task(self.process_pending())
+
+        await self.accept()
 
-    def connect(self) -> None:
-        isLoggedIn = self.scope["user"].is_authenticated
-        user = self.scope["user"] if isLoggedIn else handleGetAnonymousSessionUser(self.scope["session"])
+    def call_soon(self, handler: Callable[..., Awaitable[None]], *args: Any) -> None:
+        """Schedules the handler to be awaited on the consumer's event loop. Safe to call from any thread."""
+        self.loop.call_soon_threadsafe(self.pending.put_nowait, (handler, args))
 
-        self.player = Player.getOrCreatePlayerByUser(user)
+    async def process_pending(self) -> None:
+        while True:
+            handler, args = await self.pending.get()
+            try:
+                await handler(*args)
+            except Exception:
+                logger.exception("Failed to process a game callback")
 
-        self.accept()
+    async def forward_to(self, worker_id: str, is_served: Callable[[], Awaitable[bool]], frame: str | None) -> None:
+        """Forwards the websocket to the worker, starting with the frame"""
+        self.forwarded = ForwardedConnection(self, worker_id, is_served)
+        scope = {"type": "websocket", "path": self.scope["path"], "relayed_player_id": self.player.pk}
+        await self.forwarded.open(self.RELAYED_AS, scope, frame)
+
+    async def relay_send(self, message: dict[str, Any]) -> None:
+        """Handles the frames of the consumer serving the forwarded websocket"""
+        await self.send(text_data=message["text"])
+
+    async def relay_close(self, message: dict[str, Any]) -> None:
+        await self.close(code=message["code"])
+
+    async def disconnect(self, code: int | None = None) -> None:
+        if hasattr(self, "pending_task"):
+            self.pending_task.cancel()
+        if self.forwarded is not None:
+            await self.forwarded.close(code or 1000)
 
 
 class QueueConsumer(PlayerWebsocketConsumer):
-    def receive(self, text_data: Any) -> None:
-        json_data = json.loads(text_data)
+    """
+    Consumer of a player's queue websocket.
+    - Websockets are forwarded to the matchmaker worker, so that the queuing players of all workers meet
+    """
+
+    RELAYED_AS = "queue"
+
+    async def connect(self) -> None:
+        await super().connect()
+        if not hasattr(self, "player") or self.is_relayed:
+            return
+
+        matchmaker = await in_db_thread(self.manager.get_matchmaker)
+        if matchmaker is None or matchmaker == self.manager.worker_id:
+            return
+
+        async def is_served() -> bool:
+            now = time.time()
+            return await in_db_thread(self.manager.store.role_owner, self.manager.MATCHMAKER_ROLE, now) == matchmaker
+
+        await self.forward_to(matchmaker, is_served, None)
+
+    async def receive(self, text_data: Any) -> None:
+        if self.forwarded is not None:
+            return await self.forwarded.forward(text_data)
+
+        json_data = loads(text_data)
         if "type" not in json_data:
-            return error(self, message="Request type is missing")
+            return await error(self, message="Request type is missing")
 
         if json_data["type"] == "enqueue":
-            self.enqueue(json_data)
+            await self.enqueue(json_data)
         elif json_data["type"] == "stop_queuing":
             self.stop_queuing()
         else:
-            error(self, message="Invalid request type")
-
-    def get_queue_manager(self, group: Group | None) -> GameQueueManager | None:
-        queue_manager = GROUP_QUEUE_MANAGER.get_create_queue_manager(group)
+            await error(self, message="Invalid request type")
 
-        if not queue_manager:
-            error(self, message="Invalid group")
-        return queue_manager
-
-    def enqueue(self, json_data: Any) -> None:
+    async def enqueue(self, json_data: Any) -> None:
         serializer = s.EnqueueSerializer(data=json_data)
         if not serializer.is_valid():
-            return error(self, message=serializer.errors)
+            return await error(self, message=serializer.errors)
 
         group = tuple(serializer.validated_data["group"]) if serializer.validated_data.get("group") else None
-        queue_manager = self.get_queue_manager(group)
-        if not queue_manager:
-            return
-
-        if queue_manager.is_player_queuing(self.player):
-            return error(self, message="Player is already in queue")
-
         game_mode = serializer.validated_data["game_mode"]
         time_control = serializer.validated_data["time_control"]
-        gameQueue = queue_manager.get_game_queue(game_mode, time_control)
-        if not gameQueue:
-            return error(self, message="Invalid game mode or time control")
+        # All the groups queue the same game modes, the group is only looked up once the rating is fetched
+        gameQueue = GROUP_QUEUE_MANAGER.default.get_game_queue(game_mode, time_control)
+        if gameQueue is None:
+            return await error(self, message="Invalid game mode or time control")
+
+        rating = await in_db_thread(get_rating, self.player, gameQueue.game_mode.name)
+        if GROUP_QUEUE_MANAGER.is_player_queuing(self.player):
+            return await error(self, message="Player is already in queue")
 
-        queue_manager.add_player(self.player, gameQueue, self.game_found)
+        GROUP_QUEUE_MANAGER.add_player(group, self.player, game_mode, time_control, self.game_found, rating)
 
     def stop_queuing(self) -> None:
         GROUP_QUEUE_MANAGER.remove_player(self.player)
 
     def game_found(self, game: Game) -> None:
-        self.send(json.dumps({"type": "game_found", "game_id": game.game_id}))
+        self.call_soon(self.send, GAME_FOUND_MESSAGE.encode(game_id=game.game_id))
 
-    def disconnect(self, code: int) -> None:
-        GROUP_QUEUE_MANAGER.remove_player(self.player)
-        self.close(code=code)
+    async def disconnect(self, code: int | None = None) -> None:
+        await super().disconnect(code)
+        if hasattr(self, "player") and self.forwarded is None:
+            GROUP_QUEUE_MANAGER.remove_player(self.player)
 
 
 class GameConsumer(PlayerWebsocketConsumer):
+    """
+    Consumer of a player's game websocket.
+    - Once joined, the connection is pinged every `PING_INTERVAL` seconds, the measured round-trip time of the
+      player is used to compensate the network delay of their moves on the clock
+    - Every message of a game event carries its sequence number, a player reconnecting with `resume` is sent only
+      the events after the last one they received
+    - Game commands are only handled while this worker owns the game, otherwise the connection is closed with
+      `GAME_MOVED_CLOSE_CODE` and the player resumes the game on its new owner
+    - The websocket of a game owned by another worker is forwarded to the owner with the joining frame
+    """
+
+    RELAYED_AS = "game"
+    PING_INTERVAL: TimeS = 2
+    GAME_COMMANDS = {"move", "premove", "cancel_premove", "resign", "offer_draw"}
+
     game: Game
+    last_seq: int
+    """Sequence number of the last game event the player received or doesn't need"""
 
-    def receive(self, text_data: str) -> None:
-        json_data = json.loads(text_data)
+    async def receive(self, text_data: str) -> None:
+        if self.forwarded is not None:
+            return await self.forwarded.forward(text_data)
+
+        json_data = loads(text_data)
         if "type" not in json_data:
-            return error(self, message="Request type is missing")
+            return await error(self, message="Request type is missing")
 
         type = json_data["type"]
         if type == "join":
-            self.join(json_data)
+            await self.join(json_data)
+        elif type == "resume":
+            await self.resume(json_data)
+        elif type in self.GAME_COMMANDS and not await self.check_game_owned():
+            return
         elif type == "move":
-            self.move(json_data)
+            await self.move(json_data)
+        elif type == "premove":
+            await self.premove(json_data)
+        elif type == "cancel_premove":
+            self.game.cancel_premove(self.player)
         elif type == "resign":
             self.resign()
         elif type == "offer_draw":
             self.offer_draw()
+        elif type == "pong":
+            self.pong(json_data)
         else:
-            error(self, message="Invalid request type")
+            await error(self, message="Invalid request type")
+
+    async def join(self, json_data: Any) -> None:
+        if await self.enter_game(json_data):
+            await self.send_game_state()
+
+    async def resume(self, json_data: Any) -> None:
+        """
+        Rejoins the game after a reconnect, only the events after the last one the player received are replayed.
+        - Falls back to the full game state of a join if the events are no longer kept
+        """
+        lastSeq = json_data.get("last_seq")
+        if not isinstance(lastSeq, int):
+            return await error(self, message="Last sequence number must be an integer")
+        if not await self.enter_game(json_data):
+            return
+
+        events = self.game.events.since(lastSeq)
+        if events is None:
+            return await self.send_game_state()
+
+        self.last_seq = lastSeq
+        for event in events:
+            await self.send_event(event, replay=True)
 
-    def join(self, json_data: Any) -> None:
-        if "game_id" not in json_data:
-            return error(self, message="Game ID is missing")
+        await self.send(
+            RESUME_MESSAGE.encode(
+                seq=self.last_seq,
+                white_time=self.game.players.by_color(chess.WHITE).get_current_time(),
+                black_time=self.game.players.by_color(chess.BLACK).get_current_time(),
+            )
+        )
+
+    async def enter_game(self, json_data: Any) -> bool:
+        """Joins the player into the game of the request and subscribes to its events, sends the error otherwise"""
+        gameIdError = validate_game_id(json_data)
+        if gameIdError:
+            await error(self, message=gameIdError)
+            return False
 
         game_id = json_data["game_id"]
-        if not isinstance(game_id, str):
-            return error(self, message="Game ID must be a string")
-        if not len(game_id) == 8:
-            return error(self, message="Invalid game ID length, must be 8 characters long")
-        if re.search(r"[^a-zA-Z0-9]", game_id):
-            return error(self, message="Invalid game ID, must only contain alphanumeric characters")
-
-        maybeGame = ALL_ACTIVE_GAMES_MANAGER.get_game(game_id)
+
+        # Games whose lease is held are served without a thread hop. A stale lease is acquired again and other games may
+        # be taken over, both query the game store
+        maybeGame = self.manager.get_local_game(game_id)
+        if maybeGame is None or not self.manager.holds_lease(maybeGame):
+            maybeGame = await in_db_thread(self.manager.get_game, game_id)
         if maybeGame is None:
-            return error(self, message="There is no active game with the provided Game ID")
+            owner = await in_db_thread(self.manager.store.owner, game_id, time.time())
+            if owner is None or owner == self.manager.worker_id:
+                await error(self, message="There is no active game with the provided Game ID")
+            elif self.is_relayed:
+                await self.close(code=self.GAME_MOVED_CLOSE_CODE)
+            else:
+                await self.forward_to_owner(owner, game_id, dumps(json_data))
+            return False
         self.game = maybeGame
 
         if not self.game.can_player_join(self.player):
-            return error(self, message="Player is not playing in this game")
-        self.game.join_player(self.player, self.callback_game_state)
-
-        self.send(
-            text_data=json.dumps(
+            await error(self, message="Player is not playing in this game")
+            return False
+
+        await self.channel_layer.group_add(game_group_name(self.game.game_id), self.channel_name)
+        # The events published from now on are received, unless the state sent to the player already contains them
+        self.last_seq = self.game.events.last_seq
+        self.game.join_player(self.player)
+        if not hasattr(self, "ping_task"):
+            self.rtt_estimator = RttEstimator()
+            self.ping_task = self.loop.create_task(self.ping_loop())
+        return True
+
+    async def check_game_owned(self) -> bool:
+        """Closes the connection if the game is no longer owned by this worker, e.g. after the worker was paused"""
+        manager = self.game.manager
+        if manager.holds_lease(self.game) or await in_db_thread(manager.owns, self.game):
+            return True
+
+        await self.close(code=self.GAME_MOVED_CLOSE_CODE)
+        return False
+
+    async def send_game_state(self) -> None:
+        moves = self.game.get_moves_list()
+
+        # Friend statuses of the players are looked up in the database
+        players = await in_db_thread(self.game.players.to_json_dict, self.player)
+        await self.send(
+            text_data=dumps(
                 {
                     "type": "join",
-                    "players": self.game.players.to_json_dict(self.player),
-                    "moves": self.game.get_moves_list(),
+                    "seq": self.last_seq,
+                    "players": players,
+                    "moves": moves,
                     "offer_draw": self.game.players.get_opponent(self.player).offers_draw,
                     "game_started": self.game.status == GameStatus.IN_PROGRESS,
                 }
             )
         )
 
-    def move(self, json_data: Any) -> None:
+    async def forward_to_owner(self, owner: str, game_id: str, frame: str) -> None:
+        """Forwards the websocket to the owner of the game, until another worker takes the game over"""
+
+        async def is_served() -> bool:
+            return await in_db_thread(self.manager.store.owner, game_id, time.time()) == owner
+
+        await self.forward_to(owner, is_served, frame)
+
+    async def move(self, json_data: Any) -> None:
         if "move" not in json_data:
-            return error(self, message="Move is missing")
+            return await error(self, message="Move is missing")
 
         move = json_data["move"]
         if not isinstance(move, str):
-            return error(self, message="Move must be a string")
+            return await error(self, message="Move must be a string")
 
         if not self.game.is_players_turn(self.player):
-            return error(self, message="It is not your turn")
+            return await error(self, message="It is not your turn")
 
         moveResult = self.game.move(self.player, move)
         if moveResult == ChessBoard.ILLEGAL_MOVE:
-            return error(self, message="Illegal move")
+            return await error(self, message="Illegal move")
         if isinstance(moveResult, CustomOutcome):
-            self.send(json.dumps({"type": "outcome", "outcome": moveResult.result()}))
+            await self.send(dumps({"type": "outcome", "outcome": moveResult.result()}))
+
+    async def premove(self, json_data: Any) -> None:
+        move = json_data.get("move")
+        if not isinstance(move, str):
+            return await error(self, message="Move must be a string")
+
+        # The opponent's move may have landed while the premove was on its way, it is then just a move
+        if self.game.is_players_turn(self.player):
+            return await self.move(json_data)
+
+        if not self.game.premove(self.player, move):
+            return await error(self, message="Invalid premove")
+
+    async def ping_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.PING_INTERVAL)
+            await self.send(PING_MESSAGE.encode(ping_id=self.rtt_estimator.ping()))
+
+    def pong(self, json_data: Any) -> None:
+        pingId = json_data.get("ping_id")
+        if not isinstance(pingId, int) or not hasattr(self, "rtt_estimator"):
+            return
+
+        rtt = self.rtt_estimator.pong(pingId)
+        if rtt is not None:
+            self.game.players.by_player(self.player).rtt = rtt
 
     def resign(self) -> None:
         playerColor = self.game.players.by_player(self.player).color
@@ -155,18 +406,92 @@ class GameConsumer(PlayerWebsocketConsumer):
     def offer_draw(self) -> None:
         self.game.offer_draw(self.player)
 
-    def callback_game_state(self, type: str, changed: Any = None) -> None:
-        assert type in ["game_started", "move", "game_result", "out_of_time", "offer_draw"], "Invalid type"
+    async def game_event(self, message: dict[str, Any]) -> None:
+        """Handles the events published into the game's channel layer group"""
+        await self.send_event(message["event"])
+
+    async def send_event(self, event: GameEvent, replay: bool = False) -> None:
+        """
+        Sends the event to the player, unless it was sent already.
+        - Replayed moves include the player's own, the player may not know whether they reached the server
+        """
+        if event["seq"] <= self.last_seq:
+            return
+        self.last_seq = event["seq"]
+        isOwnEvent = event.get("player_id") == self.player.pk
+
+        if event["type"] == "game_started":
+            players = await in_db_thread(self.game.players.to_json_dict, self.player)
+            await self.send(GAME_STARTED_MESSAGE.encode(seq=event["seq"], players=players))
+        elif event["type"] == "move" and (not isOwnEvent or event.get("premove") or replay):
+            # Own premoves are sent back too, the player learns from them that the premove was played
+            await self.send(
+                MOVE_MESSAGE.encode(
+                    seq=event["seq"],
+                    move=event["move"],
+                    ply=event["ply"],
+                    white_time=event["white_time"],
+                    black_time=event["black_time"],
+                )
+            )
+        elif event["type"] == "game_result":
+            await self.send(
+                GAME_RESULT_MESSAGE.encode(seq=event["seq"], termination=event["termination"], winner=event["winner"])
+            )
+            await self.close()
+        elif event["type"] == "offer_draw" and not isOwnEvent:
+            await self.send(OFFER_DRAW_MESSAGE.encode(seq=event["seq"]))
+        elif event["type"] == "premove_cancelled" and isOwnEvent:
+            await self.send(PREMOVE_CANCELLED_MESSAGE.encode(seq=event["seq"]))
+
+    async def disconnect(self, code: int | None = None) -> None:
+        await super().disconnect(code)
+        if hasattr(self, "ping_task"):
+            self.ping_task.cancel()
+        if hasattr(self, "game"):
+            await self.channel_layer.group_discard(game_group_name(self.game.game_id), self.channel_name)
+
+
+class SpectatorConsumer(AsyncWebsocketConsumer):  # type: ignore
+    """
+    Consumer of a spectator's websocket, anyone can watch any running game.
+    - The spectator receives the snapshot of the game once, then the moves and the result as they are played
+    """
+
+    game_id: str
+    spectator: Spectator
+
+    async def receive(self, text_data: str) -> None:
+        json_data = loads(text_data)
+        if "type" not in json_data:
+            return await error(self, message="Request type is missing")
+
+        if json_data["type"] == "spectate":
+            await self.spectate(json_data)
+        else:
+            await error(self, message="Invalid request type")
+
+    async def spectate(self, json_data: Any) -> None:
+        if hasattr(self, "spectator"):
+            return await error(self, message="Already spectating a game")
+
+        gameIdError = validate_game_id(json_data)
+        if gameIdError:
+            return await error(self, message=gameIdError)
+
+        self.game_id = json_data["game_id"]
+        self.spectator = Spectator(self)
+        if not await SPECTATORS.add_spectator(self.game_id, self.spectator):
+            del self.spectator
+            return await error(self, message="There is no active game with the provided Game ID")
+
+    async def disconnect(self, code: int | None = None) -> None:
+        if hasattr(self, "spectator"):
+            await SPECTATORS.remove_spectator(self.game_id, self.spectator)
 
-        if type == "game_started":
-            self.send(json.dumps({"type": "game_started", "players": self.game.players.to_json_dict(self.player)}))
-        elif type == "move":
-            self.send(json.dumps({"type": "move", "move": changed, "players": self.game.players.to_json_dict()}))
-        elif type == "game_result":
-            self.send(json.dumps({"type": "game_result", "termination": changed[0], "winner": changed[1]}))
-            self.disconnect()
-        elif type == "offer_draw":
-            self.send(json.dumps({"type": "offer_draw"}))
 
-    def disconnect(self, code: int | None = None) -> None:
-        self.close(code=code)
+def start_relay(manager: GameManager) -> None:
+    """Serves the websockets relayed to the worker of the manager on the running event loop"""
+    manager.relay.start(
+        {consumer.RELAYED_AS: consumer.as_asgi(manager=manager) for consumer in (GameConsumer, QueueConsumer)}
+    )
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections import deque
+from typing import Literal, NotRequired, TypedDict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer  # type: ignore
+
+GameEventType = Literal["game_started", "move", "offer_draw", "game_result", "premove_cancelled"]
+
+
+class GameEvent(TypedDict):
+    type: GameEventType
+    seq: NotRequired[int]
+    """Sequence number of the event within its game, assigned once it is published"""
+    player_id: NotRequired[int]
+    """Primary key of the player that caused the event (the mover, or the player offering a draw)"""
+    move: NotRequired[str]
+    premove: NotRequired[bool]
+    """The move was queued by the mover in advance and played by the server as soon as it was their turn"""
+    ply: NotRequired[int]
+    """Number of moves played in the game, including the move"""
+    white_time: NotRequired[int]
+    """Milliseconds left on the clocks of the players once the move was played"""
+    black_time: NotRequired[int]
+    termination: NotRequired[str]
+    winner: NotRequired[str]
+
+
+class GameEventLog:
+    """
+    Sequence numbers of the events of a game, with the most recent events kept for the players to resume from.
+    - The sequence numbers increase by one with every event, starting from 1
+    - Only the last `SIZE` events are kept, a player missing older ones has to rejoin the game
+    """
+
+    SIZE = 256
+
+    def __init__(self, last_seq: int = 0) -> None:
+        self.last_seq = last_seq
+        self.events: deque[GameEvent] = deque(maxlen=self.SIZE)
+        self.lock = threading.Lock()
+
+    def append(self, event: GameEvent) -> GameEvent:
+        """Numbers the event and keeps it. The caller should hold `lock` until the event is published"""
+        self.last_seq += 1
+        event["seq"] = self.last_seq
+        self.events.append(event)
+        return event
+
+    def since(self, seq: int) -> list[GameEvent] | None:
+        """Returns the events after the sequence number, `None` if some of them are no longer kept"""
+        with self.lock:
+            if seq == self.last_seq:
+                return []
+            if seq < 0 or seq > self.last_seq or not self.events or self.events[0]["seq"] > seq + 1:
+                return None
+
+            return [event for event in self.events if event["seq"] > seq]
+
+
+def game_group_name(game_id: str) -> str:
+    """Name of the channel layer group of all consumers subscribed to the game"""
+    return f"game_{game_id}"
+
+
+class GameEventPublisher:
+    """
+    Publishes game events into the per-game channel layer groups, so that consumers in any process can receive them.
+    - Events of one game are delivered in the order they were published
+    - Can be called from the event loop or from other threads (the clock scheduler), events from other threads are
+      handed over to the bound server event loop
+    """
+
+    def __init__(self) -> None:
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.last_publish: dict[str, asyncio.Task[None]] = {}
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Binds the event loop of the server, which publishes the events coming from other threads"""
+        self.loop = loop
+
+    def publish(self, game_id: str, event: GameEvent) -> None:
+        group = game_group_name(game_id)
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            if self.loop is not None and self.loop.is_running():
+                self.loop.call_soon_threadsafe(self._publish_on_loop, group, event)
+            else:
+                async_to_sync(self._group_send)(group, event)
+            return
+
+        self._publish_on_loop(group, event)
+
+    def _publish_on_loop(self, group: str, event: GameEvent) -> None:
+        previous = self.last_publish.get(group)
+        task = asyncio.get_running_loop().create_task(self._group_send(group, event, previous))
+        self.last_publish[group] = task
+        task.add_done_callback(lambda _: self._forget(group, task))
+
+    async def _group_send(self, group: str, event: GameEvent, previous: asyncio.Task[None] | None = None) -> None:
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+
+        await get_channel_layer().group_send(group, {"type": "game.event", "event": event})
+
+    def _forget(self, group: str, task: asyncio.Task[None]) -> None:
+        if self.last_publish.get(group) is task:
+            del self.last_publish[group]
+
+
+GAME_EVENTS = GameEventPublisher()
+"""Publisher of the events of all games running in this process"""
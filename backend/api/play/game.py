@@ -1,16 +1,25 @@
+from __future__ import annotations
+
 import enum
+import os
 import random
-import threading
+import socket
+import time
 from typing import Dict
 
 import chess
 
 from ..utils import genUniqueID
 from .chess_board import CHESS_COLOR_NAMES, ChessBoard, CustomOutcome, CustomTermination
-from .game_modes import GameMode, TimeControl
-from .models import Game as GameModel
-from .models import GameTerminations, Move, Player
-from .players import APICallbackType, GamePlayer, Players, TimeS, UnknownPlayer, UnknownPlayerType
+from .clock_scheduler import CLOCK_SCHEDULER, ScheduledDeadline
+from .events import GAME_EVENTS, GameEvent, GameEventLog
+from .game_modes import ACTIVE_GAME_MODES, GameMode, TimeControl
+from .game_store import GameSnapshot, GameStore, get_game_store
+from .game_store_writer import GameStoreWriter
+from .models import GameTerminations, Player
+from .persistence import GAME_PERSISTENCE, FinishedGame
+from .players import GamePlayer, Players, TimeS, UnknownPlayer, UnknownPlayerType, seconds_to_ns
+from .relay import WorkerRelay
 
 
 class GameStatus(enum.Enum):
@@ -27,12 +36,15 @@ class Game:
         time_control: TimeControl,
         game_id: str,
         is_link_game: bool,
+        manager: GameManager | None = None,
     ):
         self.players = players
         self.game_mode = game_mode
         self.time_control = time_control
         self.game_id = game_id
         self.is_link_game = is_link_game
+        self.manager = manager if manager is not None else ALL_ACTIVE_GAMES_MANAGER
+        self.events = GameEventLog()
 
         self.board = ChessBoard()
         self.status = GameStatus.NOT_STARTED
@@ -56,47 +68,61 @@ class Game:
         hasUnknownPlayer = any(player is UnknownPlayer for player in self.players.players)
         return hasUnknownPlayer
 
-    def join_player(self, player: Player, api_callback: APICallbackType) -> None:
+    def join_player(self, player: Player) -> None:
         """Joins the player into the game."""
-        self.players.join_game(player, api_callback)
+        self.players.join_game(player)
 
         if self.status == GameStatus.NOT_STARTED:
             if all(player.joined for player in self.players.gamePlayers):
                 self.start()
 
+        self.manager.save_game(self)
+
     def start(self) -> None:
         """Starts the game."""
         self.status = GameStatus.IN_PROGRESS
         self.update_player_timers()
         self.start_reset_abort_timer()
 
-        for player in self.players.gamePlayers:
-            player.api_callback("game_started", {"game_started": True})
+        self.publish_event({"type": "game_started"})
+
+    def publish_event(self, event: GameEvent) -> None:
+        """Numbers the event and publishes it to all consumers subscribed to the game, in the order of the numbers."""
+        with self.events.lock:
+            GAME_EVENTS.publish(self.game_id, self.events.append(event))
 
     def callback_game_result(self, result: chess.Outcome) -> None:
-        """Calls the API callbacks with the game result."""
+        """Publishes the game result."""
 
         winningColor = CHESS_COLOR_NAMES[result.winner] if not result.winner is None else "draw"
-        for player in self.players.gamePlayers:
-            player.api_callback("game_result", [result.termination.name.lower(), winningColor])
+        self.publish_event(
+            {"type": "game_result", "termination": result.termination.name.lower(), "winner": winningColor}
+        )
 
-    def callback_move(self, player: Player, move: chess.Move | str) -> None:
-        """Calls the API callbacks with the move."""
+    def callback_move(self, player: Player, move: chess.Move | str, premove: bool = False) -> None:
+        """Publishes the move with the clocks of both players, the players themselves are only sent on join."""
 
         if isinstance(move, chess.Move):
             move = move.uci()
 
-        for gamePlayer in self.players.gamePlayers:
-            if gamePlayer.player != player:
-                gamePlayer.api_callback("move", move)
+        event: GameEvent = {
+            "type": "move",
+            "move": move,
+            "ply": len(self.board.moves),
+            "white_time": self.players.by_color(chess.WHITE).get_current_time(),
+            "black_time": self.players.by_color(chess.BLACK).get_current_time(),
+            "player_id": player.pk,
+        }
+        if premove:
+            event["premove"] = True
+        self.publish_event(event)
 
     def start_abort_timer(self, abortAfterTime: TimeS) -> None:
         """Start the abort timer that aborts the game."""
-        self.abortTimer = threading.Timer(
+        self.abortTimer = CLOCK_SCHEDULER.schedule(
             abortAfterTime,
             lambda: self.finish(CustomOutcome(CustomTermination.ABORTED, None)),
         )
-        self.abortTimer.start()
 
     def start_reset_abort_timer(self) -> None:
         """Starts and resets the abort timer. Aborts for the first two moves of the game if the moves were not player in time."""
@@ -126,12 +152,16 @@ class Game:
         """Returns a list of all moves made in the game in UCI notation."""
         return [move.uci() for move in self.board.moves]
 
-    def move(self, player: Player, move: chess.Move | str) -> ChessBoard.ILLEGAL_MOVE_TYPE | chess.Outcome | None:
+    def move(
+        self, player: Player, move: chess.Move | str, premove: bool = False
+    ) -> ChessBoard.ILLEGAL_MOVE_TYPE | chess.Outcome | None:
         """
         Moves a piece on the board.
+        - Plays the premove of the opponent right away, if they queued one
 
         Parameters:
             - move: The move to make. Can be a chess.Move object or a string in UCI notation.
+            - premove: Whether the move is a premove played by the server.
 
         Returns:
             - ILLEGAL_MOVE: If the move is illegal.
@@ -147,11 +177,57 @@ class Game:
         self.update_player_timers()
         self.players.remove_draw_offers()
 
-        self.callback_move(player, move)
+        self.callback_move(player, move, premove)
         if isinstance(result, CustomOutcome):
             self.finish(result)
+        elif not self.play_premove():
+            self.manager.save_game(self)
         return result
 
+    def premove(self, player: Player, move: str) -> bool:
+        """
+        Queues the move of the player, played as soon as the opponent moves. Replaces the previous premove.
+        - The move is checked against the board once it is played, for now the player only has to own the moved piece
+        - Returns `False` if the premove is rejected
+        """
+        if self.status != GameStatus.IN_PROGRESS or self.is_players_turn(player):
+            return False
+
+        try:
+            premove = chess.Move.from_uci(move)
+        except ValueError:
+            return False
+
+        gamePlayer = self.players.by_player(player)
+        if self.board.board.color_at(premove.from_square) != gamePlayer.color:
+            return False
+
+        gamePlayer.premove = premove
+        self.manager.save_game(self)
+        return True
+
+    def cancel_premove(self, player: Player) -> None:
+        gamePlayer = self.players.by_player(player)
+        if gamePlayer.premove is not None:
+            gamePlayer.premove = None
+            self.manager.save_game(self)
+
+    def play_premove(self) -> bool:
+        """
+        Plays the premove of the player to move, their clock only runs for the time it takes to play it.
+        - An illegal premove is dropped and the player is notified
+        - Returns `True` if a premove was played
+        """
+        gamePlayer = self.players.by_color(self.board.color_to_move)
+        premove, gamePlayer.premove = gamePlayer.premove, None
+        if premove is None or isinstance(gamePlayer.player, str):
+            return False
+
+        if self.move(gamePlayer.player, premove, premove=True) == ChessBoard.ILLEGAL_MOVE:
+            self.publish_event({"type": "premove_cancelled", "player_id": gamePlayer.player.pk})
+            return False
+        return True
+
     def ran_out_of_time(self) -> None:
         """Handles the case when a player runs out of time."""
         gameOutcome = CustomOutcome(CustomTermination.TIMEOUT, not self.board.color_to_move)
@@ -163,7 +239,7 @@ class Game:
             if player.color == self.board.color_to_move:
                 player.start_timer(self.ran_out_of_time)
             else:
-                player.stop_timer()
+                player.stop_timer(moved=True)
 
     def offer_draw(self, player: Player) -> None:
         """Offers a draw to the opponent. If the opponent accepts, the game ends in a draw."""
@@ -175,59 +251,247 @@ class Game:
         if self.players.is_draw_agreement:
             self.finish(CustomOutcome(CustomTermination.AGREEMENT, None))
         else:
-            opponent = self.players.get_opponent(player)
-            opponent.api_callback("offer_draw")
+            self.publish_event({"type": "offer_draw", "player_id": player.pk})
+            self.manager.save_game(self)
 
     def is_players_turn(self, player: Player) -> bool:
         """Checks if it is the player's turn."""
         return self.board.color_to_move == self.players.by_player(player).color
 
-    def save_to_db(self, result: CustomOutcome) -> None:
-        """Saves the game to the database."""
+    def to_finished_game(self, result: CustomOutcome) -> FinishedGame:
+        """Returns the record of the finished game that is written to the database."""
         whitePlayer = self.players.by_color(chess.WHITE).player
         blackPlayer = self.players.by_color(chess.BLACK).player
 
-        game = GameModel(
-            player_white=whitePlayer,
-            player_black=blackPlayer,
-            termination=GameTerminations.from_chess_termination(result.termination),
-            winner_color=result.winner,
-            time_control=self.time_control.time,
-        )
-        game.save()
-        Move.objects.bulk_create(
-            [Move(game=game, order=order, move=move) for order, move in enumerate(self.get_moves_list())]
-        )
+        return {
+            "white_id": whitePlayer.pk if isinstance(whitePlayer, Player) else None,
+            "black_id": blackPlayer.pk if isinstance(blackPlayer, Player) else None,
+            "game_mode": self.game_mode.name,
+            "time_control": self.time_control.time,
+            "termination": GameTerminations.from_chess_termination(result.termination),
+            "winner": result.winner,
+            "moves": self.get_moves_list(),
+        }
 
     def finish(self, result: CustomOutcome) -> None:
-        """Finishes the game and saves it to the database.
-        - Does not save games with termination of `ABORTED`."""
+        """Finishes the game and queues it to be saved to the database.
+        - Does not save games with termination of `ABORTED`.
+        - Does nothing once the game was taken over by another worker, the new owner finishes it."""
+        if not self.manager.owns(self):
+            return
+
         self.status = GameStatus.FINISHED
-        for player in self.players.gamePlayers:
-            player.stop_timer()
+        self.stop_timers()
 
         self.callback_game_result(result)
 
         if result.termination != CustomTermination.ABORTED:
-            self.save_to_db(result)
+            GAME_PERSISTENCE.submit(self.to_finished_game(result))
+
+        self.manager.remove_game(self.game_id)
+
+    def stop_timers(self) -> None:
+        self.abortTimer.cancel()
+        for player in self.players.gamePlayers:
+            player.stop_timer()
+
+    def to_snapshot(self) -> GameSnapshot:
+        """Returns the snapshot of the game state that is kept in the game store."""
+        return {
+            "game_id": self.game_id,
+            "game_mode": self.game_mode.name,
+            "time_control": self.time_control.time,
+            "increment": self.time_control.increment,
+            "delay": self.time_control.delay,
+            "is_link_game": self.is_link_game,
+            "status": self.status.name,
+            "fen": self.board.board.fen(),
+            "moves": self.get_moves_list(),
+            "players": [player.to_snapshot() for player in self.players.gamePlayers],
+            "saved_at": time.time(),
+            "last_seq": self.events.last_seq,
+        }
+
+    @staticmethod
+    def from_snapshot(snapshot: GameSnapshot, players: dict[int, Player], manager: GameManager) -> Game:
+        """Restores the game from a snapshot, the clock that was running is charged for the time since the snapshot."""
+        timeControl = TimeControl(snapshot["time_control"], snapshot.get("increment", 0), snapshot.get("delay", 0))
+        gameMode = next((mode for mode in ACTIVE_GAME_MODES if mode.name == snapshot["game_mode"]), None)
+
+        gamePlayers: list[GamePlayer] = []
+        for playerSnapshot in snapshot["players"]:
+            playerId = playerSnapshot["player_id"]
+            gamePlayer = GamePlayer(
+                players[playerId] if playerId is not None else UnknownPlayer,
+                playerSnapshot["color"],
+                playerSnapshot["time"],
+                timeControl.increment,
+                timeControl.delay,
+            )
+            gamePlayer.joined = playerSnapshot["joined"]
+            gamePlayer.offers_draw = playerSnapshot["offers_draw"]
+            premove = playerSnapshot.get("premove")
+            gamePlayer.premove = chess.Move.from_uci(premove) if premove else None
+            gamePlayers.append(gamePlayer)
+
+        game = Game(
+            Players(gamePlayers),
+            gameMode or GameMode(snapshot["game_mode"], [timeControl]),
+            timeControl,
+            snapshot["game_id"],
+            snapshot["is_link_game"],
+            manager,
+        )
+        game.events = GameEventLog(snapshot.get("last_seq", 0))
+        for move in snapshot["moves"]:
+            game.board.move(move)
+
+        if GameStatus[snapshot["status"]] == GameStatus.IN_PROGRESS:
+            runningPlayer = game.players.by_color(game.board.color_to_move)
+            # The monotonic clocks of the workers are not comparable, the time since the snapshot is wall-clock time
+            runningPlayer.time_ns -= seconds_to_ns(max(time.time() - snapshot["saved_at"], 0))
 
-        ALL_ACTIVE_GAMES_MANAGER.remove_game(self.game_id)
+            game.status = GameStatus.IN_PROGRESS
+            game.abortTimer.cancel()
+            game.update_player_timers()
+            game.start_reset_abort_timer()
+
+        return game
 
 
 class GameManager:
-    def __init__(self) -> None:
+    """
+    Manages the games owned by this worker.
+    - The state of every game is kept in the game store, so that other workers can read it. The changes are written
+      behind by `writer`, off the event loop and the clock scheduler thread
+    - The ownership of the games is held by leases, which are renewed periodically. Once a lease expires,
+      e.g. when the owning worker crashed, any other worker can take the game over
+    - A game whose lease was lost, e.g. after the worker was paused for longer than `LEASE_TTL`, is dropped without
+      being finished. Its state is no longer written, the new owner carries on with the game
+    - Players connected to other workers play the games of this worker through its `relay`
+    - The queuing players of all the workers are matched by one of them, which holds the `MATCHMAKER_ROLE` lease.
+      The first worker that needs a matchmaker takes the role and keeps it while it is running
+    """
+
+    LEASE_TTL: TimeS = 15
+    MATCHMAKER_ROLE = "matchmaker"
+
+    def __init__(self, store: GameStore | None = None, worker_id: str | None = None) -> None:
         self.games: Dict[str, Game] = {}
+        self._store = store
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{genUniqueID()}"
+        self.lease_renewal: ScheduledDeadline | None = None
+        self.lease_expires: dict[str, float] = {}
+        """Wall-clock time until which the lease of each game is known to be held by this worker"""
+        self.matchmaker_expires = 0.0
+        """Wall-clock time until which this worker is known to hold the matchmaker role, 0 if it doesn't hold it"""
+        self.writer = GameStoreWriter(self)
+        self.relay = WorkerRelay(self.worker_id)
 
-    def get_game(self, game_id: str) -> Game | None:
+    @property
+    def store(self) -> GameStore:
+        if self._store is None:
+            self._store = get_game_store()
+        return self._store
+
+    def get_local_game(self, game_id: str) -> Game | None:
+        """Returns the game if it is owned by this worker, never queries the game store or the database."""
         assert len(game_id) == 8, "Game ID must be 8 characters long"
 
         return self.games.get(game_id)
 
+    def get_game(self, game_id: str) -> Game | None:
+        """Returns the game, takes it over from the game store if its owner's lease expired.
+        - Returns `None` if the game does not exist or if it is owned by another worker"""
+        game = self.get_local_game(game_id)
+        if game is not None and self.owns(game):
+            return game
+        return self.take_over_game(game_id)
+
+    def get_snapshot(self, game_id: str) -> GameSnapshot | None:
+        """Returns the snapshot of the game, no matter which worker owns it."""
+        game = self.get_local_game(game_id)
+        return game.to_snapshot() if game is not None else self.store.load(game_id)
+
+    def holds_lease(self, game: Game) -> bool:
+        """Whether the game is owned by this worker as of the last renewal of its lease, never queries the game store"""
+        return self.games.get(game.game_id) is game and time.time() < self.lease_expires.get(game.game_id, 0)
+
+    def owns(self, game: Game) -> bool:
+        """
+        Whether the game is owned by this worker.
+        - A lease that may have expired, e.g. because the renewals were held up, is acquired again from the game
+          store. The game is dropped if another worker took it over meanwhile
+        - Only a stale lease queries the game store, the consumers check those through `in_db_thread`
+        """
+        if self.holds_lease(game):
+            return True
+        if self.games.get(game.game_id) is not game:
+            return False
+
+        if self.acquire_lease(game.game_id, time.time()):
+            return True
+
+        self.drop_game(game.game_id)
+        return False
+
+    def acquire_lease(self, game_id: str, now: float) -> bool:
+        if not self.store.acquire(game_id, self.worker_id, now + self.LEASE_TTL, now):
+            return False
+
+        self.lease_expires[game_id] = now + self.LEASE_TTL
+        return True
+
+    def get_matchmaker(self) -> str | None:
+        """Returns the worker matching the queuing players, this worker takes the role if no other worker holds it."""
+        now = time.time()
+        if now < self.matchmaker_expires:
+            return self.worker_id
+
+        if self.store.acquire_role(self.MATCHMAKER_ROLE, self.worker_id, now + self.LEASE_TTL, now):
+            self.matchmaker_expires = now + self.LEASE_TTL
+            self.schedule_lease_renewal()
+            return self.worker_id
+        return self.store.role_owner(self.MATCHMAKER_ROLE, now)
+
+    def take_over_game(self, game_id: str) -> Game | None:
+        snapshot = self.store.load(game_id)
+        if snapshot is None:
+            return None
+
+        if not self.acquire_lease(game_id, time.time()):
+            return None
+
+        playerIds = [player["player_id"] for player in snapshot["players"] if player["player_id"] is not None]
+        players = Player.objects.select_related("user", "anonymousUser").in_bulk(playerIds)
+
+        game = Game.from_snapshot(snapshot, players, self)
+        self.games[game_id] = game
+        self.schedule_lease_renewal()
+        return game
+
+    def save_game(self, game: Game) -> None:
+        """Queues the state of the game to be saved into the game store."""
+        self.writer.save(game)
+
+    def write_game(self, game: Game) -> None:
+        """Saves the state of the game into the game store, drops the game if it was taken over by another worker."""
+        if not self.store.save(game.to_snapshot(), self.worker_id):
+            self.drop_game(game.game_id)
+
     def remove_game(self, game_id: str) -> None:
         assert len(game_id) == 8, "Game ID must be 8 characters long"
 
-        if self.get_game(game_id) is not None:
-            del self.games[game_id]
+        self.games.pop(game_id, None)
+        self.lease_expires.pop(game_id, None)
+        self.writer.delete(game_id)
+
+    def drop_game(self, game_id: str) -> None:
+        """Stops running the game on this worker without finishing it, once another worker owns it."""
+        game = self.games.pop(game_id, None)
+        self.lease_expires.pop(game_id, None)
+        if game is not None:
+            game.stop_timers()
 
     def start_game(
         self,
@@ -236,17 +500,57 @@ class GameManager:
         time_control: TimeControl,
         link_game: bool = False,
     ) -> Game:
-        game_id = genUniqueID(self.games)
-
         colors = [chess.WHITE, chess.BLACK]
         random.shuffle(colors)
 
-        gamePlayers = Players([GamePlayer(player, color, time_control.time) for player, color in zip(players, colors)])
+        gamePlayers = Players(
+            [
+                GamePlayer(player, color, time_control.time, time_control.increment, time_control.delay)
+                for player, color in zip(players, colors)
+            ]
+        )
 
-        game = Game(gamePlayers, game_mode, time_control, game_id, link_game)
-        self.games[game_id] = game
+        game = Game(gamePlayers, game_mode, time_control, genUniqueID(self.games), link_game, self)
+
+        # The game ID may be taken by a game of another worker
+        now = time.time()
+        while not self.store.create(game.to_snapshot(), self.worker_id, now + self.LEASE_TTL):
+            game.game_id = genUniqueID(self.games)
+
+        self.games[game.game_id] = game
+        self.lease_expires[game.game_id] = now + self.LEASE_TTL
+        self.schedule_lease_renewal()
         return game
 
+    def schedule_lease_renewal(self) -> None:
+        if self.lease_renewal is None or not self.lease_renewal.active:
+            self.lease_renewal = CLOCK_SCHEDULER.schedule(self.LEASE_TTL / 3, self.renew_leases)
+
+    def renew_leases(self) -> None:
+        """Queues the renewal of the leases held by this worker, keeps renewing while there are any."""
+        self.lease_renewal = None
+        if not self.games and not self.matchmaker_expires:
+            return
+
+        self.writer.renew()
+        self.schedule_lease_renewal()
+
+    def write_lease_renewals(self) -> None:
+        """Renews the leases held by this worker, the games whose lease was lost are dropped."""
+        gameIds = list(self.games)
+        now = time.time()
+        expiresAt = now + self.LEASE_TTL
+        if self.matchmaker_expires:
+            hasRole = self.store.acquire_role(self.MATCHMAKER_ROLE, self.worker_id, expiresAt, now)
+            self.matchmaker_expires = expiresAt if hasRole else 0.0
+
+        lostGameIds = set(self.store.renew(gameIds, self.worker_id, expiresAt))
+        for gameId in gameIds:
+            if gameId in lostGameIds:
+                self.drop_game(gameId)
+            elif gameId in self.games:
+                self.lease_expires[gameId] = expiresAt
+
 
 ALL_ACTIVE_GAMES_MANAGER = GameManager()
 """Manages all currently active games in the system"""
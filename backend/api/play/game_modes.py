@@ -12,8 +12,14 @@ class GameMode:
 
 
 class TimeControl:
-    def __init__(self, time: TimeS):
+    def __init__(self, time: TimeS, increment: TimeS = 0, delay: TimeS = 0):
+        assert increment >= 0 and delay >= 0, "Increment and delay cannot be negative"
+
         self.time = time
+        self.increment = increment
+        """Seconds added to the clock of a player after each of their moves (Fischer increment)"""
+        self.delay = delay
+        """Seconds of each move before the clock of the player starts running (simple delay)"""
 
     @property
     def time(self) -> TimeS:
@@ -34,3 +40,11 @@ ACTIVE_GAME_MODES = [
     GameMode("Rapid", [TimeControl(600), TimeControl(1200), TimeControl(1800)]),
 ]
 """Currently active game modes"""
+
+
+def get_game_mode_by_time_control(time: TimeS) -> GameMode | None:
+    """Returns the active game mode the time control belongs to, `None` if no active game mode has it"""
+    for gameMode in ACTIVE_GAME_MODES:
+        if any(timeControl.time == time for timeControl in gameMode.time_controls):
+            return gameMode
+    return None
@@ -1,75 +1,222 @@
-from typing import Callable, Dict, Tuple
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Tuple, TypedDict
 
 from api.play.models import Player
 
+from .clock_scheduler import CLOCK_SCHEDULER, ScheduledDeadline, TimeS
 from .game import ALL_ACTIVE_GAMES_MANAGER, Game
 from .game_modes import ACTIVE_GAME_MODES, GameMode, TimeControl
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATING = 1500.0
+
+
+class RatingWindow:
+    """Acceptable rating difference between two paired players, widens the longer the players wait"""
+
+    def __init__(self, initial: float, widening_per_second: float, maximum: float):
+        self.initial = initial
+        self.widening_per_second = widening_per_second
+        self.maximum = maximum
+
+    def get(self, waited: TimeS) -> float:
+        return min(self.initial + self.widening_per_second * waited, self.maximum)
+
+
+DEFAULT_RATING_WINDOW = RatingWindow(initial=100, widening_per_second=20, maximum=1000)
+
+
+class QueuingPlayer:
+    def __init__(
+        self,
+        player: Player,
+        game_queue: GameQueue,
+        game_found_callback: Callable[[Game], None] | None = None,
+        rating: float = DEFAULT_RATING,
+        joined_at: TimeS | None = None,
+    ):
+        self.player = player
+        self.game_queue = game_queue
+        self.rating = rating
+        self.joined_at = joined_at if joined_at is not None else time.monotonic()
+
+        self.game_found_callback = game_found_callback
+        """Callback function to be called when a game is found. The game ID will be passed as an argument
+
+        Notifies the players that a game has been found using websockets"""
+
 
 class GameQueue:
+    """
+    Queue of players waiting for a game with the given game mode and time control.
+    - Players are kept in an ordered dict, so that adding, removing and looking up a player are all O(1)
+    - Players are also indexed in rating buckets, which keeps them roughly sorted by rating for the matching
+    """
+
+    RATING_BUCKET_WIDTH = 50
+
     def __init__(self, game_mode: GameMode, time_control: TimeControl):
         self.game_mode = game_mode
         self.time_control = time_control
-        self.queue: list[Player] = []
+        self.queue: OrderedDict[Player, QueuingPlayer] = OrderedDict()
+        self.rating_buckets: dict[int, dict[Player, QueuingPlayer]] = {}
+
+    def __len__(self) -> int:
+        return len(self.queue)
 
-    def add_player(self, player: Player) -> None:
-        """Add a player to the queue. If there is a match, start a game"""
-        assert not self.is_player_queuing(player), "Player is already in queue"
+    def add_player(self, queuingPlayer: QueuingPlayer) -> None:
+        """Add a player to the queue"""
+        assert not self.is_player_queuing(queuingPlayer.player), "Player is already in queue"
 
-        self.queue.append(player)
+        self.queue[queuingPlayer.player] = queuingPlayer
+        bucket = self.rating_buckets.setdefault(self.rating_bucket(queuingPlayer.rating), {})
+        bucket[queuingPlayer.player] = queuingPlayer
 
     def remove_player(self, player: Player) -> None:
         """Remove a player from the queue"""
         assert self.is_player_queuing(player), "Player is not in queue"
 
-        self.queue.remove(player)
+        queuingPlayer = self.queue.pop(player)
+        bucketKey = self.rating_bucket(queuingPlayer.rating)
+        bucket = self.rating_buckets[bucketKey]
+        del bucket[player]
+        if not bucket:
+            del self.rating_buckets[bucketKey]
 
     def is_player_queuing(self, player: Player) -> bool:
         """Returns True if the player is in the queue, False otherwise"""
         return player in self.queue
 
+    def rating_bucket(self, rating: float) -> int:
+        return int(rating // self.RATING_BUCKET_WIDTH)
 
-class QueuingPlayer:
-    def __init__(
-        self, player: Player, game_queue: GameQueue, game_found_callback: Callable[[Game], None] | None = None
-    ):
-        self.player = player
-        self.game_queue = game_queue
+    def find_pairs(self, now: TimeS, window: RatingWindow | None) -> list[tuple[QueuingPlayer, QueuingPlayer]]:
+        """
+        Finds pairs of players to start games with, without removing them from the queue.
+        - Walks the players ordered by rating and pairs neighbours whose rating difference fits the rating window
+          of both of them. Without a window, the players are paired regardless of their rating
+        - Runs in O(n log b) for n players in b-sized rating buckets
+        """
+        ordered: list[QueuingPlayer] = []
+        for bucketKey in sorted(self.rating_buckets):
+            ordered.extend(sorted(self.rating_buckets[bucketKey].values(), key=lambda player: player.rating))
 
-        self.game_found_callback = game_found_callback
-        """Callback function to be called when a game is found. The game ID will be passed as an argument
-        
-        Notifies the players that a game has been found using websockets"""
+        pairs: list[tuple[QueuingPlayer, QueuingPlayer]] = []
+        index = 0
+        while index < len(ordered) - 1:
+            lower, higher = ordered[index], ordered[index + 1]
+
+            if window is None or higher.rating - lower.rating <= min(
+                window.get(now - lower.joined_at), window.get(now - higher.joined_at)
+            ):
+                pairs.append((lower, higher))
+                index += 2
+            else:
+                index += 1
+
+        return pairs
+
+
+class WaitTimePercentiles(TypedDict):
+    matched: int
+    p50: TimeS
+    p90: TimeS
+    p99: TimeS
+
+
+Group = tuple[str, ...]
+"""A tuple of usernames present in the group, sorted alphabetically"""
+
+GameQueueKey = tuple[str, int]
+"""Lowercase game mode name and the time control in seconds"""
 
 
 class GameQueueManager:
-    def __init__(self, game_modes: list[GameMode]):
+    """
+    Manages the game queues of all game modes and time controls.
+    - Players are not paired on every enqueue, but in periodic batch ticks driven by the clock scheduler,
+      which give the rating windows time to widen
+    - The ticks run in the matchmaking thread, the matched players are taken out of the queues under the lock, but
+      their games are started after it is released
+    """
+
+    TICK_INTERVAL: TimeS = 1
+    WAIT_TIMES_KEPT = 10_000
+
+    def __init__(
+        self,
+        game_modes: list[GameMode],
+        group: Group | None = None,
+        player_index: Dict[Player, GameQueueManager] | None = None,
+        rating_window: RatingWindow | None = DEFAULT_RATING_WINDOW,
+        on_empty: Callable[[GameQueueManager], None] | None = None,
+    ):
         self.game_queues = [
             GameQueue(game_mode, time_control) for game_mode in game_modes for time_control in game_mode.time_controls
         ]
+        self.game_queues_by_key: Dict[GameQueueKey, GameQueue] = {
+            (game_queue.game_mode.name.lower(), game_queue.time_control.time): game_queue
+            for game_queue in self.game_queues
+        }
         self.queuing_players: Dict[Player, QueuingPlayer] = {}
 
-    def add_player(self, player: Player, game_queue: GameQueue, gameFoundCallback: Callable[[Game], None]) -> None:
-        """Adds a player to a game queue"""
-
-        if self.is_player_queuing(player):
-            raise ValueError("Player is already in a queue")
-
-        self.queuing_players[player] = QueuingPlayer(player, game_queue, gameFoundCallback)
-        game_queue.add_player(player)
-
-        # Start a game if there are at least two players in the queue
-        if len(game_queue.queue) >= 2:
-            self.start_game((game_queue.queue[0], game_queue.queue[1]), game_queue)
+        self.group = group
+        self.player_index = player_index
+        """Index of the queue manager of every queuing player, shared by all managers of a `GroupQueueManager`"""
+        self.rating_window = rating_window
+        self.on_empty = on_empty
+        """Called under the lock once a tick matched the last queuing players"""
+
+        self.lock = threading.RLock()
+        """Players are added from the event loop while the ticks run in the matchmaking thread"""
+        self.tick: ScheduledDeadline | None = None
+        self.wait_times: deque[TimeS] = deque(maxlen=self.WAIT_TIMES_KEPT)
+
+    def add_player(
+        self,
+        player: Player,
+        game_queue: GameQueue,
+        gameFoundCallback: Callable[[Game], None],
+        rating: float = DEFAULT_RATING,
+    ) -> None:
+        """Adds a player to a game queue, the player is paired with an opponent on one of the next ticks"""
+
+        with self.lock:
+            if self.is_player_queuing(player):
+                raise ValueError("Player is already in a queue")
+
+            queuingPlayer = QueuingPlayer(player, game_queue, gameFoundCallback, rating)
+            self.queuing_players[player] = queuingPlayer
+            game_queue.add_player(queuingPlayer)
+            if self.player_index is not None:
+                self.player_index[player] = self
+
+            self.schedule_tick()
 
     def remove_player(self, player: Player) -> None:
         """Remove a player from a game queue"""
 
-        if not self.is_player_queuing(player):
+        if not self.discard_player(player):
             raise ValueError("Player is not in a queue")
 
-        self.queuing_players[player].game_queue.remove_player(player)
-        del self.queuing_players[player]
+    def discard_player(self, player: Player) -> bool:
+        """Removes the player from their game queue, returns False if the player is not queuing"""
+
+        with self.lock:
+            if not self.is_player_queuing(player):
+                return False
+
+            self.queuing_players[player].game_queue.remove_player(player)
+            del self.queuing_players[player]
+            if self.player_index is not None:
+                del self.player_index[player]
+            return True
 
     def is_player_queuing(self, player: Player) -> bool:
         """Returns True if the player is in any queue, False otherwise"""
@@ -82,54 +229,147 @@ class GameQueueManager:
         Returns None if the game queue does not exist
         """
 
-        for game_queue in self.game_queues:
-            if game_queue.game_mode.name.lower() == game_mode.lower() and game_queue.time_control.time == time_control:
-                return game_queue
+        return self.game_queues_by_key.get((game_mode.lower(), time_control))
+
+    def schedule_tick(self) -> None:
+        if self.tick is None or not self.tick.active:
+            self.tick = CLOCK_SCHEDULER.schedule(self.TICK_INTERVAL, lambda: MATCHMAKER.submit(self))
+
+    def run_tick(self) -> None:
+        """Pairs the queuing players and keeps ticking while anyone is left in the queues"""
+        with self.lock:
+            self.tick = None
+
+        self.match_players()
+        with self.lock:
+            if self.queuing_players:
+                self.schedule_tick()
+
+    def match_players(self, now: TimeS | None = None) -> int:
+        """Pairs the players of all queues and starts their games. Returns the number of started games."""
+        now = now if now is not None else time.monotonic()
+
+        matches: list[tuple[tuple[QueuingPlayer, QueuingPlayer], GameQueue]] = []
+        with self.lock:
+            for game_queue in self.game_queues:
+                if len(game_queue) < 2:
+                    continue
+
+                for lower, higher in game_queue.find_pairs(now, self.rating_window):
+                    self.wait_times.extend((now - lower.joined_at, now - higher.joined_at))
+                    self.remove_player(lower.player)
+                    self.remove_player(higher.player)
+                    matches.append(((lower, higher), game_queue))
+
+            if matches and not self.queuing_players and self.on_empty is not None:
+                self.on_empty(self)
+
+        # Starting the games writes into the game store, the players enqueue and leave meanwhile without waiting on it
+        startedGames = 0
+        for players, game_queue in matches:
+            try:
+                self.start_game(players, game_queue)
+                startedGames += 1
+            except Exception:
+                logger.exception("Failed to start a game of matched players")
+
+        return startedGames
+
+    def wait_time_percentiles(self) -> WaitTimePercentiles | None:
+        """Percentiles of the time the recently matched players waited in the queue"""
+        waitTimes = sorted(self.wait_times)
+        if not waitTimes:
+            return None
+
+        def percentile(percent: int) -> TimeS:
+            return waitTimes[min(len(waitTimes) * percent // 100, len(waitTimes) - 1)]
+
+        return {"matched": len(waitTimes), "p50": percentile(50), "p90": percentile(90), "p99": percentile(99)}
+
+    def start_game(self, players: Tuple[QueuingPlayer, QueuingPlayer], game_queue: GameQueue) -> None:
+        """Start a game between two matched players, who are already taken out of the queue"""
+        game = ALL_ACTIVE_GAMES_MANAGER.start_game(
+            (players[0].player, players[1].player), game_queue.game_mode, game_queue.time_control
+        )
+        for queuingPlayer in players:
+            if queuingPlayer.game_found_callback is not None:
+                queuingPlayer.game_found_callback(game)
+
+
+class Matchmaker:
+    """
+    Runs the ticks of the queue managers in its own thread. Starting the matched games writes into the game store,
+    which must not hold up the flag-falls fired by the clock scheduler thread.
+    - The clock scheduler only hands the due ticks over, they run one at a time in the order they came due
+    - A queue manager is due at most once, however many of its ticks fire before it runs
+    - The thread is started with the first due tick
+    """
 
-        # Game queue does not exist
-        return None
+    def __init__(self) -> None:
+        self.due: OrderedDict[GameQueueManager, None] = OrderedDict()
+        self.condition = threading.Condition()
+        self.thread: threading.Thread | None = None
 
-    def start_game(self, players: Tuple[Player, Player], game_queue: GameQueue) -> None:
-        """Start a game between two players, removing them from the queue"""
-        if all(player not in game_queue.queue for player in players):
-            raise ValueError("Players are not in the queue")
+    def submit(self, manager: GameQueueManager) -> None:
+        with self.condition:
+            self.due[manager] = None
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="matchmaking", daemon=True)
+                self.thread.start()
+            self.condition.notify()
 
-        game = ALL_ACTIVE_GAMES_MANAGER.start_game(players, game_queue.game_mode, game_queue.time_control)
-        for player in players:
-            callback = self.queuing_players[player].game_found_callback
-            if callback is not None:
-                callback(game)
-            self.remove_player(player)
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.due:
+                    self.condition.wait()
+                manager, _ = self.due.popitem(last=False)
 
+            try:
+                manager.run_tick()
+            except Exception:
+                logger.exception("Matchmaking tick failed")
 
-Group = tuple[str, ...]
-"""A tuple of usernames present in the group, sorted alphabetically"""
+
+MATCHMAKER = Matchmaker()
+"""Runs the matchmaking ticks of all the queue managers of this worker"""
 
 
 class GroupQueueManager:
     def __init__(self) -> None:
+        self.player_index: dict[Player, GameQueueManager] = {}
+        """The queue manager of every queuing player, a player can only queue in one manager at a time"""
+
         self.groups: dict[Group, GameQueueManager] = {}
-        self.default = GameQueueManager(ACTIVE_GAME_MODES)
+        self.default = GameQueueManager(ACTIVE_GAME_MODES, player_index=self.player_index)
 
     def get_create_queue_manager(self, group: Group | None) -> GameQueueManager:
         """Returns a GameQueueManager for the given group. If the group does not exist, it will be created and returned"""
 
         if group is None:
             return self.default
-        elif group in self.groups:
+
+        group = tuple(sorted(group))
+        if group in self.groups:
             return self.groups[group]
         else:
             return self.add_group(group)
 
     def add_group(self, group: Group) -> GameQueueManager:
-        """Adds a group to the group queue manager"""
+        """Adds a group to the group queue manager, players in a group are paired regardless of their rating"""
 
         group = tuple(sorted(group))
 
         if group in self.groups:
             raise ValueError("Group already exists")
 
-        gameQueueManager = GameQueueManager(ACTIVE_GAME_MODES)
+        gameQueueManager = GameQueueManager(
+            ACTIVE_GAME_MODES,
+            group=group,
+            player_index=self.player_index,
+            rating_window=None,
+            on_empty=self.remove_empty_group,
+        )
         self.groups[group] = gameQueueManager
         return gameQueueManager
 
@@ -141,18 +381,55 @@ class GroupQueueManager:
 
         del self.groups[group]
 
+    def remove_empty_group(self, queue: GameQueueManager) -> None:
+        """Removes the group of the queue manager once nobody queues in it, the caller must hold the manager's lock"""
+
+        if queue.group is not None and not queue.queuing_players and self.groups.get(queue.group) is queue:
+            self.remove_group(queue.group)
+
+    def add_player(
+        self,
+        group: Group | None,
+        player: Player,
+        game_mode: str,
+        time_control: int,
+        gameFoundCallback: Callable[[Game], None],
+        rating: float = DEFAULT_RATING,
+    ) -> bool:
+        """
+        Adds the player to the game queue of the group, creates the group if needed.
+        - Returns False if the game mode or the time control does not exist
+        - A group that was removed since its manager was looked up, e.g. by a tick that matched its last players, is
+          looked up again, so that the player is never left in a manager no one else can join
+        """
+
+        while True:
+            queueManager = self.get_create_queue_manager(group)
+            gameQueue = queueManager.get_game_queue(game_mode, time_control)
+            if gameQueue is None:
+                return False
+
+            with queueManager.lock:
+                if queueManager.group is None or self.groups.get(queueManager.group) is queueManager:
+                    queueManager.add_player(player, gameQueue, gameFoundCallback, rating)
+                    return True
+
+    def is_player_queuing(self, player: Player) -> bool:
+        """Returns True if the player is queuing in any of the managers"""
+
+        return player in self.player_index
+
     def remove_player(self, player: Player) -> None:
-        """Removes the player from all queues
-        - the algorithm is O(n), which could be improved, but it's not worth it"""
+        """Removes the player from the queue the player is in, if any"""
 
-        for group, queue in list(self.groups.items()):
-            if queue.is_player_queuing(player):
-                queue.remove_player(player)
-                if len(queue.queuing_players) == 0:
-                    self.remove_group(group)
+        queue = self.player_index.get(player)
+        if queue is None:
+            return
 
-        if self.default.is_player_queuing(player):
-            self.default.remove_player(player)
+        with queue.lock:
+            # A tick may have matched the player since the lookup, there is nothing left to remove then
+            if queue.discard_player(player):
+                self.remove_empty_group(queue)
 
 
 GROUP_QUEUE_MANAGER = GroupQueueManager()
@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, NotRequired, TypedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class PlayerSnapshot(TypedDict):
+    player_id: int | None
+    """Primary key of the player, `None` for an unknown player of a link game"""
+    color: bool
+    time: float
+    """Remaining time in seconds at the moment the snapshot was taken"""
+    joined: bool
+    offers_draw: bool
+    premove: NotRequired[str | None]
+    """Move in UCI notation queued by the player while waiting for the opponent's move"""
+
+
+class GameSnapshot(TypedDict):
+    game_id: str
+    game_mode: str
+    time_control: int
+    increment: NotRequired[int]
+    delay: NotRequired[int]
+    is_link_game: bool
+    status: str
+    fen: str
+    moves: list[str]
+    players: list[PlayerSnapshot]
+    saved_at: float
+    """Wall-clock time of the snapshot, used to charge the running clock after a takeover"""
+    last_seq: NotRequired[int]
+    """Sequence number of the last event of the game, the numbering continues from it after a takeover"""
+
+
+def snapshot_player_ids(snapshots: list[GameSnapshot]) -> set[int]:
+    return {
+        player["player_id"]
+        for snapshot in snapshots
+        for player in snapshot["players"]
+        if player["player_id"] is not None
+    }
+
+
+class GameStore(ABC):
+    """
+    Storage of the state of the active games, shared by all the workers that use the same backend.
+    - Every game is owned by exactly one worker, which holds a lease on it and is the only one writing its state.
+      The writes are fenced by the owner, a worker that lost the lease can't overwrite the state of the new owner
+    - Other workers can read the snapshots and take over the game once the lease expires
+    """
+
+    @abstractmethod
+    def create(self, snapshot: GameSnapshot, owner: str, expires_at: float) -> bool:
+        """Stores a new game leased to the owner. Fails if a game with the same ID exists."""
+
+    @abstractmethod
+    def save(self, snapshot: GameSnapshot, owner: str) -> bool:
+        """Saves the state of the game. Fails if the game is no longer held by the owner, e.g. it was taken over."""
+
+    @abstractmethod
+    def load(self, game_id: str) -> GameSnapshot | None: ...
+
+    @abstractmethod
+    def delete(self, game_id: str, owner: str) -> None:
+        """Deletes the game, unless it is held by another owner"""
+
+    @abstractmethod
+    def player_ids(self) -> set[int]:
+        """Returns the IDs of the players of all the stored games"""
+
+    @abstractmethod
+    def acquire(self, game_id: str, owner: str, expires_at: float, now: float) -> bool:
+        """Acquires or renews the lease of the game. Fails if the game is leased by another owner that is not expired."""
+
+    @abstractmethod
+    def renew(self, game_ids: list[str], owner: str, expires_at: float) -> list[str]:
+        """Renews the leases of the given games that are still held by the owner, returns the IDs of the others"""
+
+    @abstractmethod
+    def release(self, game_id: str, owner: str) -> None: ...
+
+    @abstractmethod
+    def owner(self, game_id: str, now: float) -> str | None:
+        """Returns the current owner of the game, `None` if the game is not leased or the lease expired"""
+
+    @abstractmethod
+    def acquire_role(self, role: str, owner: str, expires_at: float, now: float) -> bool:
+        """Acquires or renews the lease of a role held by one worker at a time, e.g. the matchmaker.
+        Fails if the role is leased by another owner that is not expired."""
+
+    @abstractmethod
+    def role_owner(self, role: str, now: float) -> str | None:
+        """Returns the current owner of the role, `None` if the role is not leased or the lease expired"""
+
+
+class InMemoryGameStore(GameStore):
+    """Game store that lives in the memory of the process, only usable with a single worker"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.snapshots: dict[str, GameSnapshot] = {}
+        self.leases: dict[str, tuple[str, float]] = {}
+        self.roles: dict[str, tuple[str, float]] = {}
+
+    def create(self, snapshot: GameSnapshot, owner: str, expires_at: float) -> bool:
+        with self.lock:
+            if snapshot["game_id"] in self.snapshots:
+                return False
+
+            self.snapshots[snapshot["game_id"]] = snapshot
+            self.leases[snapshot["game_id"]] = (owner, expires_at)
+            return True
+
+    def save(self, snapshot: GameSnapshot, owner: str) -> bool:
+        with self.lock:
+            if not self.is_held_by(snapshot["game_id"], owner):
+                return False
+
+            self.snapshots[snapshot["game_id"]] = snapshot
+            return True
+
+    def load(self, game_id: str) -> GameSnapshot | None:
+        with self.lock:
+            return self.snapshots.get(game_id)
+
+    def delete(self, game_id: str, owner: str) -> None:
+        with self.lock:
+            lease = self.leases.get(game_id)
+            if lease is None or lease[0] == owner:
+                self.snapshots.pop(game_id, None)
+                self.leases.pop(game_id, None)
+
+    def player_ids(self) -> set[int]:
+        with self.lock:
+            snapshots = list(self.snapshots.values())
+        return snapshot_player_ids(snapshots)
+
+    def acquire(self, game_id: str, owner: str, expires_at: float, now: float) -> bool:
+        with self.lock:
+            lease = self.leases.get(game_id)
+            if lease is not None and lease[0] != owner and lease[1] > now:
+                return False
+
+            self.leases[game_id] = (owner, expires_at)
+            return True
+
+    def renew(self, game_ids: list[str], owner: str, expires_at: float) -> list[str]:
+        lost: list[str] = []
+        with self.lock:
+            for game_id in game_ids:
+                if self.is_held_by(game_id, owner):
+                    self.leases[game_id] = (owner, expires_at)
+                else:
+                    lost.append(game_id)
+        return lost
+
+    def release(self, game_id: str, owner: str) -> None:
+        with self.lock:
+            lease = self.leases.get(game_id)
+            if lease is not None and lease[0] == owner:
+                del self.leases[game_id]
+
+    def owner(self, game_id: str, now: float) -> str | None:
+        with self.lock:
+            lease = self.leases.get(game_id)
+            return lease[0] if lease is not None and lease[1] > now else None
+
+    def acquire_role(self, role: str, owner: str, expires_at: float, now: float) -> bool:
+        with self.lock:
+            lease = self.roles.get(role)
+            if lease is not None and lease[0] != owner and lease[1] > now:
+                return False
+
+            self.roles[role] = (owner, expires_at)
+            return True
+
+    def role_owner(self, role: str, now: float) -> str | None:
+        with self.lock:
+            lease = self.roles.get(role)
+            return lease[0] if lease is not None and lease[1] > now else None
+
+    def is_held_by(self, game_id: str, owner: str) -> bool:
+        """Whether the game is stored and leased to the owner, the caller must hold `lock`"""
+        lease = self.leases.get(game_id)
+        return game_id in self.snapshots and lease is not None and lease[0] == owner
+
+
+class SQLiteGameStore(GameStore):
+    """
+    Durable game store in a local SQLite database, shared by all the workers on the machine.
+    - Survives crashes of the workers, the games can be taken over by the remaining workers
+    - Leases are acquired with a single conditional UPDATE, so that only one worker can win a takeover
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.local = threading.local()
+
+        with self.connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS games ("
+                "game_id TEXT PRIMARY KEY, snapshot TEXT NOT NULL, owner TEXT, lease_expires REAL NOT NULL DEFAULT 0)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS roles (role TEXT PRIMARY KEY, owner TEXT NOT NULL, lease_expires REAL NOT NULL)"
+            )
+
+    def connection(self) -> sqlite3.Connection:
+        """Returns the connection of the current thread, SQLite connections can't be shared between threads"""
+        connection: sqlite3.Connection | None = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def create(self, snapshot: GameSnapshot, owner: str, expires_at: float) -> bool:
+        with self.connection() as connection:
+            cursor = connection.execute(
+                "INSERT INTO games (game_id, snapshot, owner, lease_expires) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(game_id) DO NOTHING",
+                (snapshot["game_id"], json.dumps(snapshot), owner, expires_at),
+            )
+            return cursor.rowcount == 1
+
+    def save(self, snapshot: GameSnapshot, owner: str) -> bool:
+        with self.connection() as connection:
+            cursor = connection.execute(
+                "UPDATE games SET snapshot = ? WHERE game_id = ? AND owner = ?",
+                (json.dumps(snapshot), snapshot["game_id"], owner),
+            )
+            return cursor.rowcount == 1
+
+    def load(self, game_id: str) -> GameSnapshot | None:
+        row = self.connection().execute("SELECT snapshot FROM games WHERE game_id = ?", (game_id,)).fetchone()
+        if row is None:
+            return None
+
+        snapshot: GameSnapshot = json.loads(row[0])
+        return snapshot
+
+    def delete(self, game_id: str, owner: str) -> None:
+        with self.connection() as connection:
+            connection.execute("DELETE FROM games WHERE game_id = ? AND (owner IS NULL OR owner = ?)", (game_id, owner))
+
+    def player_ids(self) -> set[int]:
+        rows = self.connection().execute("SELECT snapshot FROM games").fetchall()
+        return snapshot_player_ids([json.loads(row[0]) for row in rows])
+
+    def acquire(self, game_id: str, owner: str, expires_at: float, now: float) -> bool:
+        with self.connection() as connection:
+            cursor = connection.execute(
+                "UPDATE games SET owner = ?, lease_expires = ? "
+                "WHERE game_id = ? AND (owner IS NULL OR owner = ? OR lease_expires <= ?)",
+                (owner, expires_at, game_id, owner, now),
+            )
+            return cursor.rowcount == 1
+
+    def renew(self, game_ids: list[str], owner: str, expires_at: float) -> list[str]:
+        lost: list[str] = []
+        with self.connection() as connection:
+            for game_id in game_ids:
+                cursor = connection.execute(
+                    "UPDATE games SET lease_expires = ? WHERE game_id = ? AND owner = ?", (expires_at, game_id, owner)
+                )
+                if cursor.rowcount == 0:
+                    lost.append(game_id)
+        return lost
+
+    def release(self, game_id: str, owner: str) -> None:
+        with self.connection() as connection:
+            connection.execute(
+                "UPDATE games SET owner = NULL, lease_expires = 0 WHERE game_id = ? AND owner = ?", (game_id, owner)
+            )
+
+    def owner(self, game_id: str, now: float) -> str | None:
+        row = (
+            self.connection()
+            .execute("SELECT owner FROM games WHERE game_id = ? AND lease_expires > ?", (game_id, now))
+            .fetchone()
+        )
+        return row[0] if row is not None else None
+
+    def acquire_role(self, role: str, owner: str, expires_at: float, now: float) -> bool:
+        with self.connection() as connection:
+            cursor = connection.execute(
+                "INSERT INTO roles (role, owner, lease_expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(role) DO UPDATE SET owner = excluded.owner, lease_expires = excluded.lease_expires "
+                "WHERE roles.owner = excluded.owner OR roles.lease_expires <= ?",
+                (role, owner, expires_at, now),
+            )
+            return cursor.rowcount == 1
+
+    def role_owner(self, role: str, now: float) -> str | None:
+        row = (
+            self.connection()
+            .execute("SELECT owner FROM roles WHERE role = ? AND lease_expires > ?", (role, now))
+            .fetchone()
+        )
+        return row[0] if row is not None else None
+
+
+def get_game_store() -> GameStore:
+    """Creates the game store configured by the `GAME_STORE` setting"""
+    config: dict[str, Any] = settings.GAME_STORE
+    store: GameStore = import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+    return store
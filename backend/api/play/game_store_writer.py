@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .game import Game, GameManager
+
+logger = logging.getLogger(__name__)
+
+TimeS = float
+
+
+class GameStoreWriter:
+    """
+    Write-behind of the active games into the game store, which keeps the store's I/O off the event loop and the
+    clock scheduler thread.
+    - A changed game is marked as pending, the worker thread snapshots and saves it as soon as it gets to it. A game
+      changed several times meanwhile is saved once, with its latest state
+    - A snapshot may be taken while the game is changing, the change marks the game again once it is done, so the
+      stored state always catches up with the game
+    - The deletions of the finished games and the lease renewals go through the same thread, in order with the saves
+    - Failed writes stay pending and are retried after `RETRY_DELAY` seconds, unless the game changes again sooner
+    - Pending writes are flushed when the worker is stopped, which also happens on interpreter shutdown
+    - Without a running worker (scripts and tests), the writes are done right away in the calling thread
+    """
+
+    RETRY_DELAY: TimeS = 0.5
+
+    def __init__(self, manager: GameManager) -> None:
+        self.manager = manager
+        self.pending: dict[str, Game | None] = {}
+        """Games waiting to be saved, `None` for the games waiting to be deleted"""
+        self.renewal_pending = False
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        """Keeps the writes in order when `flush` is called outside of the worker"""
+        self.thread: threading.Thread | None = None
+        self.stopping = False
+
+        self.saved = 0
+        self.coalesced = 0
+        """Changes of the games that were saved together with a later change"""
+
+    def start(self) -> None:
+        with self.condition:
+            if self.thread is not None:
+                return
+
+            self.stopping = False
+            self.thread = threading.Thread(target=self._run, name="game-store-writer", daemon=True)
+            self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Stops the worker and writes what is still pending"""
+        with self.condition:
+            thread = self.thread
+            self.stopping = True
+            self.condition.notify()
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def save(self, game: Game) -> None:
+        self.submit(game.game_id, game)
+
+    def delete(self, game_id: str) -> None:
+        self.submit(game_id, None)
+
+    def renew(self) -> None:
+        with self.condition:
+            self.renewal_pending = True
+            if self.thread is not None:
+                self.condition.notify()
+                return
+
+        self.flush()
+
+    def submit(self, game_id: str, game: Game | None) -> None:
+        with self.condition:
+            if game_id in self.pending:
+                self.coalesced += 1
+            self.pending[game_id] = game
+            if self.thread is not None:
+                self.condition.notify()
+                return
+
+        self.flush()
+
+    def flush(self) -> bool:
+        """Writes everything pending in the calling thread. Returns `False` if some writes failed and are pending again."""
+        with self.flush_lock:
+            with self.condition:
+                pending, self.pending = self.pending, {}
+                renewalPending, self.renewal_pending = self.renewal_pending, False
+
+            failed: dict[str, Game | None] = {}
+            for gameId, game in pending.items():
+                try:
+                    if game is None:
+                        self.manager.store.delete(gameId, self.manager.worker_id)
+                    else:
+                        self.manager.write_game(game)
+                        self.saved += 1
+                except Exception:
+                    logger.exception("Failed to write the game %s into the game store", gameId)
+                    failed[gameId] = game
+
+            renewalFailed = False
+            if renewalPending:
+                try:
+                    self.manager.write_lease_renewals()
+                except Exception:
+                    logger.exception("Failed to renew the leases of the games")
+                    renewalFailed = True
+
+            if not failed and not renewalFailed:
+                return True
+
+            with self.condition:
+                # Changes submitted meanwhile replace the failed writes
+                for gameId, game in failed.items():
+                    self.pending.setdefault(gameId, game)
+                self.renewal_pending |= renewalFailed
+            return False
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.stopping and not self.pending and not self.renewal_pending:
+                    self.condition.wait()
+                if self.stopping:
+                    self.thread = None
+                    return
+
+            if not self.flush():
+                with self.condition:
+                    self.condition.wait(self.RETRY_DELAY)
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.base import SessionBase
+from users.models import User
+
+from ..utils import in_db_thread
+from .models import Player
+from .utils import handleGetAnonymousSessionUser, session_identity
+
+TimeS = float
+
+IdentityKey = tuple[str, int | str]
+"""`("user", user ID)` of a logged-in user or `("session", session key)` of an anonymous one"""
+
+
+class CachedPlayer:
+    __slots__ = ("player", "loaded_at")
+
+    def __init__(self, player: Player, loaded_at: TimeS) -> None:
+        self.player = player
+        self.loaded_at = loaded_at
+
+
+class IdentityResolver:
+    """
+    In-memory cache of the players of the recently connected users and sessions.
+    - A player of a user or session seen recently is resolved without querying the database
+    - Entries are dropped when the player is deleted in this process, and expire after `TTL` seconds, which bounds
+      how long a player deleted by another process can be returned
+    - Holds at most `MAX_PLAYERS` players, the least recently used are evicted
+    """
+
+    MAX_PLAYERS = 10_000
+    TTL: TimeS = 300
+
+    def __init__(self, time_source: Callable[[], TimeS] = time.monotonic) -> None:
+        self.time_source = time_source
+        self.lock = threading.Lock()
+        self.players: OrderedDict[IdentityKey, CachedPlayer] = OrderedDict()
+        self.keys: dict[int, IdentityKey] = {}
+        """Key of every cached player by its ID, for dropping the player once it is deleted"""
+
+    def get_player(self, user: User | AnonymousUser, session: SessionBase) -> Player:
+        """Gets or creates the player, either of the logged-in user or of the session"""
+        key = identity_key(user, session)
+        player = self.get_cached_player(key)
+        if player is not None:
+            return player
+
+        if isinstance(user, User):
+            return self.add(key, Player.getOrCreatePlayerByUser(user))
+        return self.add(key, Player.getOrCreatePlayerByUser(handleGetAnonymousSessionUser(session)))
+
+    def get_cached_player(self, key: IdentityKey) -> Player | None:
+        """Returns the cached player, never queries the database"""
+        now = self.time_source()
+        with self.lock:
+            cachedPlayer = self.players.get(key)
+            if cachedPlayer is None or now - cachedPlayer.loaded_at >= self.TTL:
+                return None
+
+            self.players.move_to_end(key)
+            return cachedPlayer.player
+
+    def add(self, key: IdentityKey, player: Player) -> Player:
+        with self.lock:
+            self.drop(key)
+            self.players[key] = CachedPlayer(player, self.time_source())
+            self.keys[player.pk] = key
+            while len(self.players) > self.MAX_PLAYERS:
+                _, evictedPlayer = self.players.popitem(last=False)
+                self.keys.pop(evictedPlayer.player.pk, None)
+
+        return player
+
+    def drop(self, key: IdentityKey) -> None:
+        cachedPlayer = self.players.pop(key, None)
+        if cachedPlayer is not None:
+            self.keys.pop(cachedPlayer.player.pk, None)
+
+    def invalidate(self, *playerIds: int) -> None:
+        with self.lock:
+            for playerId in playerIds:
+                key = self.keys.pop(playerId, None)
+                if key is not None:
+                    self.players.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.players.clear()
+            self.keys.clear()
+
+
+def identity_key(user: User | AnonymousUser, session: SessionBase) -> IdentityKey:
+    if isinstance(user, User):
+        return ("user", user.pk)
+
+    sessionKey = session_identity(session)
+    if not sessionKey:
+        raise ValueError("Session key is missing")
+    return ("session", sessionKey)
+
+
+def has_identity(user: User | AnonymousUser, session: SessionBase) -> bool:
+    """Whether the visitor is logged in or has a session, a visitor without either has no player yet"""
+    return isinstance(user, User) or session_identity(session) is not None
+
+
+PLAYER_IDENTITIES = IdentityResolver()
+"""Players of the recently connected users and sessions of this process"""
+
+
+def get_scope_player(scope: dict[str, Any]) -> Player:
+    """Gets or creates the Player of the websocket connection, either by the logged-in user or the session"""
+    return PLAYER_IDENTITIES.get_player(scope["user"], scope["session"])
+
+
+async def aget_scope_player(scope: dict[str, Any]) -> Player:
+    """
+    Async version of `get_scope_player`
+    - A player of a recently connected user or session is resolved on the event loop, only the others are loaded
+      in the database worker thread
+    """
+    player = PLAYER_IDENTITIES.get_cached_player(identity_key(scope["user"], scope["session"]))
+    if player is not None:
+        return player
+    return await in_db_thread(get_scope_player, scope)
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import time
+
+TimeS = float
+
+
+class RttEstimator:
+    """
+    Round-trip time of a websocket connection, measured with pings sent by the server.
+    - Smoothed like TCP's SRTT, so that a single delayed pong barely moves the estimate
+    - Only pongs of pings that were sent over this connection and not answered yet are counted
+    """
+
+    ALPHA = 0.125
+    MAX_PENDING_PINGS = 8
+
+    def __init__(self) -> None:
+        self.rtt: TimeS | None = None
+        self.pending_pings: dict[int, TimeS] = {}
+        self.next_ping_id = 0
+
+    def ping(self) -> int:
+        """Registers a ping that is about to be sent, returns its ID"""
+        pingId = self.next_ping_id
+        self.next_ping_id += 1
+
+        self.pending_pings[pingId] = time.monotonic()
+        self.pending_pings.pop(pingId - self.MAX_PENDING_PINGS, None)
+        return pingId
+
+    def pong(self, pingId: int) -> TimeS | None:
+        """Adds the round trip of the answered ping to the estimate, returns the new estimate"""
+        sentAt = self.pending_pings.pop(pingId, None)
+        if sentAt is None:
+            return self.rtt
+
+        self.add_sample(time.monotonic() - sentAt)
+        return self.rtt
+
+    def add_sample(self, rtt: TimeS) -> None:
+        self.rtt = rtt if self.rtt is None else (1 - self.ALPHA) * self.rtt + self.ALPHA * rtt
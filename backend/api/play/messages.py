@@ -0,0 +1,12 @@
+"""Schemas of the fixed messages sent over the game websockets, to the players and to the spectators"""
+
+from ..serialization import MessageSchema
+
+GAME_FOUND_MESSAGE = MessageSchema("game_found", game_id=str)
+GAME_STARTED_MESSAGE = MessageSchema("game_started", seq=int, players=dict)
+MOVE_MESSAGE = MessageSchema("move", seq=int, move=str, ply=int, white_time=int, black_time=int)
+GAME_RESULT_MESSAGE = MessageSchema("game_result", seq=int, termination=str, winner=str)
+OFFER_DRAW_MESSAGE = MessageSchema("offer_draw", seq=int)
+PREMOVE_CANCELLED_MESSAGE = MessageSchema("premove_cancelled", seq=int)
+RESUME_MESSAGE = MessageSchema("resume", seq=int, white_time=int, black_time=int)
+PING_MESSAGE = MessageSchema("ping", ping_id=int)
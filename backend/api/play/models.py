@@ -8,6 +8,7 @@ from django.db.models import QuerySet
 from users.models import AnonymousSessionUser, User
 
 from .chess_board import CustomTermination
+from .move_encoding import decode_moves
 
 
 class GameTerminations(models.IntegerChoices):
@@ -50,13 +51,18 @@ class Player(models.Model):
     - Either has to be a regular logged-in user or an anonymous user.
     """
 
-    user: User | None = models.ForeignKey(User, null=True, on_delete=models.CASCADE)
-    anonymousUser: AnonymousSessionUser | None = models.ForeignKey(
-        AnonymousSessionUser, null=True, on_delete=models.CASCADE
-    )
+    user = models.ForeignKey(User, null=True, on_delete=models.CASCADE)
+    anonymousUser = models.ForeignKey(AnonymousSessionUser, null=True, on_delete=models.CASCADE)
 
     objects: models.Manager[Player]
 
+    class Meta:
+        # A user has a single player, `getOrCreatePlayerByUser` relies on these when two connects race to create it
+        constraints = [
+            models.UniqueConstraint(fields=["user"], name="player_unique_user"),
+            models.UniqueConstraint(fields=["anonymousUser"], name="player_unique_anonymous_user"),
+        ]
+
     def clean(self) -> None:
         userObjects = [self.user, self.anonymousUser]
         isValid = sum(item is not None for item in userObjects) == 1
@@ -70,46 +76,41 @@ class Player(models.Model):
 
     @staticmethod
     def getOrCreatePlayerByUser(user: User | AnonymousSessionUser) -> Player:
-        player = Player.getPlayerByUser(user)
-        if player:
-            return player
-
-        return Player.createAndSaveNewPlayer(user)
+        """Gets or creates the player of the user, the player created by a concurrent call is returned instead"""
+        players = Player.objects.select_related("user", "anonymousUser")
+        if isinstance(user, User):
+            return players.get_or_create(user=user)[0]
+        return players.get_or_create(anonymousUser=user)[0]
 
     @staticmethod
     def getPlayerByUser(user: User | AnonymousSessionUser) -> Player | None:
+        # The related users are selected as well, so that serializing the player never queries the database
+        players = Player.objects.select_related("user", "anonymousUser")
         if isinstance(user, User):
-            return Player.objects.filter(user=user).first()
-        return Player.objects.filter(anonymousUser=user).first()
-
-    @staticmethod
-    def createAndSaveNewPlayer(user: User | AnonymousSessionUser) -> Player:
-        player = Player(
-            user=user if isinstance(user, User) else None,
-            anonymousUser=user if isinstance(user, AnonymousSessionUser) else None,
-        )
-        player.save()
-
-        return player
+            return players.filter(user=user).first()
+        return players.filter(anonymousUser=user).first()
 
 
 class Game(models.Model):
     game_id = cast(int, models.AutoField(primary_key=True))
-    player_white: Player | None = models.ForeignKey(
-        Player, related_name="player_white", on_delete=models.SET_NULL, null=True
-    )
-    player_black: Player | None = models.ForeignKey(
-        Player, related_name="player_black", on_delete=models.SET_NULL, null=True
-    )
+    player_white = models.ForeignKey(Player, related_name="player_white", on_delete=models.SET_NULL, null=True)
+    player_black = models.ForeignKey(Player, related_name="player_black", on_delete=models.SET_NULL, null=True)
     termination = cast(int, models.IntegerField(choices=GameTerminations.choices))
     winner_color = cast(bool, models.BooleanField(null=True))
     time_control = cast(int, models.PositiveBigIntegerField())
     date = models.DateTimeField(auto_now_add=True)
+    encoded_moves = cast(bytes | None, models.BinaryField(null=True))
+    """Moves packed by `move_encoding.encode_moves`, `None` for old games whose moves are still kept as `Move` rows"""
 
     objects: models.Manager[Game]
 
     class Meta:
         get_latest_by = ["date"]
+        # Keyset pagination of the games of a player walks these backwards from the cursor
+        indexes = [
+            models.Index(fields=["player_white", "date", "game_id"], name="game_white_date_idx"),
+            models.Index(fields=["player_black", "date", "game_id"], name="game_black_date_idx"),
+        ]
 
     def __str__(self) -> str:
         return str(self.game_id)
@@ -118,8 +119,17 @@ class Game(models.Model):
     def getGamesByPlayer(player: Player) -> QuerySet[Game, Game]:
         return Game.objects.filter(models.Q(player_white=player) | models.Q(player_black=player))
 
+    def get_moves_list(self) -> list[str]:
+        """Returns the moves of the game in UCI notation"""
+        if self.encoded_moves is not None:
+            return decode_moves(bytes(self.encoded_moves))
+
+        return list(Move.objects.filter(game=self.game_id).order_by("order").values_list("move", flat=True))
+
 
 class Move(models.Model):
+    """Move of a game saved before the moves were encoded into `Game.encoded_moves`"""
+
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
     order = models.PositiveIntegerField()
     move = models.CharField(max_length=5)
@@ -132,3 +142,49 @@ class Move(models.Model):
 
     def __str__(self) -> str:
         return f"{self.game} - {self.order} - {self.move}"
+
+
+class Rating(models.Model):
+    """Glicko-2 rating of a player in one game mode"""
+
+    DEFAULT_RATING = 1500.0
+    DEFAULT_DEVIATION = 350.0
+    DEFAULT_VOLATILITY = 0.06
+
+    player = models.ForeignKey(Player, related_name="ratings", on_delete=models.CASCADE)
+    game_mode = models.CharField(max_length=16)
+    rating = cast(float, models.FloatField(default=DEFAULT_RATING))
+    deviation = cast(float, models.FloatField(default=DEFAULT_DEVIATION))
+    volatility = cast(float, models.FloatField(default=DEFAULT_VOLATILITY))
+    games = cast(int, models.PositiveIntegerField(default=0))
+
+    objects: models.Manager[Rating]
+
+    class Meta:
+        unique_together = ("player", "game_mode")
+
+    def __str__(self) -> str:
+        return f"{self.player} - {self.game_mode} - {round(self.rating)}"
+
+
+class PlayerStats(models.Model):
+    """
+    Aggregated statistics of a player, kept up to date when games finish and friendships change.
+    - Can be rebuilt from the games and friendships with the `rebuild_player_stats` management command
+    """
+
+    player = models.OneToOneField(Player, primary_key=True, related_name="stats", on_delete=models.CASCADE)
+    games = cast(int, models.PositiveIntegerField(default=0))
+    wins = cast(int, models.PositiveIntegerField(default=0))
+    losses = cast(int, models.PositiveIntegerField(default=0))
+    draws = cast(int, models.PositiveIntegerField(default=0))
+    modes = cast(dict[str, dict[str, int]], models.JSONField(default=dict))
+    """Wins, losses and draws in every game mode the player played, e.g. `{"Blitz": {"wins": 1, ...}}`"""
+    friends = cast(int, models.PositiveIntegerField(default=0))
+    friend_requests = cast(int, models.PositiveIntegerField(default=0))
+    """Pending friend requests received by the player"""
+
+    objects: models.Manager[PlayerStats]
+
+    def __str__(self) -> str:
+        return f"{self.player} - {self.games} games"
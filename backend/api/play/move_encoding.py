@@ -0,0 +1,41 @@
+"""
+Compact binary encoding of the move lists of the saved games.
+- Every move takes 2 bytes (little-endian): from square (6 bits), to square (6 bits) and promotion piece (4 bits)
+- Both directions go through lookup tables of all 20480 possible codes, so encoding and decoding don't parse UCI
+"""
+
+import struct
+
+import chess
+
+PROMOTION_PIECES = [None, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN]
+
+
+def _build_tables() -> tuple[list[str], dict[str, int]]:
+    decodeTable: list[str] = [""] * (len(PROMOTION_PIECES) << 12)
+    for promotionIndex, promotion in enumerate(PROMOTION_PIECES):
+        for fromSquare in chess.SQUARES:
+            for toSquare in chess.SQUARES:
+                code = fromSquare | toSquare << 6 | promotionIndex << 12
+                decodeTable[code] = chess.Move(fromSquare, toSquare, promotion).uci()
+
+    encodeTable = {uci: code for code, uci in enumerate(decodeTable)}
+    return decodeTable, encodeTable
+
+
+DECODE_TABLE, ENCODE_TABLE = _build_tables()
+
+
+def encode_moves(moves: list[str]) -> bytes:
+    """Encodes the moves in UCI notation, raises `ValueError` for a move that is not a valid UCI move"""
+    try:
+        codes = [ENCODE_TABLE[move] for move in moves]
+    except KeyError as error:
+        raise ValueError(f"Invalid UCI move: {error.args[0]}") from None
+
+    return struct.pack(f"<{len(codes)}H", *codes)
+
+
+def decode_moves(encoded: bytes) -> list[str]:
+    """Decodes the moves into UCI notation"""
+    return [DECODE_TABLE[code] for code in struct.unpack(f"<{len(encoded) // 2}H", encoded)]
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from typing import TypedDict
+
+from django.db import OperationalError, close_old_connections, transaction
+
+from ..utils import call_db
+from .models import Game as GameModel
+from .move_encoding import encode_moves
+from .ratings import RatedGame, apply_rating_updates
+from .stats import apply_game_stats
+
+logger = logging.getLogger(__name__)
+
+TimeS = float
+
+
+class FinishedGame(TypedDict):
+    """Record of a finished game waiting to be written to the database"""
+
+    white_id: int | None
+    black_id: int | None
+    game_mode: str
+    time_control: int
+    termination: int
+    """`GameTerminations` value of the result"""
+    winner: bool | None
+    moves: list[str]
+
+
+class PersistenceStats(TypedDict):
+    depth: int
+    """Finished games waiting to be written"""
+    written: int
+    batches: int
+    retries: int
+    failed: int
+    """Games that could not be written and were dropped"""
+    flush_latency_p50: TimeS | None
+    flush_latency_p99: TimeS | None
+
+
+def is_lock_contention(error: OperationalError) -> bool:
+    return "locked" in str(error) or "busy" in str(error)
+
+
+class GamePersistenceQueue:
+    """
+    Write-behind queue of the finished games, which keeps the database writes off the threads finishing the games.
+    - Once started, a worker thread writes the pending games every `FLUSH_INTERVAL` seconds, or sooner once
+      `BATCH_SIZE` games are pending, in one transaction together with their rating updates
+    - Batches failing on lock contention are retried with a backoff, other failures fall back to writing the games
+      one by one, so that a single broken record doesn't lose the whole batch
+    - Pending games are flushed when the worker is stopped, which also happens on interpreter shutdown
+    - Without a running worker (scripts and tests), the games are written right away through `call_db`
+    """
+
+    BATCH_SIZE = 200
+    FLUSH_INTERVAL: TimeS = 0.5
+    MAX_RETRIES = 5
+    RETRY_DELAY: TimeS = 0.05
+    LATENCIES_KEPT = 1000
+
+    def __init__(self) -> None:
+        self.pending: deque[FinishedGame] = deque()
+        self.writing: list[FinishedGame] = []
+        """Batch taken out of `pending` that is being written"""
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        """Keeps the batches written in order when `flush` is called outside of the worker"""
+        self.thread: threading.Thread | None = None
+        self.stopping = False
+
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.failed = 0
+        self.flush_latencies: deque[TimeS] = deque(maxlen=self.LATENCIES_KEPT)
+
+    def start(self) -> None:
+        with self.condition:
+            if self.thread is not None:
+                return
+
+            self.stopping = False
+            self.thread = threading.Thread(target=self._run, name="game-persistence", daemon=True)
+            self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Stops the worker and writes the games that are still pending"""
+        with self.condition:
+            thread = self.thread
+            self.stopping = True
+            self.condition.notify()
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def submit(self, game: FinishedGame) -> None:
+        with self.condition:
+            self.pending.append(game)
+            if self.thread is not None:
+                if len(self.pending) >= self.BATCH_SIZE:
+                    self.condition.notify()
+                return
+
+        call_db(self.flush)
+
+    def flush(self) -> int:
+        """Writes all pending games in the calling thread. Returns the number of written games."""
+        written = 0
+        with self.flush_lock:
+            while True:
+                with self.condition:
+                    batch = [self.pending.popleft() for _ in range(min(self.BATCH_SIZE, len(self.pending)))]
+                    self.writing = batch
+                if not batch:
+                    return written
+
+                start = time.perf_counter()
+                try:
+                    written += self.write_batch(batch)
+                finally:
+                    with self.condition:
+                        self.writing = []
+                        self.flush_latencies.append(time.perf_counter() - start)
+
+    def player_ids(self) -> set[int]:
+        """Returns the IDs of the players of the games that are not written yet, pending or being written"""
+        with self.condition:
+            games = [*self.pending, *self.writing]
+        return {playerId for game in games for playerId in (game["white_id"], game["black_id"]) if playerId is not None}
+
+    def write_batch(self, batch: list[FinishedGame]) -> int:
+        """Writes the batch, retrying on lock contention. Returns the number of written games."""
+        failure: Exception | None = None
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                self.write_games(batch)
+                with self.condition:
+                    self.written += len(batch)
+                    self.batches += 1
+                return len(batch)
+            except OperationalError as error:
+                failure = error
+                if not is_lock_contention(error) or attempt == self.MAX_RETRIES:
+                    break
+                with self.condition:
+                    self.retries += 1
+                time.sleep(self.RETRY_DELAY * 2**attempt)
+            except Exception as error:
+                failure = error
+                break
+
+        if len(batch) == 1:
+            logger.error("Failed to write a finished game, dropping it", exc_info=failure)
+            with self.condition:
+                self.failed += 1
+            return 0
+
+        logger.warning("Failed to write a batch of %d finished games, writing them one by one", len(batch))
+        return sum(self.write_batch([game]) for game in batch)
+
+    def write_games(self, batch: list[FinishedGame]) -> None:
+        """Writes the games with their encoded moves, and the rating and statistics updates in one transaction"""
+        with transaction.atomic():
+            GameModel.objects.bulk_create(
+                [
+                    GameModel(
+                        player_white_id=game["white_id"],
+                        player_black_id=game["black_id"],
+                        termination=game["termination"],
+                        winner_color=game["winner"],
+                        time_control=game["time_control"],
+                        encoded_moves=encode_moves(game["moves"]),
+                    )
+                    for game in batch
+                ]
+            )
+
+            ratedGames: list[RatedGame] = []
+            for game in batch:
+                whiteId, blackId = game["white_id"], game["black_id"]
+                if whiteId is not None and blackId is not None:
+                    ratedGames.append(
+                        {
+                            "white_id": whiteId,
+                            "black_id": blackId,
+                            "game_mode": game["game_mode"],
+                            "winner": game["winner"],
+                        }
+                    )
+            apply_rating_updates(ratedGames)
+            apply_game_stats(ratedGames)
+
+    def stats(self) -> PersistenceStats:
+        with self.condition:
+            latencies = sorted(self.flush_latencies)
+            return {
+                "depth": len(self.pending),
+                "written": self.written,
+                "batches": self.batches,
+                "retries": self.retries,
+                "failed": self.failed,
+                "flush_latency_p50": latencies[len(latencies) // 2] if latencies else None,
+                "flush_latency_p99": (
+                    latencies[min(len(latencies) * 99 // 100, len(latencies) - 1)] if latencies else None
+                ),
+            }
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                if not self.stopping and len(self.pending) < self.BATCH_SIZE:
+                    self.condition.wait(self.FLUSH_INTERVAL)
+                if self.stopping:
+                    self.thread = None
+                    return
+
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                logger.exception("Failed to write the finished games")
+
+
+GAME_PERSISTENCE = GamePersistenceQueue()
+"""Write-behind queue of the games finished in this process"""
@@ -1,16 +1,28 @@
-import threading
 import time
-from typing import Any, Callable, Iterable, Literal, NotRequired, TypedDict
+from typing import Callable, Iterable, Literal, NotRequired, TypedDict
 
 import chess
 from api.play.models import Player
-from api.play.utils import BasePlayerStatusDict, player_status_dict
+from api.play.utils import BasePlayerStatusDict, PlayerStatusDict, player_status_dict
 
 from .chess_board import get_opposite_color
+from .clock_scheduler import CLOCK_SCHEDULER, ScheduledDeadline
+from .game_store import PlayerSnapshot
 
 TimeS = float
 TimeMs = int
-APICallbackType = Callable[[str, Any], None]
+TimeNs = int
+
+NS_PER_S = 1_000_000_000
+NS_PER_MS = 1_000_000
+
+MAX_LAG_COMPENSATION: TimeS = 0.5
+"""Most of the network delay of one move that is not charged to the player's clock"""
+
+
+def seconds_to_ns(seconds: TimeS) -> TimeNs:
+    return round(seconds * NS_PER_S)
+
 
 UnknownPlayerType = Literal["UnknownPlayer"]
 UnknownPlayer: UnknownPlayerType = "UnknownPlayer"
@@ -23,6 +35,10 @@ class PlayerStatusDictUnion(BasePlayerStatusDict):
     status: NotRequired[str]
 
 
+class UnknownPlayerStatusDict(BasePlayerStatusDict):
+    user_type: Literal["unknown_player"]
+
+
 class PlayerSerializedDict(PlayerStatusDictUnion):
     time: TimeMs
 
@@ -33,65 +49,99 @@ class PlayersSerializedDict(TypedDict):
 
 
 class GamePlayer:
+    """
+    Player of a game with their clock.
+    - The clock is kept in integer nanoseconds of the monotonic clock, so that it neither jumps with the wall clock
+      nor accumulates rounding errors over long games
+    """
+
     def __init__(
         self,
         player: Player | UnknownPlayerType,
         color: chess.Color,
         time: TimeS,
+        increment: TimeS = 0,
+        delay: TimeS = 0,
     ):
         self.player = player
         self.color = color
-        self.time = time
+        self.time_ns: TimeNs = seconds_to_ns(time)
+        self.increment_ns: TimeNs = seconds_to_ns(increment)
+        self.delay_ns: TimeNs = seconds_to_ns(delay)
 
         self.joined = False
         self.offers_draw = False
-        self.timer: threading.Timer | None = None
-        self.timer_start: float | None = None
+        self.premove: chess.Move | None = None
+        self.rtt: TimeS | None = None
+        """Round-trip time of the player's connection, `None` until it is measured"""
+        self.timer: ScheduledDeadline | None = None
+        self.timer_start_ns: TimeNs | None = None
+        self.lag_compensation_ns: TimeNs = 0
+
+    def join_game(self) -> None:
+        """Joins the player to the game"""
+        self.joined = True
 
-    def api_callback(self, type: str, changed: Any | None = None) -> None:
-        """Calls the API callback"""
-        if self.joined:
-            self._api_callback(type, changed)
+    def get_current_time_ns(self) -> TimeNs:
+        """
+        Gets the current time left for the player, without the lag compensation of the running move.
+        - Never below 0, a move stopping the timer after the flag was due but before it fell leaves `time_ns` negative
+        """
+        if self.timer_start_ns is None:
+            return max(self.time_ns, 0)
 
-    def join_game(self, callback: APICallbackType) -> None:
-        """Joins the player to the game and adds an API callback"""
-        self.joined = True
-        self._api_callback = callback
+        elapsed = time.monotonic_ns() - self.timer_start_ns
+        return max(self.time_ns - max(elapsed - self.delay_ns, 0), 0)
 
     def get_current_time(self) -> TimeMs:
         """Gets the current time left for the player in milliseconds"""
-        if self.timer_start is None:
-            currentTime = self.time
-        else:
-            currentTime = self.time - (time.time() - self.timer_start)
+        return self.get_current_time_ns() // NS_PER_MS
+
+    def to_snapshot(self) -> PlayerSnapshot:
+        """Returns the snapshot of the player's state that is kept in the game store"""
+        return {
+            "player_id": None if isinstance(self.player, str) else self.player.pk,
+            "color": self.color,
+            "time": self.get_current_time_ns() / NS_PER_S,
+            "joined": self.joined,
+            "offers_draw": self.offers_draw,
+            "premove": self.premove.uci() if self.premove is not None else None,
+        }
 
-        return int(currentTime * 1000)
+    def get_lag_compensation_ns(self) -> TimeNs:
+        """
+        Time of the player's next move that is not charged to their clock.
+        - The opponent's move reaches the player half a round trip after the server sends it, and the player's move
+          reaches the server half a round trip after it is played, so one round trip, up to `MAX_LAG_COMPENSATION`
+        """
+        return seconds_to_ns(min(self.rtt or 0, MAX_LAG_COMPENSATION))
 
-    def out_of_time(self, ran_out_of_time: Callable[[chess.Color], None]) -> None:
+    def out_of_time(self, ran_out_of_time: Callable[[], None]) -> None:
         """Called when the player runs out of time"""
-        ran_out_of_time(self.color)
-        self.time = 0
-        self.timer_start = None
+        ran_out_of_time()
+        self.time_ns = 0
+        self.timer_start_ns = None
 
     def start_timer(self, ran_out_of_time: Callable[[], None]) -> None:
-        """Starts the player's timer"""
-        self.timer_start = time.time()
-
-        self.timer = threading.Timer(
-            self.time,
-            self.out_of_time,
-            (ran_out_of_time,),
-        )
-        self.timer.start()
-
-    def stop_timer(self) -> None:
-        """Stops the player's timer"""
-        if self.timer_start is None or self.timer is None:
+        """Starts the player's timer, the flag falls only once the delay and the lag compensation have run out too"""
+        self.timer_start_ns = time.monotonic_ns()
+        self.lag_compensation_ns = self.get_lag_compensation_ns()
+
+        flagFallIn = self.time_ns + self.delay_ns + self.lag_compensation_ns
+        self.timer = CLOCK_SCHEDULER.schedule(flagFallIn / NS_PER_S, lambda: self.out_of_time(ran_out_of_time))
+
+    def stop_timer(self, moved: bool = False) -> None:
+        """Stops the player's timer, the increment is added if it is stopped by the player's move"""
+        if self.timer_start_ns is None or self.timer is None:
             return
 
-        self.time -= time.time() - self.timer_start
+        elapsed = time.monotonic_ns() - self.timer_start_ns
+        self.time_ns -= max(elapsed - self.delay_ns - self.lag_compensation_ns, 0)
+        if moved:
+            self.time_ns += self.increment_ns
+
         self.timer.cancel()
-        self.timer_start = None
+        self.timer_start_ns = None
 
 
 class Players:
@@ -99,6 +149,8 @@ class Players:
 
     def __init__(self, players: list[GamePlayer]):
         self.gamePlayersDict = {player.player: player for player in players}
+        self.descriptors: dict[tuple[chess.Color, int | None], PlayerStatusDict] = {}
+        """Serialized players by their color and the primary key of the player they are relative to"""
 
     @property
     def gamePlayers(self) -> Iterable[GamePlayer]:
@@ -117,12 +169,12 @@ class Players:
         for player in self.gamePlayers:
             player.offers_draw = False
 
-    def join_game(self, player: Player, callback: APICallbackType) -> None:
+    def join_game(self, player: Player) -> None:
         """Joins the given player to the game. Replaces the UnknownPlayer if it exists"""
         if player not in self.gamePlayersDict and UnknownPlayer in self.gamePlayersDict:
             self.gamePlayersDict[player] = self.gamePlayersDict.pop(UnknownPlayer)
 
-        self.by_player(player).join_game(callback)
+        self.by_player(player).join_game()
 
     def get_opponent(self, player: Player) -> GamePlayer:
         """Gets the Player object for the opponent of the given player"""
@@ -152,22 +204,29 @@ class Players:
     def get_player_serialized_dict(
         self, gamePlayer: GamePlayer, relativeUserStatusToPlayer: Player | None
     ) -> PlayerSerializedDict:
-        """Returns a serialized representation of the given player. Adds remaining game time to each player.
+        """Returns a serialized representation of the given player with their remaining game time."""
+        return {
+            **self.get_player_descriptor(gamePlayer, relativeUserStatusToPlayer),
+            "time": gamePlayer.get_current_time(),
+        }
+
+    def get_player_descriptor(
+        self, gamePlayer: GamePlayer, relativeUserStatusToPlayer: Player | None
+    ) -> PlayerStatusDict | UnknownPlayerStatusDict:
+        """Returns the serialized player without their time, it is serialized once per game for each receiving player.
         - If the player is unknown, returns a dict with user_type "unknown_player"
         """
         isUnknownPlayer = gamePlayer.player is UnknownPlayer
         if isUnknownPlayer:
-            return {"user_type": "unknown_player", "time": gamePlayer.get_current_time()}
+            return {"user_type": "unknown_player"}
 
         assert not isinstance(gamePlayer.player, str)  # mypy type assertion
 
-        playerStatus = player_status_dict(gamePlayer.player, relativeUserStatusToPlayer=relativeUserStatusToPlayer)
-        if not playerStatus:
-            raise ValueError("Failed to get player status")
-
-        playerDict: PlayerSerializedDict = {
-            **playerStatus,
-            "time": gamePlayer.get_current_time(),
-        }
+        key = (gamePlayer.color, relativeUserStatusToPlayer.pk if relativeUserStatusToPlayer else None)
+        if key not in self.descriptors:
+            playerStatus = player_status_dict(gamePlayer.player, relativeUserStatusToPlayer=relativeUserStatusToPlayer)
+            if not playerStatus:
+                raise ValueError("Failed to get player status")
+            self.descriptors[key] = playerStatus
 
-        return playerDict
+        return self.descriptors[key]
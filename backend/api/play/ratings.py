@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import math
+from typing import Iterable, TypedDict
+
+from django.db import transaction
+
+from .models import Player, Rating
+
+GLICKO2_SCALE = 173.7178
+GLICKO2_TAU = 0.5
+"""Constrains the change of the volatility over time, reasonable values are between 0.3 and 1.2"""
+GLICKO2_EPSILON = 0.000001
+
+
+class Glicko2Rating:
+    def __init__(
+        self,
+        rating: float = Rating.DEFAULT_RATING,
+        deviation: float = Rating.DEFAULT_DEVIATION,
+        volatility: float = Rating.DEFAULT_VOLATILITY,
+    ):
+        self.rating = rating
+        self.deviation = deviation
+        self.volatility = volatility
+
+    @staticmethod
+    def from_model(rating: Rating) -> Glicko2Rating:
+        return Glicko2Rating(rating.rating, rating.deviation, rating.volatility)
+
+
+def glicko2_update(player: Glicko2Rating, results: list[tuple[Glicko2Rating, float]]) -> Glicko2Rating:
+    """
+    Rates the player after a rating period, following Glickman's "Example of the Glicko-2 system"
+
+    Parameters:
+        - results: The opponents' ratings before the period and the player's scores (1 win, 0.5 draw, 0 loss)
+    """
+    phi = player.deviation / GLICKO2_SCALE
+    if not results:
+        # Only the rating deviation increases for players that didn't play
+        return Glicko2Rating(player.rating, math.sqrt(phi**2 + player.volatility**2) * GLICKO2_SCALE, player.volatility)
+
+    mu = (player.rating - Rating.DEFAULT_RATING) / GLICKO2_SCALE
+
+    def g(opponentPhi: float) -> float:
+        return 1 / math.sqrt(1 + 3 * opponentPhi**2 / math.pi**2)
+
+    varianceInverse = 0.0
+    scoreSum = 0.0
+    for opponent, score in results:
+        opponentMu = (opponent.rating - Rating.DEFAULT_RATING) / GLICKO2_SCALE
+        gPhi = g(opponent.deviation / GLICKO2_SCALE)
+        expected = 1 / (1 + math.exp(-gPhi * (mu - opponentMu)))
+
+        varianceInverse += gPhi**2 * expected * (1 - expected)
+        scoreSum += gPhi * (score - expected)
+
+    variance = 1 / varianceInverse
+    delta = variance * scoreSum
+
+    # The new volatility is found with the Illinois algorithm
+    a = math.log(player.volatility**2)
+
+    def f(x: float) -> float:
+        return (
+            math.exp(x) * (delta**2 - phi**2 - variance - math.exp(x)) / (2 * (phi**2 + variance + math.exp(x)) ** 2)
+            - (x - a) / GLICKO2_TAU**2
+        )
+
+    lower = a
+    if delta**2 > phi**2 + variance:
+        upper = math.log(delta**2 - phi**2 - variance)
+    else:
+        k = 1
+        while f(a - k * GLICKO2_TAU) < 0:
+            k += 1
+        upper = a - k * GLICKO2_TAU
+
+    fLower, fUpper = f(lower), f(upper)
+    while abs(upper - lower) > GLICKO2_EPSILON:
+        new = lower + (lower - upper) * fLower / (fUpper - fLower)
+        fNew = f(new)
+        if fNew * fUpper <= 0:
+            lower, fLower = upper, fUpper
+        else:
+            fLower /= 2
+        upper, fUpper = new, fNew
+
+    volatility = math.exp(lower / 2)
+    newPhi = 1 / math.sqrt(1 / (phi**2 + volatility**2) + 1 / variance)
+    newMu = mu + newPhi**2 * scoreSum
+
+    return Glicko2Rating(
+        newMu * GLICKO2_SCALE + Rating.DEFAULT_RATING,
+        min(newPhi * GLICKO2_SCALE, Rating.DEFAULT_DEVIATION),
+        volatility,
+    )
+
+
+class RatedGame(TypedDict):
+    white_id: int
+    black_id: int
+    game_mode: str
+    winner: bool | None
+    """Color of the winner, `None` for a draw"""
+
+
+def apply_rating_updates(games: Iterable[RatedGame]) -> int:
+    """
+    Rates the finished games in one transaction, every game being a rating period of both players.
+    - Ratings of all players in the batch are loaded in one query and written back in two
+    - The games are applied in the given order, so a player can appear in more games of a batch
+
+    Returns the number of rated games.
+    """
+    games = list(games)
+    if not games:
+        return 0
+
+    playerIds = {game["white_id"] for game in games} | {game["black_id"] for game in games}
+    gameModes = {game["game_mode"] for game in games}
+
+    with transaction.atomic():
+        ratings = {
+            (rating.player_id, rating.game_mode): rating
+            for rating in Rating.objects.select_for_update().filter(player_id__in=playerIds, game_mode__in=gameModes)
+        }
+        created: dict[tuple[int, str], Rating] = {}
+
+        def get_rating(playerId: int, gameMode: str) -> Rating:
+            key = (playerId, gameMode)
+            if key not in ratings:
+                ratings[key] = created[key] = Rating(player_id=playerId, game_mode=gameMode)
+            return ratings[key]
+
+        for game in games:
+            white = get_rating(game["white_id"], game["game_mode"])
+            black = get_rating(game["black_id"], game["game_mode"])
+            whiteScore = 0.5 if game["winner"] is None else float(game["winner"])
+
+            whiteBefore, blackBefore = Glicko2Rating.from_model(white), Glicko2Rating.from_model(black)
+            for rating, newRating in (
+                (white, glicko2_update(whiteBefore, [(blackBefore, whiteScore)])),
+                (black, glicko2_update(blackBefore, [(whiteBefore, 1 - whiteScore)])),
+            ):
+                rating.rating, rating.deviation, rating.volatility = (
+                    newRating.rating,
+                    newRating.deviation,
+                    newRating.volatility,
+                )
+                rating.games += 1
+
+        Rating.objects.bulk_create(created.values())
+        Rating.objects.bulk_update(
+            [rating for key, rating in ratings.items() if key not in created],
+            ["rating", "deviation", "volatility", "games"],
+        )
+
+    return len(games)
+
+
+def get_rating(player: Player, game_mode: str) -> float:
+    """Returns the current rating of the player in the game mode"""
+    rating = Rating.objects.filter(player=player, game_mode=game_mode).values_list("rating", flat=True).first()
+    return rating if rating is not None else Rating.DEFAULT_RATING
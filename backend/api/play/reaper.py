@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+from importlib import import_module
+from typing import Any, Collection, TypedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.sessions.base_session import AbstractBaseSession
+from django.db import OperationalError, close_old_connections
+from django.db.models import Exists, OuterRef, QuerySet
+from django.utils import timezone
+from users.models import AnonymousSessionUser
+
+from .game import ALL_ACTIVE_GAMES_MANAGER
+from .models import Game
+from .persistence import GAME_PERSISTENCE, is_lock_contention
+
+logger = logging.getLogger(__name__)
+
+TimeS = float
+
+
+class ReapStats(TypedDict):
+    sessions: int
+    """Expired sessions deleted"""
+    anonymous_users: int
+    """Anonymous users deleted, together with their players"""
+    batches: int
+
+
+def get_session_model() -> type[AbstractBaseSession] | None:
+    """Model of the sessions when they are stored in the database, `None` for the other session engines"""
+    sessionStore: Any = import_module(settings.SESSION_ENGINE).SessionStore
+    if not hasattr(sessionStore, "get_model_class"):
+        return None
+
+    sessionModel: type[AbstractBaseSession] = sessionStore.get_model_class()
+    return sessionModel
+
+
+def stale_anonymous_users(now: datetime, keptPlayerIds: Collection[int]) -> QuerySet[AnonymousSessionUser]:
+    """Anonymous users whose session expired or was deleted, and whose player didn't play any saved game"""
+    sessionModel = get_session_model()
+    assert sessionModel is not None, "Sessions aren't stored in the database"
+
+    liveSessions = sessionModel.objects.filter(session_key=OuterRef("session_key"), expire_date__gt=now)
+    whiteGames = Game.objects.filter(player_white__anonymousUser=OuterRef("pk"))
+    blackGames = Game.objects.filter(player_black__anonymousUser=OuterRef("pk"))
+
+    staleUsers = AnonymousSessionUser.objects.filter(~Exists(liveSessions), ~Exists(whiteGames), ~Exists(blackGames))
+    return staleUsers.exclude(player__in=keptPlayerIds)
+
+
+class AnonymousUserReaper:
+    """
+    Deletes the expired sessions and the anonymous users left without a session or a game, along with their players.
+    - Rows are deleted in batches of `BATCH_SIZE`, each in its own short transaction with a pause of `BATCH_PAUSE`
+      seconds after it, so that the game writes waiting for the database are never held up for long
+    - Batches failing on lock contention with the game writes are retried with a backoff
+    - Every batch is checked again right before it is deleted, an anonymous user that got a session or a game since
+      it was selected is kept
+    - The players of the games in the game store are kept, as their games are not saved yet, and so are the players
+      of the finished games still waiting in the write-behind queue
+    - Once started, a worker thread reaps every `interval` seconds
+    - Anonymous users are only reaped when the sessions are stored in the database, other session stores can't tell
+      which sessions are gone. With any other session engine the worker thread refuses to start with a warning, and
+      `reap` raises `ImproperlyConfigured`
+    """
+
+    BATCH_SIZE = 500
+    BATCH_PAUSE: TimeS = 0.05
+    MAX_RETRIES = 5
+    RETRY_DELAY: TimeS = 0.05
+
+    def __init__(self) -> None:
+        self.condition = threading.Condition()
+        self.thread: threading.Thread | None = None
+        self.stopping = False
+
+    def start(self, interval: TimeS) -> None:
+        if get_session_model() is None:
+            logger.warning(
+                "The anonymous user reaper is not started, the %s session engine doesn't store the sessions in the "
+                "database",
+                settings.SESSION_ENGINE,
+            )
+            return
+
+        with self.condition:
+            if self.thread is not None:
+                return
+
+            self.stopping = False
+            self.thread = threading.Thread(
+                target=self._run, args=(interval,), name="anonymous-user-reaper", daemon=True
+            )
+            self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        with self.condition:
+            thread = self.thread
+            self.stopping = True
+            self.condition.notify()
+        if thread is not None:
+            thread.join()
+
+    def reap(self, now: datetime | None = None) -> ReapStats:
+        now = now or timezone.now()
+        stats: ReapStats = {"sessions": 0, "anonymous_users": 0, "batches": 0}
+
+        sessionModel = get_session_model()
+        if sessionModel is None:
+            raise ImproperlyConfigured(
+                f"Anonymous users can't be reaped, the {settings.SESSION_ENGINE} session engine doesn't store the "
+                "sessions in the database"
+            )
+
+        expiredSessions = sessionModel.objects.filter(expire_date__lte=now)
+        while sessionKeys := list(expiredSessions.values_list("pk", flat=True)[: self.BATCH_SIZE]):
+            stats["sessions"] += self.delete_batch(expiredSessions.filter(pk__in=sessionKeys))[0]
+            self.end_batch(stats)
+
+        # The finished games of this worker leave the game store before they are written
+        keptPlayerIds = ALL_ACTIVE_GAMES_MANAGER.store.player_ids() | GAME_PERSISTENCE.player_ids()
+        staleUsers = stale_anonymous_users(now, keptPlayerIds)
+        lastUserId = 0
+        while True:
+            userIds = list(
+                staleUsers.filter(pk__gt=lastUserId).order_by("pk").values_list("pk", flat=True)[: self.BATCH_SIZE]
+            )
+            if not userIds:
+                break
+
+            _, deleted = self.delete_batch(staleUsers.filter(pk__in=userIds))
+            stats["anonymous_users"] += deleted.get(AnonymousSessionUser._meta.label, 0)
+            lastUserId = userIds[-1]
+            self.end_batch(stats)
+
+        return stats
+
+    def delete_batch(self, batch: QuerySet[Any]) -> tuple[int, dict[str, int]]:
+        """
+        Deletes the batch in one transaction, retrying on lock contention.
+        - The rows are selected before the transaction starts, its first statement is then a write. SQLite fails a
+          transaction that read before writing when another one writes meanwhile, instead of waiting for it
+        """
+        attempt = 0
+        while True:
+            try:
+                return batch.delete()
+            except OperationalError as error:
+                if not is_lock_contention(error) or attempt == self.MAX_RETRIES:
+                    raise
+                time.sleep(self.RETRY_DELAY * 2**attempt)
+                attempt += 1
+
+    def end_batch(self, stats: ReapStats) -> None:
+        stats["batches"] += 1
+        if self.BATCH_PAUSE:
+            time.sleep(self.BATCH_PAUSE)
+
+    def _run(self, interval: TimeS) -> None:
+        while True:
+            with self.condition:
+                if not self.stopping:
+                    self.condition.wait(interval)
+                if self.stopping:
+                    self.thread = None
+                    return
+
+            try:
+                close_old_connections()
+                stats = self.reap()
+                logger.info("Reaped %d sessions and %d anonymous users", stats["sessions"], stats["anonymous_users"])
+            except Exception:
+                logger.exception("Failed to reap the stale anonymous users")
+
+
+ANONYMOUS_USER_REAPER = AnonymousUserReaper()
+"""Reaper of the stale anonymous users, started by the server when `ANONYMOUS_USER_REAP_INTERVAL` is set"""
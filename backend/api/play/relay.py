@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable
+
+from channels.exceptions import ChannelFull  # type: ignore
+from channels.generic.websocket import AsyncWebsocketConsumer  # type: ignore
+from channels.layers import get_channel_layer  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+TimeS = float
+AsgiMessage = dict[str, Any]
+AsgiApp = Callable[
+    [dict[str, Any], Callable[[], Awaitable[AsgiMessage]], Callable[[AsgiMessage], Awaitable[None]]], Awaitable[None]
+]
+
+ABNORMAL_CLOSE_CODE = 1006
+SERVER_ERROR_CLOSE_CODE = 1011
+
+
+def worker_channel(worker_id: str) -> str:
+    """Channel layer channel on which the worker receives the websockets relayed to it"""
+    return "relay." + re.sub(r"[^a-zA-Z0-9\-_.]", "_", worker_id)
+
+
+class RelayedConnection:
+    """Websocket connected to another worker, served by a consumer of this worker"""
+
+    def __init__(self, reply_channel: str) -> None:
+        self.reply_channel = reply_channel
+        """Channel of the consumer the player is connected to, the frames for the player are sent to it"""
+        self.inbox: asyncio.Queue[AsgiMessage] = asyncio.Queue()
+        self.heard_at = time.monotonic()
+
+
+class WorkerRelay:
+    """
+    Serves the player websockets that are connected to other workers, but belong to a game or a queue of this one.
+    - The consumer the player is connected to forwards the frames over the channel layer to `worker_channel` of this
+      worker. Every relayed websocket is served by a consumer of this worker, as if the player was connected here,
+      and the frames of that consumer are sent back to the channel of the forwarding consumer
+    - The forwarding consumers send a heartbeat every `HEARTBEAT_INTERVAL` seconds, websockets not heard of for
+      `HEARTBEAT_TIMEOUT` seconds are disconnected, e.g. after the forwarding worker crashed
+    - Frames of websockets this worker no longer serves are answered by closing them, the player then reconnects
+    """
+
+    HEARTBEAT_INTERVAL: TimeS = 5
+    HEARTBEAT_TIMEOUT: TimeS = 15
+    GONE_CLOSE_CODE = 4009
+    """The websocket is no longer served by this worker, the player reconnects"""
+
+    def __init__(self, worker_id: str) -> None:
+        self.channel = worker_channel(worker_id)
+        self.consumers: dict[str, AsgiApp] = {}
+        self.connections: dict[str, RelayedConnection] = {}
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    def start(self, consumers: dict[str, AsgiApp]) -> None:
+        """Serves the relayed websockets with the consumers on the running event loop, unless served already"""
+        loop = asyncio.get_running_loop()
+        if self.loop is loop:
+            return
+
+        self.loop = loop
+        self.consumers = consumers
+        self.connections = {}
+        self.channel_layer = get_channel_layer()
+        loop.create_task(self.serve())
+
+    async def serve(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self.loop is loop:
+            try:
+                message = await asyncio.wait_for(self.channel_layer.receive(self.channel), self.HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                try:
+                    await self.handle(message)
+                except Exception:
+                    logger.exception("Failed to handle a relayed websocket message")
+
+            self.disconnect_silent()
+
+    async def handle(self, message: AsgiMessage) -> None:
+        connectionId: str = message["connection"]
+        if message["type"] == "relay.connect":
+            newConnection = self.connections[connectionId] = RelayedConnection(connectionId)
+            newConnection.inbox.put_nowait({"type": "websocket.connect"})
+            asyncio.get_running_loop().create_task(self.run(newConnection, message["consumer"], message["scope"]))
+            return
+
+        connection = self.connections.get(connectionId)
+        if connection is None:
+            if message["type"] != "relay.disconnect":
+                await self.reply(connectionId, {"type": "relay.close", "code": self.GONE_CLOSE_CODE})
+            return
+
+        connection.heard_at = time.monotonic()
+        if message["type"] == "relay.receive":
+            connection.inbox.put_nowait({"type": "websocket.receive", "text": message["text"]})
+        elif message["type"] == "relay.disconnect":
+            self.disconnect(connection, message["code"])
+
+    async def run(self, connection: RelayedConnection, consumer: str, scope: dict[str, Any]) -> None:
+        """Runs the consumer of the relayed websocket until it is disconnected"""
+
+        async def send(message: AsgiMessage) -> None:
+            if message["type"] == "websocket.send":
+                await self.reply(connection.reply_channel, {"type": "relay.send", "text": message["text"]})
+            elif message["type"] == "websocket.close":
+                code = message.get("code", 1000)
+                await self.reply(connection.reply_channel, {"type": "relay.close", "code": code})
+                self.disconnect(connection, code)
+
+        try:
+            await self.consumers[consumer](scope, connection.inbox.get, send)
+        except Exception:
+            logger.exception("Consumer of a relayed websocket failed")
+        finally:
+            if self.connections.get(connection.reply_channel) is connection:
+                del self.connections[connection.reply_channel]
+                await self.reply(connection.reply_channel, {"type": "relay.close", "code": SERVER_ERROR_CLOSE_CODE})
+
+    async def reply(self, channel: str, message: AsgiMessage) -> None:
+        try:
+            await self.channel_layer.send(channel, message)
+        except ChannelFull:
+            logger.warning("Dropped a frame of a relayed websocket, the channel of its player is full")
+
+    def disconnect(self, connection: RelayedConnection, code: int) -> None:
+        if self.connections.get(connection.reply_channel) is connection:
+            del self.connections[connection.reply_channel]
+            connection.inbox.put_nowait({"type": "websocket.disconnect", "code": code})
+
+    def disconnect_silent(self) -> None:
+        now = time.monotonic()
+        for connection in list(self.connections.values()):
+            if now - connection.heard_at > self.HEARTBEAT_TIMEOUT:
+                self.disconnect(connection, ABNORMAL_CLOSE_CODE)
+
+
+class ForwardedConnection:
+    """
+    Websocket of a player connected to this worker, forwarded to the `WorkerRelay` of the worker it belongs to.
+    - Every frame of the player is forwarded, the frames for the player come back to the channel of the consumer as
+      `relay.send` and `relay.close` messages
+    - Before every heartbeat, `is_served` checks that the worker still serves the websocket, e.g. that it still owns
+      the game. The player is disconnected with `WorkerRelay.GONE_CLOSE_CODE` otherwise, and reconnects
+    """
+
+    def __init__(self, consumer: AsyncWebsocketConsumer, worker_id: str, is_served: Callable[[], Awaitable[bool]]):
+        self.consumer = consumer
+        self.channel = worker_channel(worker_id)
+        self.is_served = is_served
+        self.heartbeat_task: asyncio.Task[None] | None = None
+
+    async def open(self, consumer: str, scope: dict[str, Any], frame: str | None = None) -> None:
+        """Connects the websocket to the relay, served by its `consumer`, and forwards the first frame"""
+        self.heartbeat_task = asyncio.get_running_loop().create_task(self.heartbeat())
+        if await self.send({"type": "relay.connect", "consumer": consumer, "scope": scope}) and frame is not None:
+            await self.forward(frame)
+
+    async def forward(self, frame: str) -> None:
+        await self.send({"type": "relay.receive", "text": frame})
+
+    async def close(self, code: int) -> None:
+        """Disconnects the websocket from the relay, once the player disconnected"""
+        if self.heartbeat_task is not None and self.heartbeat_task is not asyncio.current_task():
+            self.heartbeat_task.cancel()
+        await self.send({"type": "relay.disconnect", "code": code}, closeOnFailure=False)
+
+    async def send(self, message: AsgiMessage, closeOnFailure: bool = True) -> bool:
+        """Sends the message to the relay, a relay that doesn't keep up, e.g. a crashed one, disconnects the player"""
+        try:
+            await self.consumer.channel_layer.send(self.channel, {**message, "connection": self.consumer.channel_name})
+            return True
+        except ChannelFull:
+            if closeOnFailure:
+                await self.consumer.close(code=WorkerRelay.GONE_CLOSE_CODE)
+            return False
+
+    async def heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(WorkerRelay.HEARTBEAT_INTERVAL)
+            try:
+                isServed = await self.is_served()
+            except Exception:
+                logger.exception("Failed to check the worker serving a forwarded websocket")
+                continue
+
+            if not isServed:
+                await self.consumer.close(code=WorkerRelay.GONE_CLOSE_CODE)
+                return
+            if not await self.send({"type": "relay.heartbeat"}):
+                return
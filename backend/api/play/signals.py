@@ -0,0 +1,41 @@
+from typing import Any
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ..friends.models import FriendRequest, Friendship
+from .identity import PLAYER_IDENTITIES
+from .models import Player
+from .stats import apply_friend_stats
+
+
+@receiver(post_save, sender=Friendship)
+def friendship_created(sender: type[Friendship], instance: Friendship, created: bool, **kwargs: Any) -> None:
+    if created:
+        apply_friend_stats([instance.user1_id, instance.user2_id], friends=1)
+
+
+@receiver(post_delete, sender=Friendship)
+def friendship_deleted(sender: type[Friendship], instance: Friendship, **kwargs: Any) -> None:
+    apply_friend_stats([instance.user1_id, instance.user2_id], friends=-1)
+
+
+@receiver(post_save, sender=FriendRequest)
+def friend_request_created(sender: type[FriendRequest], instance: FriendRequest, created: bool, **kwargs: Any) -> None:
+    if created:
+        apply_friend_stats([instance.toUser_id], friend_requests=1)
+
+
+@receiver(post_delete, sender=FriendRequest)
+def friend_request_deleted(sender: type[FriendRequest], instance: FriendRequest, **kwargs: Any) -> None:
+    apply_friend_stats([instance.toUser_id], friend_requests=-1)
+
+
+@receiver(post_delete, sender=Player)
+def player_deleted(sender: type[Player], instance: Player, **kwargs: Any) -> None:
+    # Dropped again once the transaction commits, so that a lookup made before the commit can't keep the player.
+    # The ID is taken now, the deleted instance loses it afterwards
+    playerId = instance.pk
+    PLAYER_IDENTITIES.invalidate(playerId)
+    transaction.on_commit(lambda: PLAYER_IDENTITIES.invalidate(playerId))
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import cast
+
+import chess
+from channels.generic.websocket import AsyncWebsocketConsumer  # type: ignore
+from channels.layers import get_channel_layer  # type: ignore
+
+from ..serialization import dumps
+from ..utils import in_db_thread
+from .chess_board import CHESS_COLOR_NAMES
+from .events import GameEvent, game_group_name
+from .game import ALL_ACTIVE_GAMES_MANAGER, GameStatus
+from .game_store import GameSnapshot
+from .messages import GAME_RESULT_MESSAGE, GAME_STARTED_MESSAGE, MOVE_MESSAGE
+from .models import Player
+from .players import PlayerSerializedDict, UnknownPlayerStatusDict
+from .utils import PlayerStatusDict, player_status_dict
+
+logger = logging.getLogger(__name__)
+
+PlayersDescriptors = dict[str, PlayerStatusDict | UnknownPlayerStatusDict]
+"""Serialized players of a game by their color name, without their times"""
+
+
+def get_players_descriptors(snapshot: GameSnapshot) -> PlayersDescriptors:
+    """Serializes the players of the game as anyone sees them, the players are loaded in one query"""
+    playerIds = [player["player_id"] for player in snapshot["players"] if player["player_id"] is not None]
+    players = Player.objects.select_related("user", "anonymousUser").in_bulk(playerIds)
+
+    descriptors: PlayersDescriptors = {}
+    for playerSnapshot in snapshot["players"]:
+        playerId = playerSnapshot["player_id"]
+        playerStatus = player_status_dict(players[playerId]) if playerId is not None else None
+        descriptors[CHESS_COLOR_NAMES[playerSnapshot["color"]]] = playerStatus or {"user_type": "unknown_player"}
+
+    return descriptors
+
+
+def get_snapshot_players(snapshot: GameSnapshot, descriptors: PlayersDescriptors) -> dict[str, PlayerSerializedDict]:
+    """Serialized players with their current times, the running clock is charged for the time since the snapshot"""
+    colorToMove = chess.WHITE if len(snapshot["moves"]) % 2 == 0 else chess.BLACK
+    isRunning = snapshot["status"] == GameStatus.IN_PROGRESS.name
+
+    players: dict[str, PlayerSerializedDict] = {}
+    for playerSnapshot in snapshot["players"]:
+        remainingTime = playerSnapshot["time"]
+        if isRunning and playerSnapshot["color"] == colorToMove:
+            remainingTime = max(remainingTime - (time.time() - snapshot["saved_at"]), 0)
+
+        color = CHESS_COLOR_NAMES[playerSnapshot["color"]]
+        players[color] = cast(PlayerSerializedDict, {**descriptors[color], "time": int(remainingTime * 1000)})
+
+    return players
+
+
+async def load_snapshot(game_id: str) -> GameSnapshot | None:
+    """Snapshot of the game, only the games owned by other workers are loaded from the game store"""
+    game = ALL_ACTIVE_GAMES_MANAGER.get_local_game(game_id)
+    if game is not None:
+        return game.to_snapshot()
+    return await in_db_thread(ALL_ACTIVE_GAMES_MANAGER.store.load, game_id)
+
+
+class Spectator:
+    """Websocket of a spectator, the frames are held back until the snapshot of the game is sent to it"""
+
+    def __init__(self, consumer: AsyncWebsocketConsumer):
+        self.consumer = consumer
+        self.ply: int | None = None
+        """Number of moves of the snapshot sent to the spectator, `None` until it is sent"""
+        self.pending: list[tuple[int | None, str]] = []
+        """Frames received before the snapshot was sent, with the ply of their move"""
+
+    async def send(self, ply: int | None, frame: str) -> None:
+        """Sends the frame, unless it is a move the spectator's snapshot already contains"""
+        assert self.ply is not None
+
+        if ply is None or ply > self.ply:
+            await self.consumer.send(text_data=frame)
+
+
+class SpectatedGame:
+    """
+    Spectators of a game connected to this worker.
+    - The game's events are received once through a single channel, whatever the number of spectators
+    - Every event is encoded into a frame once, the same frame is sent to all the spectators
+    """
+
+    def __init__(self, game_id: str) -> None:
+        self.game_id = game_id
+        self.spectators: set[Spectator] = set()
+        self.descriptors: PlayersDescriptors | None = None
+        self.relay_task: asyncio.Task[None] | None = None
+        self.subscribed = asyncio.get_running_loop().create_task(self.subscribe())
+        """Completes once the game's events are received, a snapshot taken afterwards misses none of them"""
+
+    async def subscribe(self) -> None:
+        self.channel_layer = get_channel_layer()
+        self.channel_name: str = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(game_group_name(self.game_id), self.channel_name)
+        self.relay_task = asyncio.get_running_loop().create_task(self.relay())
+
+    async def unsubscribe(self) -> None:
+        if self.relay_task is not None and self.relay_task is not asyncio.current_task():
+            self.relay_task.cancel()
+        await self.subscribed
+        await self.channel_layer.group_discard(game_group_name(self.game_id), self.channel_name)
+
+    async def get_descriptors(self, snapshot: GameSnapshot, reload: bool = False) -> PlayersDescriptors:
+        """Serialized players of the game, they are loaded once for all the spectators"""
+        if self.descriptors is None or reload:
+            self.descriptors = await in_db_thread(get_players_descriptors, snapshot)
+        return self.descriptors
+
+    async def send_snapshot(self, spectator: Spectator, snapshot: GameSnapshot) -> None:
+        """Sends the snapshot to the spectator, followed by the frames that came in meanwhile"""
+        players = get_snapshot_players(snapshot, await self.get_descriptors(snapshot))
+        spectating = {
+            "type": "spectate",
+            "players": players,
+            "moves": snapshot["moves"],
+            "game_started": snapshot["status"] == GameStatus.IN_PROGRESS.name,
+        }
+        await spectator.consumer.send(text_data=dumps(spectating))
+
+        spectator.ply = len(snapshot["moves"])
+        while spectator.pending:
+            await spectator.send(*spectator.pending.pop(0))
+
+    async def broadcast(self, ply: int | None, frame: str) -> None:
+        for spectator in list(self.spectators):
+            if spectator.ply is None:
+                spectator.pending.append((ply, frame))
+                continue
+
+            try:
+                await spectator.send(ply, frame)
+            except Exception:
+                logger.exception("Failed to send a frame to a spectator")
+
+    async def relay(self) -> None:
+        """Relays the game's events to the spectators until the game ends"""
+        while True:
+            message = await self.channel_layer.receive(self.channel_name)
+            event: GameEvent = message["event"]
+
+            if event["type"] == "move":
+                frame = MOVE_MESSAGE.encode(
+                    seq=event["seq"],
+                    move=event["move"],
+                    ply=event["ply"],
+                    white_time=event["white_time"],
+                    black_time=event["black_time"],
+                )
+                await self.broadcast(event["ply"], frame)
+            elif event["type"] == "game_started":
+                # The unknown player of a link game is known once the game starts
+                snapshot = await load_snapshot(self.game_id)
+                if snapshot is not None:
+                    players = get_snapshot_players(snapshot, await self.get_descriptors(snapshot, reload=True))
+                    await self.broadcast(None, GAME_STARTED_MESSAGE.encode(seq=event["seq"], players=players))
+            elif event["type"] == "game_result":
+                frame = GAME_RESULT_MESSAGE.encode(
+                    seq=event["seq"], termination=event["termination"], winner=event["winner"]
+                )
+                await self.broadcast(None, frame)
+                await SPECTATORS.close_game(self)
+                return
+
+
+class SpectatorHub:
+    """Spectated games of this worker, a game is subscribed to while it has spectators connected to this worker"""
+
+    def __init__(self) -> None:
+        self.games: dict[str, SpectatedGame] = {}
+
+    async def add_spectator(self, game_id: str, spectator: Spectator) -> bool:
+        """Subscribes the spectator to the game and sends it the snapshot, returns `False` if there is no such game"""
+        spectatedGame = self.games.get(game_id)
+        if spectatedGame is None:
+            spectatedGame = self.games[game_id] = SpectatedGame(game_id)
+        spectatedGame.spectators.add(spectator)
+        await asyncio.shield(spectatedGame.subscribed)
+
+        snapshot = await load_snapshot(game_id)
+        if snapshot is None:
+            await self.remove_spectator(game_id, spectator)
+            return False
+
+        await spectatedGame.send_snapshot(spectator, snapshot)
+        return True
+
+    async def remove_spectator(self, game_id: str, spectator: Spectator) -> None:
+        spectatedGame = self.games.get(game_id)
+        if spectatedGame is None:
+            return
+
+        spectatedGame.spectators.discard(spectator)
+        if not spectatedGame.spectators:
+            await self.close_game(spectatedGame)
+
+    async def close_game(self, spectatedGame: SpectatedGame) -> None:
+        """Unsubscribes from the game and disconnects its remaining spectators"""
+        if self.games.get(spectatedGame.game_id) is spectatedGame:
+            del self.games[spectatedGame.game_id]
+        await spectatedGame.unsubscribe()
+
+        spectators, spectatedGame.spectators = spectatedGame.spectators, set()
+        for spectator in spectators:
+            await spectator.consumer.close()
+
+
+SPECTATORS = SpectatorHub()
+"""Spectated games of all the spectators connected to this worker"""
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from typing import Collection, Iterable, Literal
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from users.models import User
+
+from ..friends.models import FriendRequest, Friendship
+from .game_modes import get_game_mode_by_time_control
+from .models import Game, Player, PlayerStats
+from .ratings import RatedGame
+
+GameScore = Literal["wins", "losses", "draws"]
+
+STATS_FIELDS = ["games", "wins", "losses", "draws", "modes", "friends", "friend_requests"]
+
+
+def get_score(color: bool, winner: bool | None) -> GameScore:
+    if winner is None:
+        return "draws"
+    return "wins" if winner == color else "losses"
+
+
+def add_game(stats: PlayerStats, gameMode: str | None, score: GameScore, count: int = 1) -> None:
+    stats.games += count
+    setattr(stats, score, getattr(stats, score) + count)
+    if gameMode is not None:
+        modeStats = stats.modes.setdefault(gameMode, {"wins": 0, "losses": 0, "draws": 0})
+        modeStats[score] += count
+
+
+def build_player_stats(playerIds: Collection[int]) -> dict[int, PlayerStats]:
+    """Computes the statistics of the players from their games and friendships in a fixed number of queries, unsaved"""
+    stats = {playerId: PlayerStats(player_id=playerId) for playerId in playerIds}
+    if not playerIds:
+        return stats
+
+    for colorField, color in (("player_white_id", True), ("player_black_id", False)):
+        gameCounts = (
+            Game.objects.filter(**{f"{colorField}__in": playerIds})
+            .values_list(colorField, "time_control", "winner_color")
+            .annotate(count=Count("game_id"))
+            .order_by()
+        )
+        for playerId, timeControl, winner, count in gameCounts:
+            gameMode = get_game_mode_by_time_control(timeControl)
+            add_game(stats[playerId], gameMode.name if gameMode else None, get_score(color, winner), count)
+
+    playerIdsByUser = dict(
+        Player.objects.filter(pk__in=playerIds, user__isnull=False).values_list("user_id", "pk").order_by()
+    )
+    for userField in ("user1_id", "user2_id"):
+        friendCounts = (
+            Friendship.objects.filter(**{f"{userField}__in": playerIdsByUser})
+            .values_list(userField)
+            .annotate(count=Count("friend_id"))
+            .order_by()
+        )
+        for userId, count in friendCounts:
+            stats[playerIdsByUser[userId]].friends += count
+
+    requestCounts = (
+        FriendRequest.objects.filter(toUser_id__in=playerIdsByUser)
+        .values_list("toUser_id")
+        .annotate(count=Count("friend_request_id"))
+        .order_by()
+    )
+    for userId, count in requestCounts:
+        stats[playerIdsByUser[userId]].friend_requests = count
+
+    return stats
+
+
+def rebuild_player_stats(playerIds: Collection[int]) -> None:
+    """Computes the statistics of the players from their games and friendships and saves them"""
+    if not playerIds:
+        return
+
+    PlayerStats.objects.bulk_create(
+        build_player_stats(playerIds).values(),
+        update_conflicts=True,
+        unique_fields=["player"],
+        update_fields=STATS_FIELDS,
+    )
+
+
+def apply_game_stats(games: Iterable[RatedGame]) -> None:
+    """
+    Adds the finished games to the statistics of their players, called in the transaction that saves the games.
+    - Players without statistics yet are rebuilt from all their games instead, which already include these games
+    """
+    games = list(games)
+    playerIds = {game["white_id"] for game in games} | {game["black_id"] for game in games}
+    if not playerIds:
+        return
+
+    with transaction.atomic():
+        stats = {
+            stats.player_id: stats for stats in PlayerStats.objects.select_for_update().filter(player_id__in=playerIds)
+        }
+        for game in games:
+            for playerId, color in ((game["white_id"], True), (game["black_id"], False)):
+                if playerId in stats:
+                    add_game(stats[playerId], game["game_mode"], get_score(color, game["winner"]))
+
+        PlayerStats.objects.bulk_update(stats.values(), ["games", "wins", "losses", "draws", "modes"])
+        rebuild_player_stats(playerIds - stats.keys())
+
+
+def apply_friend_stats(userIds: Iterable[int], friends: int = 0, friend_requests: int = 0) -> None:
+    """
+    Changes the friend counters of the players of the users.
+    - Only existing statistics are updated, missing ones are built with the change once they are needed
+    """
+    PlayerStats.objects.filter(player__user_id__in=list(userIds)).update(
+        friends=Greatest(F("friends") + friends, 0),
+        friend_requests=Greatest(F("friend_requests") + friend_requests, 0),
+    )
+
+
+def get_user_stats(username: str) -> PlayerStats | None:
+    """
+    Returns the statistics of the user's player, with the player and the user selected in the same query.
+    - Statistics that are missing are computed without being saved, the lookup never writes
+    - A user who never played has no player yet, their statistics are returned with an unsaved player and no games
+    - Returns `None` if the user does not exist
+    """
+    stats = PlayerStats.objects.select_related("player__user").filter(player__user__username=username).first()
+    if stats is not None:
+        return stats
+
+    user = User.objects.filter(username=username).first()
+    if user is None:
+        return None
+
+    player = Player.objects.filter(user=user).first()
+    if player is None:
+        return PlayerStats(
+            player=Player(user=user),
+            friends=Friendship.objects.filter(Q(user1=user) | Q(user2=user)).count(),
+            friend_requests=FriendRequest.objects.filter(toUser=user).count(),
+        )
+
+    player.user = user
+    stats = build_player_stats([player.pk])[player.pk]
+    stats.player = player
+    return stats
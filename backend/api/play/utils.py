@@ -1,10 +1,19 @@
+import binascii
+import heapq
+import uuid
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from itertools import groupby, islice
 from typing import Any, Literal, NotRequired, TypedDict
 
 from django.contrib.sessions.backends.base import SessionBase
+from django.contrib.sessions.backends.signed_cookies import SessionStore as SignedCookieSessionStore
+from django.db.models import Q
 from users.models import AnonymousSessionUser, User
 
-from ..friends.friends import getFriendStatus
+from ..friends.friends import FriendStatus, getFriendStatus, getFriendStatuses
 from .models import COLORS, TERMINATIONS, Game, GameTerminations, Move, Player
+from .move_encoding import decode_moves
 
 
 class BasePlayerStatusDict(TypedDict):
@@ -25,22 +34,100 @@ class AnonymousUserStatusDict(BasePlayerStatusDict):
 PlayerStatusDict = RegularUserStatusDict | AnonymousUserStatusDict
 
 
+ANONYMOUS_ID_SESSION_KEY = "anonymous_id"
+"""Session entry with the random ID of the anonymous player of a signed cookie session"""
+
+
+def session_identity(session: SessionBase) -> str | None:
+    """
+    Key of the anonymous player of the session, `None` until the session is created by `ensure_session_identity`.
+    - Sessions stored on the server are identified by their session key
+    - The key of a signed cookie session is the cookie itself, which changes with the session data, the random ID
+      stored in the session is used instead
+    """
+    if isinstance(session, SignedCookieSessionStore):
+        anonymousId: str | None = session.get(ANONYMOUS_ID_SESSION_KEY)
+        return anonymousId
+    return session.session_key
+
+
+def ensure_session_identity(session: SessionBase) -> str:
+    """Creates the session of a new visitor, only done once the visitor needs an identity to play"""
+    if isinstance(session, SignedCookieSessionStore):
+        session.setdefault(ANONYMOUS_ID_SESSION_KEY, uuid.uuid4().hex)
+    elif not session.session_key:
+        session.create()
+
+    identity = session_identity(session)
+    assert identity is not None
+    return identity
+
+
 def handleGetAnonymousSessionUser(session: SessionBase) -> AnonymousSessionUser:
-    sessionKey = session.session_key
+    sessionKey = session_identity(session)
     if not sessionKey:
         raise ValueError("Session key is missing")
 
-    existingAnonymousUser = AnonymousSessionUser.objects.filter(session_key=sessionKey).first()
-    if existingAnonymousUser:
-        return existingAnonymousUser
+    # The session key is unique, a concurrent request of the same session can't create a second user
+    anonymousUser, _ = AnonymousSessionUser.objects.get_or_create(session_key=sessionKey)
+    return anonymousUser
 
-    return AnonymousSessionUser.objects.create(session_key=sessionKey)
+
+GAME_PLAYERS_RELATED = (
+    "player_white__user",
+    "player_white__anonymousUser",
+    "player_black__user",
+    "player_black__anonymousUser",
+)
+"""Relations selected with the games, so that serializing the players never queries the database"""
 
 
 def game_to_dict(
     game: Game, include_moves: bool = True, relativeUserStatusToPlayer: Player | None = None
 ) -> dict[str, Any]:
     """Returns a dictionary representation of the given game."""
+    return games_to_dicts([game], include_moves, relativeUserStatusToPlayer)[0]
+
+
+def games_to_dicts(
+    games: list[Game], include_moves: bool = True, relativeUserStatusToPlayer: Player | None = None
+) -> list[dict[str, Any]]:
+    """
+    Returns dictionary representations of the given games in a fixed number of queries.
+    - The players and their users should be selected with the games, see `GAME_PLAYERS_RELATED`
+    - Moves of the games that are not encoded yet are loaded in one query
+    - Friend statuses of all registered opponents are loaded in two queries
+    """
+    movesByGame: dict[int, list[str]] = {}
+    if include_moves:
+        legacyGameIds = [game.game_id for game in games if game.encoded_moves is None]
+        legacyMoves = (
+            Move.objects.filter(game_id__in=legacyGameIds).order_by("game_id", "order").values_list("game_id", "move")
+            if legacyGameIds
+            else []
+        )
+        for gameId, gameMoves in groupby(legacyMoves, lambda row: row[0]):
+            movesByGame[gameId] = [move for _, move in gameMoves]
+
+    friendStatuses: dict[int, FriendStatus] = {}
+    relativeUser = relativeUserStatusToPlayer.user if relativeUserStatusToPlayer else None
+    if relativeUser:
+        users = [player.user for game in games for player in (game.player_white, game.player_black) if player]
+        friendStatuses = getFriendStatuses(relativeUser, [user for user in users if user is not None])
+
+    return [
+        loaded_game_to_dict(game, include_moves, relativeUserStatusToPlayer, movesByGame, friendStatuses)
+        for game in games
+    ]
+
+
+def loaded_game_to_dict(
+    game: Game,
+    include_moves: bool,
+    relativeUserStatusToPlayer: Player | None,
+    movesByGame: dict[int, list[str]],
+    friendStatuses: dict[int, FriendStatus],
+) -> dict[str, Any]:
     gameTermination = TERMINATIONS.get(GameTerminations(game.termination))
     if gameTermination is None:
         raise ValueError(f"Invalid game termination: {game.termination}")
@@ -48,13 +135,19 @@ def game_to_dict(
     return {
         "game_id": game.game_id,
         "players": {
-            "white": player_status_dict(game.player_white, relativeUserStatusToPlayer),
-            "black": player_status_dict(game.player_black, relativeUserStatusToPlayer),
+            "white": player_status_dict(game.player_white, relativeUserStatusToPlayer, friendStatuses),
+            "black": player_status_dict(game.player_black, relativeUserStatusToPlayer, friendStatuses),
         },
         "termination": gameTermination.name.lower(),
         "winner_color": COLORS.get(game.winner_color),
         **(
-            {"moves": [move.move for move in Move.objects.filter(game=game.game_id).order_by("order")]}
+            {
+                "moves": (
+                    decode_moves(bytes(game.encoded_moves))
+                    if game.encoded_moves is not None
+                    else movesByGame.get(game.game_id, [])
+                )
+            }
             if include_moves
             else {}
         ),
@@ -64,7 +157,9 @@ def game_to_dict(
 
 
 def player_status_dict(
-    player: Player | None, relativeUserStatusToPlayer: Player | None = None
+    player: Player | None,
+    relativeUserStatusToPlayer: Player | None = None,
+    friendStatuses: dict[int, FriendStatus] | None = None,
 ) -> PlayerStatusDict | None:
     """Returns a dictionary representation of the given player.
     - Either returns `None` if the player is not given
@@ -79,7 +174,7 @@ def player_status_dict(
     if not player.user:
         raise ValueError("Player must have a user or anonymousUser set.")
 
-    return get_regular_user_status_dict(player.user, relativeUserStatusToPlayer)
+    return get_regular_user_status_dict(player.user, relativeUserStatusToPlayer, friendStatuses)
 
 
 def get_anonymous_user_status_dict(
@@ -96,10 +191,12 @@ def get_anonymous_user_status_dict(
 def get_regular_user_status_dict(
     user: User,
     relativeUserStatusToPlayer: Player | None = None,
+    friendStatuses: dict[int, FriendStatus] | None = None,
 ) -> RegularUserStatusDict:
     """Returns a dictionary representation of the given user.
     - returns `is_current_user` when the `relativeUserStatusToPlayer` is set
-    - return `status` which stands for the friendship relation of the user to the given player
+    - return `status` which stands for the friendship relation of the user to the given player,
+      taken from `friendStatuses` when they were loaded in bulk
     """
     playerStatusDict: RegularUserStatusDict = {"user_type": "registered", "username": user.username}
 
@@ -116,14 +213,58 @@ def get_regular_user_status_dict(
 
     assert relativeUserStatusToPlayer.user  # mypy type assertion
 
-    status = getFriendStatus(relativeUserStatusToPlayer.user, user)
+    status = friendStatuses.get(user.pk) if friendStatuses is not None else None
+    if status is None:
+        status = getFriendStatus(relativeUserStatusToPlayer.user, user)
     playerStatusDict["status"] = status.value
 
     return playerStatusDict
 
 
-def get_player_games_json(player: Player, page: int, limit: int, include_moves: bool = True) -> list[dict[str, Any]]:
-    """Returns a list of games played by the player with the given username."""
+GamesCursor = tuple[datetime, int]
+"""Date and ID of the last game of a page, the next page starts with the games played before it"""
+
 
-    games = Game.getGamesByPlayer(player).order_by("-date")[limit * (page - 1) : min(limit * page, 2**63)]
-    return [game_to_dict(game, include_moves, relativeUserStatusToPlayer=player) for game in games]
+def encode_games_cursor(game: Game) -> str:
+    return urlsafe_b64encode(f"{game.date.isoformat()}|{game.game_id}".encode()).decode()
+
+
+def decode_games_cursor(cursor: str) -> GamesCursor:
+    """Raises `ValueError` for a malformed cursor"""
+    try:
+        date, gameId = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(date), int(gameId)
+    except (binascii.Error, UnicodeDecodeError) as error:
+        raise ValueError("Invalid cursor") from error
+
+
+def get_player_games_page(
+    player: Player, limit: int, cursor: GamesCursor | None = None, include_moves: bool = True
+) -> list[Game]:
+    """
+    Returns up to `limit` games of the player, the most recent first, played before the cursor.
+    - The white and black games are queried separately, so both queries walk their (player, date, game_id) index
+      from the cursor, and are merged in Python. The cost doesn't depend on how deep the page is
+    """
+    pages = []
+    for colorFilter in ("player_white", "player_black"):
+        games = Game.objects.filter(**{colorFilter: player}).select_related(*GAME_PLAYERS_RELATED)
+        if cursor is not None:
+            date, gameId = cursor
+            games = games.filter(date__lte=date).filter(Q(date__lt=date) | Q(game_id__lt=gameId))
+        if not include_moves:
+            games = games.defer("encoded_moves")
+        pages.append(games.order_by("-date", "-game_id")[:limit])
+
+    merged = heapq.merge(*pages, key=lambda game: (game.date, game.game_id), reverse=True)
+    return list(islice(merged, limit))
+
+
+def get_player_games_json(
+    player: Player, limit: int, cursor: GamesCursor | None = None, include_moves: bool = True
+) -> tuple[list[dict[str, Any]], str | None]:
+    """Returns a page of games played by the player, and the cursor of the next page if there may be one."""
+    games = get_player_games_page(player, limit, cursor, include_moves)
+
+    nextCursor = encode_games_cursor(games[-1]) if len(games) == limit else None
+    return games_to_dicts(games, include_moves, relativeUserStatusToPlayer=player), nextCursor
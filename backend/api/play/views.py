@@ -1,15 +1,30 @@
-from django.http import JsonResponse
 from rest_framework.request import Request
 from rest_framework.views import APIView
 from users.models import User
 
 from ..play.players import UnknownPlayer
+from ..serialization import JsonResponse
 from ..utils import string_to_int_range
 from . import serializers as s
 from .game import ALL_ACTIVE_GAMES_MANAGER
 from .game_queue import GROUP_QUEUE_MANAGER
+from .identity import PLAYER_IDENTITIES, has_identity
 from .models import Game, Player
-from .utils import game_to_dict, get_player_games_json, handleGetAnonymousSessionUser
+from .utils import (
+    GAME_PLAYERS_RELATED,
+    decode_games_cursor,
+    ensure_session_identity,
+    game_to_dict,
+    get_player_games_json,
+)
+
+
+class Identity(APIView):
+    """Creates the session of a new visitor, which the game websockets identify the visitor's player by"""
+
+    def post(self, request: Request) -> JsonResponse:
+        ensure_session_identity(request.session)
+        return JsonResponse({"message": "OK"}, status=200)
 
 
 class CreateLink(APIView):
@@ -23,12 +38,11 @@ class CreateLink(APIView):
 
         queue_manager = GROUP_QUEUE_MANAGER.default
         gameQueue = queue_manager.get_game_queue(game_mode, time_control)
-        if not gameQueue:
+        if gameQueue is None:
             return JsonResponse({"error": "Invalid game mode or time control"}, status=400)
 
-        maybeRequestUser = request.user if isinstance(request.user, User) else None
-        user = maybeRequestUser or handleGetAnonymousSessionUser(request.session)
-        player = Player.getOrCreatePlayerByUser(user)
+        ensure_session_identity(request.session)
+        player = PLAYER_IDENTITIES.get_player(request.user, request.session)
 
         players = (player, UnknownPlayer)
         game = ALL_ACTIVE_GAMES_MANAGER.start_game(players, gameQueue.game_mode, gameQueue.time_control, link_game=True)
@@ -39,14 +53,14 @@ class CreateLink(APIView):
 class GameAPI(APIView):
     def get(self, request: Request, game_id: int) -> JsonResponse:
         try:
-            game = Game.objects.get(game_id=game_id)
+            game = Game.objects.select_related(*GAME_PLAYERS_RELATED).get(game_id=game_id)
         except Game.DoesNotExist:
             return JsonResponse({"error": "No game found with the provided ID"}, status=404)
 
-        maybeRequestUser = request.user if isinstance(request.user, User) else None
-        user = maybeRequestUser or handleGetAnonymousSessionUser(request.session)
-
-        player = Player.getOrCreatePlayerByUser(user)
+        # The statuses are relative to the visitor's player, a visitor without a session isn't given one
+        player = None
+        if has_identity(request.user, request.session):
+            player = PLAYER_IDENTITIES.get_player(request.user, request.session)
         gameDict = game_to_dict(game, relativeUserStatusToPlayer=player)
 
         return JsonResponse(gameDict)
@@ -55,7 +69,10 @@ class GameAPI(APIView):
 class PlayerGames(APIView):
     def get(self, request: Request, username: str) -> JsonResponse:
         limit = string_to_int_range(request.query_params.get("limit"), default=10, min=1, max=100)
-        page = string_to_int_range(request.query_params.get("page"), default=1, min=1)
+        try:
+            cursor = decode_games_cursor(request.query_params["cursor"]) if "cursor" in request.query_params else None
+        except ValueError:
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
 
         user = User.objects.filter(username=username).first()
         if not user:
@@ -65,5 +82,5 @@ class PlayerGames(APIView):
         if not player:
             return JsonResponse({"error": "Player not found"}, status=404)
 
-        games = get_player_games_json(player, page, limit)
-        return JsonResponse({"games": games})
+        games, nextCursor = get_player_games_json(player, limit, cursor)
+        return JsonResponse({"games": games, "next_cursor": nextCursor})
@@ -0,0 +1,92 @@
+"""
+JSON encoding of the websocket messages and the REST responses.
+- Backed by orjson when it is installed, otherwise by the standard library. Both produce the same JSON apart from
+  whitespace, the values the JSON standard doesn't cover (dates, decimals, lazy strings) are encoded by Django's encoder
+- The fixed websocket messages are encoded by their `MessageSchema`
+"""
+
+import json
+from json.encoder import encode_basestring_ascii
+from typing import Any, Callable
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+
+    HAS_ORJSON = True
+except ImportError:  # pragma: no cover
+    HAS_ORJSON = False
+
+DJANGO_ENCODER = DjangoJSONEncoder(separators=(",", ":"))
+"""Encoder of the standard library backend, its `default` encodes the values orjson leaves to Django too"""
+
+if HAS_ORJSON:
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(data: Any) -> bytes:
+        return orjson.dumps(data, default=DJANGO_ENCODER.default, option=ORJSON_OPTIONS)
+
+    def dumps(data: Any) -> str:
+        return orjson.dumps(data, default=DJANGO_ENCODER.default, option=ORJSON_OPTIONS).decode()
+
+    def loads(data: str | bytes) -> Any:
+        return orjson.loads(data)
+
+else:  # pragma: no cover
+
+    def dumps_bytes(data: Any) -> bytes:
+        return DJANGO_ENCODER.encode(data).encode()
+
+    def dumps(data: Any) -> str:
+        return DJANGO_ENCODER.encode(data)
+
+    def loads(data: str | bytes) -> Any:
+        return json.loads(data)
+
+
+FIELD_ENCODERS: dict[type, Callable[[Any], str]] = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    bool: lambda value: "true" if value else "false",
+}
+"""Encoders of the typed message fields for the standard library backend, other types (`dict`, `object`) by `dumps`"""
+
+
+class MessageSchema:
+    """
+    Message of a fixed type with typed fields, e.g. `MessageSchema("move", move=str, ply=int)`.
+    - With orjson, the message is encoded as a whole once the fields are checked
+    - With the standard library, the message is compiled into a template with only the values left to be encoded
+    - A message without fields is encoded once
+    """
+
+    def __init__(self, type: str, **fields: type):
+        self.type = type
+        self.fields = fields
+        self.field_encoders = [(name, FIELD_ENCODERS.get(fieldType, dumps)) for name, fieldType in fields.items()]
+
+        # The field names are identifiers, only the type may need its "%" escaped in the template
+        head = f'{{"type":{encode_basestring_ascii(type)}'.replace("%", "%%")
+        self.template = head + "".join(f',"{name}":%s' for name in fields) + "}"
+        self.empty = dumps({"type": type})
+
+    def encode(self, **values: Any) -> str:
+        """Encodes the message, raises `ValueError` if the fields don't match the schema"""
+        if values.keys() != self.fields.keys():
+            raise ValueError(f"Message {self.type} has fields {list(self.fields)}, got {list(values)}")
+
+        if not values:
+            return self.empty
+        if HAS_ORJSON:
+            return dumps({"type": self.type, **values})
+        return self.template % tuple([encode(values[name]) for name, encode in self.field_encoders])
+
+
+class JsonResponse(HttpResponse):
+    """Same as `django.http.JsonResponse`, encoded by `dumps_bytes`"""
+
+    def __init__(self, data: Any, **kwargs: Any):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps_bytes(data), **kwargs)
@@ -1,5 +1,12 @@
+import asyncio
 import uuid
-from typing import Any
+from typing import Any, Callable, TypeVar
+
+from channels.db import database_sync_to_async  # type: ignore
+
+T = TypeVar("T")
+
+_background_db_tasks: set[asyncio.Task[object]] = set()
 
 
 def genUniqueID(collisionMap: dict[str, Any] = {}) -> str:
@@ -32,3 +39,31 @@ def string_to_int_range(value: str | None, default: int, min: int | None, max: i
         return max
 
     return numberValue
+
+
+async def in_db_thread(func: Callable[..., T], *args: Any) -> T:
+    """Runs the synchronous database function in the database worker thread, so that it doesn't block the event loop"""
+    result: T = await database_sync_to_async(func)(*args)
+    return result
+
+
+def call_db(func: Callable[..., object], *args: Any) -> None:
+    """
+    Calls the synchronous database function
+    - When called from a running event loop, the call is scheduled into the database worker thread instead
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        func(*args)
+        return
+
+    task = loop.create_task(in_db_thread(func, *args))
+    _background_db_tasks.add(task)
+    task.add_done_callback(_background_db_tasks.discard)
+
+
+async def wait_for_db_tasks() -> None:
+    """Waits until all database calls scheduled by `call_db` from the event loop are finished"""
+    while _background_db_tasks:
+        await asyncio.gather(*_background_db_tasks)
@@ -1,7 +1,8 @@
-from django.http import JsonResponse
 from rest_framework.request import Request
 from rest_framework.views import APIView
 
+from .serialization import JsonResponse
+
 
 class Invalid_Path(APIView):
     def get(self, request: Request) -> JsonResponse:
@@ -8,6 +8,7 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 """
 
 import os
+from typing import Any, Awaitable, Callable
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
@@ -24,9 +25,36 @@ def get_websocket_application() -> CookieMiddleware:
     return AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
 
 
-application = ProtocolTypeRouter(
-    {
-        "http": get_asgi_application(),
-        "websocket": get_websocket_application(),
-    }
+def start_background_workers() -> None:
+    from api.play.game import ALL_ACTIVE_GAMES_MANAGER
+    from api.play.persistence import GAME_PERSISTENCE
+    from api.play.reaper import ANONYMOUS_USER_REAPER
+    from django.conf import settings
+
+    GAME_PERSISTENCE.start()
+    ALL_ACTIVE_GAMES_MANAGER.writer.start()
+    if settings.ANONYMOUS_USER_REAP_INTERVAL:
+        ANONYMOUS_USER_REAPER.start(settings.ANONYMOUS_USER_REAP_INTERVAL)
+
+
+def serve_relayed_websockets(app: ProtocolTypeRouter) -> Callable[..., Awaitable[None]]:
+    """Starts serving the websockets relayed from the other workers on the server's event loop with the first request"""
+    from api.play.consumers import start_relay
+    from api.play.game import ALL_ACTIVE_GAMES_MANAGER
+
+    async def application(scope: Any, receive: Any, send: Any) -> None:
+        start_relay(ALL_ACTIVE_GAMES_MANAGER)
+        await app(scope, receive, send)
+
+    return application
+
+
+application = serve_relayed_websockets(
+    ProtocolTypeRouter(
+        {
+            "http": get_asgi_application(),
+            "websocket": get_websocket_application(),
+        }
+    )
 )
+start_background_workers()
@@ -51,10 +51,18 @@ INSTALLED_APPS = [
 
 ASGI_APPLICATION = "backend.asgi.application"
 
+# Game events are fanned out through the channel layer, the in-memory layer only works within a single process.
+# To run multiple server processes set a shared backend, e.g. `channels_redis.core.RedisChannelLayer`
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": os.environ.get("CHANNEL_LAYER_BACKEND", "channels.layers.InMemoryChannelLayer"),
+        **({"CONFIG": {"hosts": [os.environ["CHANNEL_LAYER_HOST"]]}} if "CHANNEL_LAYER_HOST" in os.environ else {}),
+    }
+}
+
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
-    "backend.middleware.EnsureSessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -97,6 +105,24 @@ DATABASES = {
     }
 }
 
+# State of the active games, the in-memory store only works within a single process.
+# `api.play.game_store.SQLiteGameStore` keeps the games in a local database shared by all workers on the machine
+GAME_STORE_BACKEND = os.environ.get("GAME_STORE_BACKEND", "api.play.game_store.InMemoryGameStore")
+GAME_STORE = {
+    "BACKEND": GAME_STORE_BACKEND,
+    "OPTIONS": {"path": os.path.join(db_dir, "game_store.sqlite3")} if "SQLite" in GAME_STORE_BACKEND else {},
+}
+
+# Sessions are created only once a visitor needs an identity to play, by `ensure_session_identity`.
+# "django.contrib.sessions.backends.signed_cookies" or "django.contrib.sessions.backends.cache" keep the sessions of the
+# anonymous players out of the database. Their anonymous users and players are then never reaped: the reaper can't tell
+# which sessions are gone, so it refuses to start with a warning and `reap_anonymous_users` fails
+SESSION_ENGINE = os.environ.get("SESSION_ENGINE", "django.contrib.sessions.backends.db")
+
+# Seconds between the runs of the in-process reaper of the expired sessions and stale anonymous users,
+# 0 leaves it to the `reap_anonymous_users` management command
+ANONYMOUS_USER_REAP_INTERVAL = float(os.environ.get("ANONYMOUS_USER_REAP_INTERVAL", 0))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -0,0 +1,102 @@
+"""
+Compares the latency of the game writes while the stale anonymous users are reaped in one transaction against the
+batched reaper.
+
+A writer thread saves a game every few milliseconds, the way the game persistence queue does, while the stale
+anonymous users with their players and expired sessions are deleted. A single transaction holds the database lock
+for the whole delete, the writes wait for it or fail once SQLite's busy timeout runs out.
+
+Usage: `python benchmarks/anonymous_user_reaping.py [staleUsers=20000] [batchSize=500]`
+"""
+
+import sys
+import threading
+import time
+from datetime import timedelta
+from typing import Callable
+
+from bench_setup import print_latencies, setup_django
+
+setup_django()
+
+from api.play.models import Game, GameTerminations, Player
+from api.play.reaper import ANONYMOUS_USER_REAPER, stale_anonymous_users
+from django.contrib.sessions.models import Session
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.utils import timezone
+from users.models import AnonymousSessionUser, User
+
+WRITE_INTERVAL = 0.005
+
+
+def create_stale_users(name: str, total: int) -> None:
+    expireDate = timezone.now() - timedelta(days=1)
+    sessionKeys = [f"{name}{index}" for index in range(total)]
+    Session.objects.bulk_create(
+        [Session(session_key=key, session_data="", expire_date=expireDate) for key in sessionKeys], batch_size=1000
+    )
+    AnonymousSessionUser.objects.bulk_create(
+        [AnonymousSessionUser(session_key=key) for key in sessionKeys], batch_size=1000
+    )
+    anonymousUsers = AnonymousSessionUser.objects.filter(session_key__startswith=name)
+    Player.objects.bulk_create([Player(anonymousUser=user) for user in anonymousUsers], batch_size=1000)
+
+
+def write_games(
+    player: Player, stop: threading.Event, latencies: list[float], failures: list[OperationalError]
+) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                Game.objects.create(
+                    player_white=player, player_black=player, termination=GameTerminations.AGREEMENT, time_control=180
+                )
+        except OperationalError as error:
+            failures.append(error)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(WRITE_INTERVAL)
+    close_old_connections()
+    connection.close()
+
+
+def single_transaction() -> None:
+    with transaction.atomic():
+        Session.objects.filter(expire_date__lte=timezone.now()).delete()
+        stale_anonymous_users(timezone.now(), []).delete()
+
+
+def measure(name: str, reap: Callable[[], object], staleUsers: int, player: Player) -> None:
+    create_stale_users(name, staleUsers)
+
+    stop = threading.Event()
+    latencies: list[float] = []
+    failures: list[OperationalError] = []
+    writer = threading.Thread(target=write_games, args=(player, stop, latencies, failures))
+    writer.start()
+
+    start = time.perf_counter()
+    try:
+        reap()
+    finally:
+        elapsed = time.perf_counter() - start
+        stop.set()
+        writer.join()
+
+    assert not AnonymousSessionUser.objects.filter(session_key__startswith=name).exists()
+    print(f"{name}: reaped {staleUsers} anonymous users in {elapsed:.2f}s")
+    print_latencies(f"{name} game write", latencies)
+    print(f"{name}: max game write {max(latencies) * 1e3:.0f}ms, {len(failures)} failed writes")
+
+
+def main() -> None:
+    staleUsers = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    ANONYMOUS_USER_REAPER.BATCH_SIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    player = Player.getOrCreatePlayerByUser(User.objects.create(username="writer"))
+    measure("single_transaction", single_transaction, staleUsers, player)
+    measure("batched", ANONYMOUS_USER_REAPER.reap, staleUsers, player)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Shared helpers of the benchmark scripts.
+- Run the benchmarks from the backend directory, e.g. `python benchmarks/consumer_relay.py`
+- Every benchmark runs against a fresh temporary SQLite database, never against the development database
+"""
+
+import importlib
+import os
+import random
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+import chess
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django() -> None:
+    """Sets up Django with an empty temporary database"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+    from django.conf import settings
+
+    databaseFile, databasePath = tempfile.mkstemp(suffix=".sqlite3")
+    os.close(databaseFile)
+    settings.DATABASES["default"]["NAME"] = databasePath
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    # The models of the api sub-packages are registered once the urls import them
+    importlib.import_module(settings.ROOT_URLCONF)
+    call_command("migrate", run_syncdb=True, verbosity=0)
+
+
+def random_game_moves(plies: int, seed: int) -> list[str]:
+    """Returns up to `plies` random legal moves in UCI notation, stops before the game would end"""
+    generator = random.Random(seed)
+    board = chess.Board()
+
+    moves: list[str] = []
+    while len(moves) < plies:
+        move = generator.choice(list(board.legal_moves))
+        board.push(move)
+        if board.outcome(claim_draw=True) is not None:
+            break
+        moves.append(move.uci())
+
+    return moves
+
+
+def percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(int(len(ordered) * percent / 100), len(ordered) - 1)
+    return ordered[index]
+
+
+def print_latencies(name: str, latenciesS: list[float]) -> None:
+    print(
+        f"{name}: n={len(latenciesS)}"
+        f" mean={statistics.mean(latenciesS) * 1e6:.1f}us"
+        f" p50={percentile(latenciesS, 50) * 1e6:.1f}us"
+        f" p99={percentile(latenciesS, 99) * 1e6:.1f}us"
+    )
@@ -0,0 +1,84 @@
+"""
+Replays recorded games through `ChessBoard` and measures the latency of a move by how far into the game it is played,
+compared with the previous board that checked the end of the game with `chess.Board.outcome(claim_draw=True)`.
+
+Usage: `python benchmarks/board_replay.py [games=10000] [previousBoardGames=500]`
+"""
+
+import random
+import sys
+import time
+import typing
+
+import chess
+from bench_setup import BACKEND_DIR, print_latencies
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+from api.play.chess_board import ChessBoard
+
+PLY_BUCKETS = [0, 50, 100, 200, 400, 800]
+QUIET_MOVE_DRAWS = 3
+
+
+class PreviousChessBoard:
+    """The board before the positions were counted incrementally"""
+
+    def __init__(self) -> None:
+        self.board = chess.Board()
+
+    def move(self, move: chess.Move) -> chess.Outcome | None:
+        if not self.board.is_legal(move):
+            raise ValueError(move)
+        self.board.push(move)
+        return self.board.outcome(claim_draw=True)
+
+
+def record_game(seed: int) -> list[chess.Move]:
+    """Plays random moves until the game ends, mostly reversible ones so that the games get long"""
+    generator = random.Random(seed)
+    board = ChessBoard()
+
+    moves: list[chess.Move] = []
+    while True:
+        legalMoves = list(board.legal_moves)
+        move = generator.choice(legalMoves)
+        for _ in range(QUIET_MOVE_DRAWS):
+            if not board.board.is_irreversible(move):
+                break
+            move = generator.choice(legalMoves)
+        moves.append(move)
+        if board.move(move) is not None:
+            return moves
+
+
+def replay(games: list[list[chess.Move]], createBoard: typing.Callable[[], ChessBoard | PreviousChessBoard]) -> None:
+    latencies: list[list[float]] = [[] for _ in PLY_BUCKETS]
+    for moves in games:
+        board = createBoard()
+        for ply, move in enumerate(moves):
+            start = time.perf_counter()
+            board.move(move)
+            latency = time.perf_counter() - start
+            latencies[sum(ply >= bucket for bucket in PLY_BUCKETS) - 1].append(latency)
+
+    for bucket, bucketLatencies in zip(PLY_BUCKETS, latencies):
+        if bucketLatencies:
+            print_latencies(f"  plies {bucket}+", bucketLatencies)
+
+
+def main() -> None:
+    gameCount = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    previousBoardGameCount = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    games = [record_game(seed) for seed in range(gameCount)]
+    print(f"{gameCount} games, {sum(len(moves) for moves in games)} moves")
+
+    print("ChessBoard:")
+    replay(games, ChessBoard)
+    print(f"Previous board, first {previousBoardGameCount} games:")
+    replay(games[:previousBoardGameCount], PreviousChessBoard)
+
+
+if __name__ == "__main__":
+    main()
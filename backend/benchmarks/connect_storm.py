@@ -0,0 +1,95 @@
+"""
+Compares resolving the player of every websocket connect through the identity cache against querying the database
+on every connect, as before the cache.
+
+The former resolution is emulated by `former_scope_player`, which looked up the session's anonymous user and then its
+player, creating either when missing. Every session connects several times, the way the game page opens a queue and a
+game websocket and reconnects. Both runs use the current schema, whose unique indexes the former lookups lacked.
+
+Usage: `python benchmarks/connect_storm.py [sessions=2000] [connectsPerSession=4] [concurrency=200]`
+"""
+
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable
+
+from bench_setup import print_latencies, setup_django
+
+setup_django()
+
+from api.play import consumers
+from api.play.consumers import QueueConsumer
+from api.play.identity import PLAYER_IDENTITIES, aget_scope_player
+from api.play.models import Player
+from api.utils import in_db_thread
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator  # type: ignore
+from django.contrib.auth.models import AnonymousUser
+from users.models import AnonymousSessionUser
+
+
+def former_scope_player(scope: dict[str, Any]) -> Player:
+    sessionKey = scope["session"].session_key
+    anonymousUser = AnonymousSessionUser.objects.filter(session_key=sessionKey).first()
+    if anonymousUser is None:
+        anonymousUser = AnonymousSessionUser.objects.create(session_key=sessionKey)
+
+    player = Player.objects.select_related("user", "anonymousUser").filter(anonymousUser=anonymousUser).first()
+    if player is None:
+        player = Player.objects.create(anonymousUser=anonymousUser)
+    return player
+
+
+async def former_aget_scope_player(scope: dict[str, Any]) -> Player:
+    return await in_db_thread(former_scope_player, scope)
+
+
+async def connect(sessionKey: str) -> float:
+    communicator = WebsocketCommunicator(QueueConsumer.as_asgi(), "/api/play/queue")
+    communicator.scope["user"] = AnonymousUser()
+    communicator.scope["session"] = SimpleNamespace(session_key=sessionKey)
+
+    start = time.perf_counter()
+    connected, _ = await communicator.connect(timeout=60)
+    latency = time.perf_counter() - start
+
+    assert connected
+    await communicator.disconnect()
+    return latency
+
+
+async def storm(
+    name: str, resolvePlayer: Callable[[dict[str, Any]], Awaitable[Player]], sessionKeys: list[str], concurrency: int
+) -> None:
+    consumers.aget_scope_player = resolvePlayer  # type: ignore
+
+    latencies: list[float] = []
+    start = time.perf_counter()
+    for waveStart in range(0, len(sessionKeys), concurrency):
+        wave = sessionKeys[waveStart : waveStart + concurrency]
+        latencies.extend(await asyncio.gather(*(connect(sessionKey) for sessionKey in wave)))
+    elapsed = time.perf_counter() - start
+    # Lets the cancelled tasks of the disconnected consumers finish before the event loop is closed
+    await asyncio.sleep(0.1)
+
+    print_latencies(f"{name} connect", latencies)
+    print(f"{name}: {len(sessionKeys) / elapsed:.0f} connects/sec")
+
+
+def main() -> None:
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    connectsPerSession = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    resolvers = [("former", former_aget_scope_player), ("cached", aget_scope_player)]
+    for name, resolvePlayer in resolvers:
+        # Every run connects sessions new to the database, the first connect of each creates its player
+        sessionKeys = [f"{name}_{index}" for index in range(sessions)] * connectsPerSession
+        PLAYER_IDENTITIES.clear()
+        async_to_sync(storm)(name, resolvePlayer, sessionKeys, concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Compares move relay throughput and latency of the async game consumer against the former synchronous dispatch.
+
+The synchronous baseline is emulated by `SyncDispatchGameConsumer`, which handles every frame in the sync worker
+thread and hops back to the event loop for every send, the same way `WebsocketConsumer` dispatches messages.
+
+Usage: `python benchmarks/consumer_relay.py [games] [plies]`
+"""
+
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any
+
+from bench_setup import print_latencies, random_game_moves, setup_django
+
+setup_django()
+
+import chess
+from api.play.chess_board import CustomOutcome, CustomTermination
+from api.play.consumers import GameConsumer
+from api.play.game import ALL_ACTIVE_GAMES_MANAGER
+from api.play.game_modes import GameMode, TimeControl
+from api.play.models import Player
+from api.utils import in_db_thread
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async  # type: ignore
+from channels.testing import WebsocketCommunicator  # type: ignore
+from django.contrib.auth.models import AnonymousUser
+from users.models import AnonymousSessionUser
+
+RAPID = GameMode("Rapid", [TimeControl(1800)])
+
+
+class SyncDispatchGameConsumer(GameConsumer):
+    async def receive(self, text_data: str) -> None:
+        await database_sync_to_async(async_to_sync(super().receive))(text_data)
+
+
+def create_players(gameIndex: int) -> tuple[Player, Player]:
+    players = []
+    for color in ("white", "black"):
+        anonymousUser = AnonymousSessionUser.objects.create(session_key=f"bench_{gameIndex}_{color}")
+        players.append(Player.getOrCreatePlayerByUser(anonymousUser))
+    return players[0], players[1]
+
+
+async def connect(consumerClass: Any, gameId: str, player: Player) -> WebsocketCommunicator:
+    communicator = WebsocketCommunicator(consumerClass.as_asgi(), f"/api/play/{gameId}")
+    communicator.scope["user"] = AnonymousUser()
+    communicator.scope["session"] = SimpleNamespace(session_key=player.anonymousUser.session_key)  # type: ignore
+    await communicator.connect()
+    return communicator
+
+
+async def play_game(consumerClass: Any, gameIndex: int, moves: list[str]) -> list[float]:
+    """Plays the moves in a new game and returns the latency of every relayed move"""
+    players = await in_db_thread(create_players, gameIndex)
+    game = ALL_ACTIVE_GAMES_MANAGER.start_game(players, RAPID, RAPID.time_controls[0])
+
+    white = await connect(consumerClass, game.game_id, game.players.by_color(chess.WHITE).player)  # type: ignore
+    black = await connect(consumerClass, game.game_id, game.players.by_color(chess.BLACK).player)  # type: ignore
+    for communicator in (white, black):
+        await communicator.send_json_to({"type": "join", "game_id": game.game_id})
+    for communicator in (white, black):
+        received = {(await communicator.receive_json_from())["type"] for _ in range(2)}
+        assert received == {"join", "game_started"}
+
+    latencies: list[float] = []
+    for ply, move in enumerate(moves):
+        mover, opponent = (white, black) if ply % 2 == 0 else (black, white)
+
+        start = time.perf_counter()
+        await mover.send_json_to({"type": "move", "move": move})
+        await opponent.receive_json_from()
+        latencies.append(time.perf_counter() - start)
+
+    game.finish(CustomOutcome(CustomTermination.ABORTED, None))
+    for communicator in (white, black):
+        while (await communicator.receive_json_from())["type"] != "game_result":
+            pass
+    await white.disconnect()
+    await black.disconnect()
+    return latencies
+
+
+async def benchmark(consumerClass: Any, games: int, moves: list[str], offset: int) -> None:
+    start = time.perf_counter()
+    results = await asyncio.gather(*(play_game(consumerClass, offset + index, moves) for index in range(games)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for gameLatencies in results for latency in gameLatencies]
+    print_latencies(consumerClass.__name__, latencies)
+    print(f"{consumerClass.__name__}: {len(latencies) / elapsed:.0f} relayed moves/sec")
+
+
+def main() -> None:
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    plies = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    moves = random_game_moves(plies, seed=1)
+
+    async_to_sync(benchmark)(SyncDispatchGameConsumer, games, moves, offset=0)
+    async_to_sync(benchmark)(GameConsumer, games, moves, offset=games)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compares looking up the friendship of two users with the OR of both orders, used before the friendships were stored
+in a canonical order, with the single probe of the unique index.
+
+Usage: `python benchmarks/friendship_lookup.py [friendships=1000000]`
+"""
+
+import random
+import sys
+import time
+
+from bench_setup import print_latencies, setup_django
+
+setup_django()
+
+from api.friends.friends import getFriendship
+from api.friends.models import Friendship
+from django.db import connection, transaction
+from django.db.models import Q, QuerySet
+from users.models import User
+
+USERS = 20_000
+SAMPLES = 2000
+INSERT_CHUNK = 50_000
+
+
+def insert_friendships(friendshipCount: int) -> list[User]:
+    User.objects.bulk_create([User(username=f"user{index}") for index in range(USERS)], batch_size=1000)
+    userIds = list(User.objects.order_by("pk").values_list("pk", flat=True))
+
+    generator = random.Random(0)
+    pairs: set[tuple[int, int]] = set()
+    while len(pairs) < friendshipCount:
+        user1Id, user2Id = generator.sample(userIds, 2)
+        pairs.add(Friendship.ordered_ids(user1Id, user2Id))
+
+    rows = list(pairs)
+    with connection.cursor() as cursor:
+        for chunkStart in range(0, len(rows), INSERT_CHUNK):
+            with transaction.atomic():
+                cursor.executemany(
+                    f"INSERT INTO {Friendship._meta.db_table} (user1_id, user2_id) VALUES (%s, %s)",
+                    rows[chunkStart : chunkStart + INSERT_CHUNK],
+                )
+        cursor.execute("ANALYZE")
+
+    return list(User.objects.order_by("pk")[:SAMPLES])
+
+
+def or_lookup(user1: User, user2: User) -> QuerySet[Friendship]:
+    """The lookup used before the canonical order"""
+    return Friendship.objects.filter(Q(user1=user1, user2=user2) | Q(user1=user2, user2=user1))
+
+
+def ordered_lookup(user1: User, user2: User) -> QuerySet[Friendship]:
+    user1Id, user2Id = Friendship.ordered_ids(user1.pk, user2.pk)
+    return Friendship.objects.filter(user1_id=user1Id, user2_id=user2Id)
+
+
+def print_query_plan(name: str, queryset: QuerySet[Friendship]) -> None:
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        print(f"{name} query plan:")
+        for row in cursor.fetchall():
+            print(f"  {row[-1]}")
+
+
+def main() -> None:
+    friendshipCount = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    users = insert_friendships(friendshipCount)
+    print(f"{friendshipCount} friendships between {USERS} users")
+
+    generator = random.Random(1)
+    pairs = [(generator.choice(users), generator.choice(users)) for _ in range(SAMPLES)]
+    pairs = [(user1, user2) for user1, user2 in pairs if user1 != user2]
+
+    print_query_plan("OR of both orders", or_lookup(*pairs[0]))
+    print_query_plan("Canonical order", ordered_lookup(*pairs[0]))
+
+    orLatencies, orderedLatencies = [], []
+    for user1, user2 in pairs:
+        start = time.perf_counter()
+        orFriendship = or_lookup(user1, user2).first()
+        orLatencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        orderedFriendship = getFriendship(user1, user2)
+        orderedLatencies.append(time.perf_counter() - start)
+
+        assert orFriendship == orderedFriendship
+
+    print_latencies("OR of both orders", orLatencies)
+    print_latencies("canonical order", orderedLatencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Compares the latency of deep pages of a player's game history with OFFSET and keyset (cursor) pagination.
+
+Usage: `python benchmarks/game_pagination.py [games=200000]`
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bench_setup import print_latencies, setup_django
+
+setup_django()
+
+from api.play.models import Game, Player
+from api.play.utils import GAME_PLAYERS_RELATED, get_player_games_page
+from django.db import connection, transaction
+from users.models import User
+
+LIMIT = 10
+PAGES = [1, 10, 100, 1000, 10000]
+SAMPLES = 50
+INSERT_CHUNK = 10_000
+
+
+def create_players() -> tuple[Player, list[Player]]:
+    player = Player.getOrCreatePlayerByUser(User.objects.create(username="player"))
+    opponents = [Player.getOrCreatePlayerByUser(User.objects.create(username=f"opponent{index}")) for index in range(20)]
+    return player, opponents
+
+
+def insert_games(gameCount: int, player: Player, opponents: list[Player]) -> None:
+    """Inserts the games of the player, every other game of the table is played by other players"""
+    start = datetime(2020, 1, 1)
+    with connection.cursor() as cursor:
+        for chunkStart in range(0, 2 * gameCount, INSERT_CHUNK):
+            rows = []
+            for index in range(chunkStart, min(chunkStart + INSERT_CHUNK, 2 * gameCount)):
+                opponent = opponents[index % len(opponents)].pk
+                other = opponents[(index + 1) % len(opponents)].pk
+                white, black = (player.pk, opponent) if index % 4 == 0 else (opponent, player.pk)
+                if index % 2:
+                    white, black = opponent, other
+                rows.append((white, black, (start + timedelta(minutes=index)).strftime("%Y-%m-%d %H:%M:%S")))
+
+            with transaction.atomic():
+                cursor.executemany(
+                    f"INSERT INTO {Game._meta.db_table} (player_white_id, player_black_id, termination, winner_color, "
+                    "time_control, date) VALUES (%s, %s, 6, 1, 180, %s)",
+                    rows,
+                )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def offset_page(player: Player, page: int) -> list[Game]:
+    """The pagination used before the cursors"""
+    games = Game.getGamesByPlayer(player).select_related(*GAME_PLAYERS_RELATED).order_by("-date")
+    return list(games[LIMIT * (page - 1) : LIMIT * page])
+
+
+def main() -> None:
+    gameCount = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    player, opponents = create_players()
+    insert_games(gameCount, player, opponents)
+    print(f"{gameCount} games of the player, {2 * gameCount} games in total")
+
+    for page in PAGES:
+        if LIMIT * page > gameCount:
+            break
+
+        # The cursor of the page is the last game of the previous page
+        previousGame = offset_page(player, page - 1)[-1] if page > 1 else None
+        cursor = (previousGame.date, previousGame.game_id) if previousGame else None
+
+        offset, keyset = [], []
+        for _ in range(SAMPLES):
+            start = time.perf_counter()
+            offsetGames = offset_page(player, page)
+            offset.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            keysetGames = get_player_games_page(player, LIMIT, cursor)
+            keyset.append(time.perf_counter() - start)
+
+        assert [game.game_id for game in offsetGames] == [game.game_id for game in keysetGames]
+        print_latencies(f"page {page}: offset", offset)
+        print_latencies(f"page {page}: cursor", keyset)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares the latency of the moves when the game state is saved into the SQLite game store right away, as before,
+against the write-behind of the game store writer.
+
+The moves are played on one thread, the way the event loop plays them. Another worker writes into the same game store
+meanwhile, holding its write lock for a few milliseconds every now and then. The moves saving right away wait for it.
+
+Usage: `python benchmarks/game_store_writes.py [games=50] [plies=40]`
+"""
+
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from bench_setup import print_latencies, random_game_moves, setup_django
+
+setup_django()
+
+from api.play.game import GameManager
+from api.play.game_modes import GameMode, TimeControl
+from api.play.game_store import SQLiteGameStore
+from api.play.models import Player
+from users.models import User
+
+RAPID = GameMode("Rapid", [TimeControl(1800)])
+LOCK_HOLD = 0.005
+LOCK_INTERVAL = 0.02
+
+
+def hold_write_lock(path: str, stop: threading.Event) -> None:
+    """Writes of another worker, each holds the write lock of the game store for `LOCK_HOLD` seconds"""
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    while not stop.is_set():
+        connection.execute("BEGIN IMMEDIATE")
+        time.sleep(LOCK_HOLD)
+        connection.execute("COMMIT")
+        time.sleep(LOCK_INTERVAL)
+    connection.close()
+
+
+def measure(name: str, writeBehind: bool, games: int, plies: int, players: tuple[Player, Player]) -> None:
+    path = str(Path(tempfile.mkdtemp()) / "games.sqlite3")
+    manager = GameManager(SQLiteGameStore(path), worker_id=name)
+    if writeBehind:
+        manager.writer.start()
+
+    stop = threading.Event()
+    otherWorker = threading.Thread(target=hold_write_lock, args=(path, stop))
+    otherWorker.start()
+
+    latencies: list[float] = []
+    try:
+        for index in range(games):
+            game = manager.start_game(players, RAPID, RAPID.time_controls[0])
+            for player in players:
+                game.join_player(player)
+
+            for move in random_game_moves(plies, seed=index):
+                mover = game.players.by_color(game.board.color_to_move).player
+                assert isinstance(mover, Player)
+
+                start = time.perf_counter()
+                game.move(mover, move)
+                latencies.append(time.perf_counter() - start)
+
+            game.stop_timers()
+            manager.remove_game(game.game_id)
+    finally:
+        stop.set()
+        otherWorker.join()
+        manager.writer.stop()
+
+    print_latencies(f"{name} move", latencies)
+    print(f"{name}: max move {max(latencies) * 1e3:.1f}ms, {manager.writer.coalesced} saves coalesced")
+
+
+def main() -> None:
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    plies = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+    white = Player.getOrCreatePlayerByUser(User.objects.create(username="white"))
+    black = Player.getOrCreatePlayerByUser(User.objects.create(username="black"))
+    measure("save_right_away", False, games, plies, (white, black))
+    measure("write_behind", True, games, plies, (white, black))
+
+
+if __name__ == "__main__":
+    main()
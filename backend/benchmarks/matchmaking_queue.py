@@ -0,0 +1,94 @@
+"""
+Measures the latency of the matchmaking queue operations while the queues hold a growing number of players,
+and the duration of a matching tick over a full queue.
+
+Usage: `python benchmarks/matchmaking_queue.py`
+"""
+
+import random
+import time
+
+from bench_setup import print_latencies, setup_django
+
+setup_django()
+
+from api.play.game_modes import ACTIVE_GAME_MODES
+from api.play.game_queue import DEFAULT_RATING_WINDOW, GameQueue, GroupQueueManager, QueuingPlayer
+from api.play.models import Player
+
+QUEUE_SIZES = [1_000, 10_000, 100_000]
+SAMPLES = 1_000
+
+
+def benchmark_game_queue(queuedPlayers: int) -> None:
+    """Enqueue, lookup and cancel in one queue that holds `queuedPlayers` players"""
+    gameQueue = GameQueue(ACTIVE_GAME_MODES[0], ACTIVE_GAME_MODES[0].time_controls[0])
+    for index in range(queuedPlayers):
+        gameQueue.add_player(QueuingPlayer(Player(pk=index), gameQueue))
+
+    samples = [Player(pk=queuedPlayers + index) for index in range(SAMPLES)]
+    enqueue, lookup, cancel = [], [], []
+    for player in samples:
+        start = time.perf_counter()
+        gameQueue.add_player(QueuingPlayer(player, gameQueue))
+        enqueue.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        gameQueue.is_player_queuing(player)
+        lookup.append(time.perf_counter() - start)
+
+    # Cancelling players from the middle of the queue was the worst case of the list based queue
+    for player in samples:
+        start = time.perf_counter()
+        gameQueue.remove_player(player)
+        cancel.append(time.perf_counter() - start)
+
+    print_latencies(f"queue of {queuedPlayers}: enqueue", enqueue)
+    print_latencies(f"queue of {queuedPlayers}: lookup", lookup)
+    print_latencies(f"queue of {queuedPlayers}: cancel", cancel)
+
+
+def benchmark_group_queues(queuedPlayers: int) -> None:
+    """Cancelling a player while every queued player waits in their own group"""
+    groupQueueManager = GroupQueueManager()
+    for index in range(queuedPlayers):
+        queueManager = groupQueueManager.get_create_queue_manager((f"user{index}", f"friend{index}"))
+        gameQueue = queueManager.get_game_queue("bullet", 60)
+        assert gameQueue is not None
+        queueManager.add_player(Player(pk=index), gameQueue, lambda _: None)
+
+    cancel = []
+    for index in range(0, queuedPlayers, max(queuedPlayers // SAMPLES, 1)):
+        start = time.perf_counter()
+        groupQueueManager.remove_player(Player(pk=index))
+        cancel.append(time.perf_counter() - start)
+
+    print_latencies(f"{queuedPlayers} groups: cancel", cancel)
+
+
+def benchmark_matching_tick(queuedPlayers: int) -> None:
+    """Finding the pairs of `queuedPlayers` players with normally distributed ratings and wait times up to 30s"""
+    randomGenerator = random.Random(0)
+    gameQueue = GameQueue(ACTIVE_GAME_MODES[0], ACTIVE_GAME_MODES[0].time_controls[0])
+    for index in range(queuedPlayers):
+        rating = randomGenerator.gauss(1500, 350)
+        gameQueue.add_player(QueuingPlayer(Player(pk=index), gameQueue, rating=rating, joined_at=randomGenerator.uniform(0, 30)))
+
+    ticks = []
+    for _ in range(20):
+        start = time.perf_counter()
+        pairs = gameQueue.find_pairs(now=30, window=DEFAULT_RATING_WINDOW)
+        ticks.append(time.perf_counter() - start)
+
+    print_latencies(f"tick over {queuedPlayers} players ({len(pairs)} pairs)", ticks)
+
+
+def main() -> None:
+    for queuedPlayers in QUEUE_SIZES:
+        benchmark_game_queue(queuedPlayers)
+        benchmark_group_queues(queuedPlayers)
+        benchmark_matching_tick(queuedPlayers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Compares the encoding cost of the game messages by `json.dumps`, which encoded every message before, against their
+message schemas, with orjson and with the standard library backend.
+
+Usage: `python benchmarks/message_encoding.py [messages]`
+"""
+
+import importlib.util
+import json
+import sys
+import time
+from types import ModuleType
+from typing import Any, Callable
+
+from bench_setup import setup_django
+
+setup_django()
+
+from api import serialization
+from api.consumers import ERROR_MESSAGE
+from api.play.messages import GAME_RESULT_MESSAGE, GAME_STARTED_MESSAGE, MOVE_MESSAGE, OFFER_DRAW_MESSAGE
+from api.serialization import MessageSchema
+
+PLAYERS = {
+    "white": {"user_type": "registered", "username": "magnus", "is_current_user": True, "time": 180_000},
+    "black": {
+        "user_type": "registered",
+        "username": "hikaru",
+        "is_current_user": False,
+        "status": "friends",
+        "time": 180_000,
+    },
+}
+
+MESSAGES: list[tuple[MessageSchema, dict[str, Any]]] = [
+    (MOVE_MESSAGE, {"seq": 1, "move": "e2e4", "ply": 1, "white_time": 179_213, "black_time": 180_000}),
+    (GAME_STARTED_MESSAGE, {"seq": 1, "players": PLAYERS}),
+    (GAME_RESULT_MESSAGE, {"seq": 42, "termination": "checkmate", "winner": "white"}),
+    (OFFER_DRAW_MESSAGE, {"seq": 12}),
+    (ERROR_MESSAGE, {"message": "It is not your turn"}),
+]
+
+
+def load_stdlib_serialization() -> ModuleType:
+    """Loads a copy of the serialization module as if orjson wasn't installed"""
+    spec = importlib.util.spec_from_file_location("stdlib_serialization", serialization.__file__)
+    assert spec is not None and spec.loader is not None
+
+    module = importlib.util.module_from_spec(spec)
+    orjson = sys.modules.pop("orjson", None)
+    sys.modules["orjson"] = None  # type: ignore
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        del sys.modules["orjson"]
+        if orjson is not None:
+            sys.modules["orjson"] = orjson
+    return module
+
+
+def measure(encode: Callable[[], str], total: int) -> float:
+    """Returns the mean encoding time of the message in nanoseconds"""
+    start = time.perf_counter()
+    for _ in range(total):
+        encode()
+    return (time.perf_counter() - start) / total * 1e9
+
+
+def main() -> None:
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    stdlibSerialization = load_stdlib_serialization()
+
+    print(f"{'message':<18}{'json.dumps':>12}{'schema stdlib':>16}{'schema orjson':>16}")
+    for schema, values in MESSAGES:
+        stdlibSchema = stdlibSerialization.MessageSchema(schema.type, **schema.fields)
+        message = {"type": schema.type, **values}
+
+        dumpsTime = measure(lambda: json.dumps(message), total)
+        stdlibTime = measure(lambda: stdlibSchema.encode(**values), total)
+        orjsonTime = measure(lambda: schema.encode(**values), total) if serialization.HAS_ORJSON else float("nan")
+        print(f"{schema.type:<18}{dumpsTime:>10.0f}ns{stdlibTime:>14.0f}ns{orjsonTime:>14.0f}ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compares the per-move serialization cost and size of the delta move messages against the former full messages.
+
+The former messages carried both players serialized again for every move, as `legacy_move_message` does. The delta
+messages carry only the move, its ply and the clocks, the players are sent once on join and start. Every message is
+serialized for each receiving consumer, on a single core.
+
+Usage: `python benchmarks/move_broadcast.py [moves]`
+"""
+
+import json
+import sys
+import time
+from typing import Any, Callable
+
+from bench_setup import random_game_moves, setup_django
+
+setup_django()
+
+import chess
+from api.play.chess_board import CustomOutcome, CustomTermination
+from api.play.events import GameEvent
+from api.play.game import ALL_ACTIVE_GAMES_MANAGER, Game
+from api.play.game_modes import GameMode, TimeControl
+from api.play.models import Player
+from api.play.utils import player_status_dict
+from users.models import User
+
+RAPID = GameMode("Rapid", [TimeControl(1800)])
+
+
+def legacy_move_message(game: Game, event: GameEvent) -> str:
+    players = {
+        color: {
+            **(player_status_dict(gamePlayer.player) or {}),  # type: ignore
+            "time": gamePlayer.get_current_time(),
+        }
+        for color, gamePlayer in (
+            ("white", game.players.by_color(chess.WHITE)),
+            ("black", game.players.by_color(chess.BLACK)),
+        )
+    }
+    return json.dumps({"type": "move", "move": event["move"], "players": players})
+
+
+def delta_move_message(game: Game, event: GameEvent) -> str:
+    return json.dumps(
+        {
+            "type": "move",
+            "move": event["move"],
+            "ply": event["ply"],
+            "white_time": event["white_time"],
+            "black_time": event["black_time"],
+        }
+    )
+
+
+def create_game() -> Game:
+    players = []
+    for name in ("white", "black"):
+        user = User.objects.create_user(username=f"bench_{name}", email=f"{name}@bench.com", password="password")
+        players.append(Player.objects.get(pk=Player.getOrCreatePlayerByUser(user).pk))
+
+    game = ALL_ACTIVE_GAMES_MANAGER.start_game((players[0], players[1]), RAPID, RAPID.time_controls[0])
+    for player in players:
+        game.join_player(player)
+    return game
+
+
+def benchmark(name: str, game: Game, events: list[GameEvent], serialize: Callable[[Game, GameEvent], str]) -> None:
+    start = time.perf_counter()
+    messages = [serialize(game, event) for event in events]
+    elapsed = time.perf_counter() - start
+
+    averageBytes = sum(len(message) for message in messages) / len(messages)
+    print(f"{name}: {len(messages) / elapsed:.0f} messages/sec, {averageBytes:.0f} bytes/message")
+
+
+def main() -> None:
+    totalMoves = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    game = create_game()
+
+    # The moves are played once, the published events are serialized by both formats
+    events: list[GameEvent] = []
+    game.publish_event = events.append  # type: ignore
+    game.manager.save_game = lambda _: None  # type: ignore
+    for move in random_game_moves(200, seed=1):
+        player: Any = game.players.by_color(game.board.color_to_move).player
+        game.move(player, move)
+
+    events = [event for event in events if event["type"] == "move"]
+    events = (events * (totalMoves // len(events) + 1))[:totalMoves]
+    benchmark("full players", game, events, legacy_move_message)
+    benchmark("delta", game, events, delta_move_message)
+
+    game.finish(CustomOutcome(CustomTermination.ABORTED, None))
+
+
+if __name__ == "__main__":
+    main()
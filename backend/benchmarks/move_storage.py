@@ -0,0 +1,114 @@
+"""
+Compares the storage size and read latency of the moves kept as `Move` rows and encoded in `Game.encoded_moves`.
+- The games reuse a pool of random games, generating a million distinct legal games would dominate the run time
+- A million games take a few GB of disk space and several minutes, pass a smaller count for a quick run
+
+Usage: `python benchmarks/move_storage.py [games=1000000]`
+"""
+
+import random
+import sys
+import time
+
+from bench_setup import print_latencies, random_game_moves, setup_django
+
+setup_django()
+
+from api.play.models import Game, Move
+from api.play.move_encoding import decode_moves, encode_moves
+from django.db import connection, transaction
+
+GAME_POOL = 500
+INSERT_CHUNK = 10_000
+READ_SAMPLES = 2_000
+
+
+def database_size() -> int:
+    with connection.cursor() as cursor:
+        cursor.execute("VACUUM")
+        cursor.execute("PRAGMA page_count")
+        pageCount = cursor.fetchone()[0]
+        cursor.execute("PRAGMA page_size")
+        return int(pageCount * cursor.fetchone()[0])
+
+
+def insert_games(gameCount: int) -> None:
+    gameTable = Game._meta.db_table
+    with connection.cursor() as cursor:
+        for start in range(0, gameCount, INSERT_CHUNK):
+            gameIds = range(start + 1, min(start + INSERT_CHUNK, gameCount) + 1)
+            with transaction.atomic():
+                cursor.executemany(
+                    f"INSERT INTO {gameTable} (game_id, termination, winner_color, time_control, date) "
+                    "VALUES (%s, 6, 1, 180, '2024-01-01 00:00:00')",
+                    [(gameId,) for gameId in gameIds],
+                )
+    print(f"inserted {gameCount} games")
+
+
+def encode_games(gameCount: int, pool: list[list[str]]) -> None:
+    encodedPool = [encode_moves(moves) for moves in pool]
+    with connection.cursor() as cursor:
+        for start in range(0, gameCount, INSERT_CHUNK):
+            gameIds = range(start + 1, min(start + INSERT_CHUNK, gameCount) + 1)
+            with transaction.atomic():
+                cursor.executemany(
+                    f"UPDATE {Game._meta.db_table} SET encoded_moves = %s WHERE game_id = %s",
+                    [(encodedPool[gameId % len(pool)], gameId) for gameId in gameIds],
+                )
+
+
+def insert_move_rows(gameCount: int, pool: list[list[str]]) -> None:
+    with connection.cursor() as cursor:
+        for start in range(0, gameCount, INSERT_CHUNK):
+            gameIds = range(start + 1, min(start + INSERT_CHUNK, gameCount) + 1)
+            with transaction.atomic():
+                cursor.executemany(
+                    f'INSERT INTO {Move._meta.db_table} (game_id, "order", move) VALUES (%s, %s, %s)',
+                    [
+                        (gameId, order, move)
+                        for gameId in gameIds
+                        for order, move in enumerate(pool[gameId % len(pool)])
+                    ],
+                )
+
+
+def benchmark_reads(gameCount: int) -> None:
+    gameIds = random.Random(0).choices(range(1, gameCount + 1), k=READ_SAMPLES)
+
+    moveRows, encoded = [], []
+    for gameId in gameIds:
+        start = time.perf_counter()
+        list(Move.objects.filter(game=gameId).order_by("order").values_list("move", flat=True))
+        moveRows.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        encodedMoves = Game.objects.values_list("encoded_moves", flat=True).get(game_id=gameId)
+        assert encodedMoves is not None
+        decode_moves(bytes(encodedMoves))
+        encoded.append(time.perf_counter() - start)
+
+    print_latencies("read moves: Move rows", moveRows)
+    print_latencies("read moves: encoded", encoded)
+
+
+def main() -> None:
+    gameCount = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    pool = [random_game_moves(plies=random.Random(seed).randint(20, 160), seed=seed) for seed in range(GAME_POOL)]
+    averagePlies = sum(len(moves) for moves in pool) / len(pool)
+    print(f"{gameCount} games, {averagePlies:.1f} plies on average")
+
+    insert_games(gameCount)
+    sizeGames = database_size()
+    encode_games(gameCount, pool)
+    sizeEncoded = database_size()
+    insert_move_rows(gameCount, pool)
+    sizeMoveRows = database_size()
+
+    print(f"storage: Move rows {(sizeMoveRows - sizeEncoded) / 1e6:.1f} MB")
+    print(f"storage: encoded {(sizeEncoded - sizeGames) / 1e6:.1f} MB")
+    benchmark_reads(gameCount)
+
+
+if __name__ == "__main__":
+    main()
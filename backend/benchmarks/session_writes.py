@@ -0,0 +1,83 @@
+"""
+Compares the database writes of anonymous page views with a session created for every request, as before, against the
+sessions created once a visitor needs an identity to play, with the database, cache and signed cookie sessions.
+
+Every page view is made by a new visitor, e.g. a crawler, which loads the page and checks whether it is logged in.
+The visitors that play send the identity request as the game page does before opening its websockets.
+
+Usage: `python benchmarks/session_writes.py [pageViews=1000] [players=100]`
+"""
+
+import sys
+from typing import Any, Callable
+
+from bench_setup import setup_django
+
+setup_django()
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpRequest, HttpResponse
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+PAGE_REQUESTS = ["/", "/api/auth/is_authenticated"]
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE")
+
+
+class EnsureSessionMiddleware:
+    """Former middleware, which created a session for every request without one"""
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if not request.session.session_key:
+            request.session.create()
+        return self.get_response(request)
+
+
+def count_writes(requests: Callable[[Client], None]) -> int:
+    """Returns the database writes of the requests of a new visitor"""
+    connection.queries_log.clear()
+    with CaptureQueriesContext(connection) as queries:
+        requests(Client())
+    return sum(query["sql"].startswith(WRITE_STATEMENTS) for query in queries.captured_queries)
+
+
+def view_page(client: Client) -> None:
+    for path in PAGE_REQUESTS:
+        assert client.get(path).status_code == 200
+
+
+def play(client: Client) -> None:
+    view_page(client)
+    assert client.post("/api/play/identity").status_code == 200
+
+
+def main() -> None:
+    pageViews = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    players = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    sessionModes: dict[str, dict[str, Any]] = {
+        "session per request": {
+            "MIDDLEWARE": [
+                *settings.MIDDLEWARE[:2],
+                f"{__name__}.EnsureSessionMiddleware",
+                *settings.MIDDLEWARE[2:],
+            ]
+        },
+        "lazy database": {},
+        "lazy cache": {"SESSION_ENGINE": "django.contrib.sessions.backends.cache"},
+        "lazy signed cookies": {"SESSION_ENGINE": "django.contrib.sessions.backends.signed_cookies"},
+    }
+    print(f"{'sessions':<22}{'writes per 1k page views':>26}{'writes per player':>20}")
+    for name, overrides in sessionModes.items():
+        with override_settings(ALLOWED_HOSTS=["testserver"], **overrides):
+            pageWrites = sum(count_writes(view_page) for _ in range(pageViews))
+            playerWrites = sum(count_writes(play) for _ in range(players))
+        print(f"{name:<22}{pageWrites * 1000 / pageViews:>26.0f}{playerWrites / players:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compares the fan-out of the moves of one game to thousands of spectators through the spectator hub against
+subscribing every spectator to the game's channel layer group.
+
+`GroupSpectatorConsumer` emulates the per-spectator subscription, the way the players' consumers receive the events:
+the channel layer delivers every event to each spectator, which encodes its own frame.
+
+The in-memory channel layer walks all the channels and groups on every receive, so the per-spectator subscriptions
+cost quadratically in the number of spectators and are measured with fewer of them.
+
+Usage: `python benchmarks/spectator_fanout.py [spectators] [plies] [groupSpectators]`
+"""
+
+import asyncio
+import sys
+import time
+from typing import Any
+
+from bench_setup import print_latencies, random_game_moves, setup_django
+
+setup_django()
+
+from api.play.chess_board import CustomOutcome, CustomTermination
+from api.play.consumers import SpectatorConsumer
+from api.play.events import GameEvent, game_group_name
+from api.play.game import ALL_ACTIVE_GAMES_MANAGER, Game
+from api.play.game_modes import GameMode, TimeControl
+from api.play.messages import MOVE_MESSAGE
+from api.play.models import Player
+from api.serialization import loads
+from api.utils import in_db_thread
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import AsyncWebsocketConsumer  # type: ignore
+from channels.testing import WebsocketCommunicator  # type: ignore
+from users.models import AnonymousSessionUser
+
+RAPID = GameMode("Rapid", [TimeControl(1800)])
+
+
+class GroupSpectatorConsumer(AsyncWebsocketConsumer):  # type: ignore
+    async def receive(self, text_data: str) -> None:
+        gameId = loads(text_data)["game_id"]
+        await self.channel_layer.group_add(game_group_name(gameId), self.channel_name)
+        await self.send(text_data='{"type":"spectate"}')
+
+    async def game_event(self, message: dict[str, Any]) -> None:
+        event: GameEvent = message["event"]
+        if event["type"] == "move":
+            await self.send(
+                MOVE_MESSAGE.encode(
+                    seq=event["seq"],
+                    move=event["move"],
+                    ply=event["ply"],
+                    white_time=event["white_time"],
+                    black_time=event["black_time"],
+                )
+            )
+
+
+def create_game(name: str) -> Game:
+    players = []
+    for color in ("white", "black"):
+        anonymousUser = AnonymousSessionUser.objects.create(session_key=f"bench_{name}_{color}")
+        players.append(Player.getOrCreatePlayerByUser(anonymousUser))
+
+    game = ALL_ACTIVE_GAMES_MANAGER.start_game((players[0], players[1]), RAPID, RAPID.time_controls[0])
+    game.manager.save_game = lambda _: None  # type: ignore
+    for player in players:
+        game.join_player(player)
+    # Connecting the spectators takes longer than the first move may
+    game.abortTimer.cancel()
+    return game
+
+
+async def spectate(consumerClass: Any, game: Game) -> WebsocketCommunicator:
+    communicator = WebsocketCommunicator(consumerClass.as_asgi(), "/api/play/spectate")
+    await communicator.connect()
+    await communicator.send_json_to({"type": "spectate", "game_id": game.game_id})
+    assert (await communicator.receive_json_from(timeout=60))["type"] == "spectate"
+    return communicator
+
+
+async def benchmark(consumerClass: Any, spectators: int, moves: list[str]) -> None:
+    game = await in_db_thread(create_game, consumerClass.__name__)
+    communicators = [await spectate(consumerClass, game) for _ in range(spectators)]
+
+    latencies: list[float] = []
+    start = time.perf_counter()
+    for move in moves:
+        moveStart = time.perf_counter()
+        game.move(game.players.by_color(game.board.color_to_move).player, move)  # type: ignore
+        await asyncio.gather(*(communicator.receive_output(timeout=60) for communicator in communicators))
+        latencies.append(time.perf_counter() - moveStart)
+    elapsed = time.perf_counter() - start
+
+    print_latencies(f"{consumerClass.__name__} move to all {spectators} spectators", latencies)
+    print(f"{consumerClass.__name__}: {spectators * len(moves) / elapsed:.0f} frames/sec")
+
+    game.finish(CustomOutcome(CustomTermination.ABORTED, None))
+    for communicator in communicators:
+        await communicator.disconnect()
+
+
+def main() -> None:
+    spectators = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    plies = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    groupSpectators = int(sys.argv[3]) if len(sys.argv) > 3 else 2_000
+    moves = random_game_moves(plies, seed=1)
+
+    async_to_sync(benchmark)(GroupSpectatorConsumer, groupSpectators, moves)
+    async_to_sync(benchmark)(SpectatorConsumer, spectators, moves)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+from typing import Iterator
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_friend_graph() -> Iterator[None]:
+    """The friendship graph cache outlives the test database transactions, so every test starts with it empty"""
+    from api.friends.friend_graph import FRIEND_GRAPH
+
+    FRIEND_GRAPH.clear()
+    yield
+    FRIEND_GRAPH.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_player_identities() -> Iterator[None]:
+    """The players are cached by user ID and session key, both of which the test databases reuse"""
+    from api.play.identity import PLAYER_IDENTITIES
+
+    PLAYER_IDENTITIES.clear()
+    yield
+    PLAYER_IDENTITIES.clear()
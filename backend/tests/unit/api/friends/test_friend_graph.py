@@ -0,0 +1,104 @@
+import pytest
+from api.friends.friend_graph import FriendGraph, UserConnections
+from api.friends.friend_requests import getFriendRequests, getFriendRequestsSent, sendFriendRequest
+from api.friends.friends import FriendStatus, getFriendship, getFriendStatus, getFriendStatuses
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from users.models import User
+
+
+@pytest.mark.django_db
+def test_friend_statuses_from_graph() -> None:
+    me = User.objects.create(username="me")
+    others = [User.objects.create(username=f"user{index}") for index in range(50)]
+    sendFriendRequest(fromUser=me, toUser=others[0])
+    sendFriendRequest(fromUser=others[0], toUser=me)
+    sendFriendRequest(fromUser=me, toUser=others[1])
+    sendFriendRequest(fromUser=others[2], toUser=me)
+
+    with CaptureQueriesContext(connection) as queries:
+        statuses = getFriendStatuses(me, [me, *others])
+    assert len(queries) == 2
+
+    assert me.pk not in statuses
+    assert statuses[others[0].pk] == FriendStatus.friends
+    assert statuses[others[1].pk] == FriendStatus.friendRequestSent
+    assert statuses[others[2].pk] == FriendStatus.friendRequestReceived
+    assert statuses[others[3].pk] == FriendStatus.notFriends
+
+    with CaptureQueriesContext(connection) as queries:
+        for other in others:
+            assert getFriendStatus(me, other) == statuses[other.pk]
+    assert len(queries) == 0
+
+    assert getFriendRequestsSent(me) == [others[1]]
+    assert getFriendRequests(me) == [others[2]]
+
+
+@pytest.mark.django_db
+def test_friend_graph_invalidation() -> None:
+    user1 = User.objects.create(username="user1")
+    user2 = User.objects.create(username="user2")
+    assert getFriendStatus(user2, user1) == FriendStatus.notFriends
+
+    sendFriendRequest(fromUser=user1, toUser=user2)
+    assert getFriendStatus(user2, user1) == FriendStatus.friendRequestReceived
+
+    sendFriendRequest(fromUser=user2, toUser=user1)
+    assert getFriendStatus(user1, user2) == getFriendStatus(user2, user1) == FriendStatus.friends
+
+    friendship = getFriendship(user1, user2)
+    assert friendship is not None
+    friendship.delete()
+    assert getFriendStatus(user1, user2) == getFriendStatus(user2, user1) == FriendStatus.notFriends
+
+
+@pytest.mark.django_db
+def test_friend_graph_eviction_and_expiry() -> None:
+    now = 0.0
+    graph = FriendGraph(time_source=lambda: now)
+    graph.MAX_USERS = 2
+    users = [User.objects.create(username=f"user{index}") for index in range(3)]
+
+    for user in users:
+        graph.get(user.pk)
+    assert list(graph.users) == [users[1].pk, users[2].pk]
+
+    # Only the process-wide graph is invalidated by the signals, like the graphs of other worker processes
+    sendFriendRequest(fromUser=users[2], toUser=users[1])
+    assert users[2].pk not in graph.get(users[1].pk).received
+
+    now += FriendGraph.TTL
+    assert users[2].pk in graph.get(users[1].pk).received
+
+
+
+class InvalidatedWhileLoadingGraph(FriendGraph):
+    """Graph whose first load races with a friend request, which is sent right after the users were queried"""
+
+    def __init__(self, fromUser: User, toUser: User) -> None:
+        super().__init__()
+        self.request: tuple[User, User] | None = (fromUser, toUser)
+
+    def load(self, userIds: set[int], now: float) -> dict[int, UserConnections]:
+        connections = super().load(userIds, now)
+        if self.request is not None:
+            fromUser, toUser = self.request
+            self.request = None
+            sendFriendRequest(fromUser=fromUser, toUser=toUser)
+            # The signals only invalidate the process-wide graph
+            self.invalidate(fromUser.pk, toUser.pk)
+        return connections
+
+
+@pytest.mark.django_db
+def test_friend_graph_invalidation_while_loading() -> None:
+    users = [User.objects.create(username=f"user{index}") for index in range(3)]
+    graph = InvalidatedWhileLoadingGraph(fromUser=users[2], toUser=users[1])
+
+    connections = graph.get_many([users[0].pk, users[1].pk])
+    assert users[2].pk not in connections[users[1].pk].received
+
+    assert list(graph.users) == [users[0].pk], "The state loaded before the invalidation is not cached"
+    assert graph.generations == {} and graph.loads == 0
+    assert users[2].pk in graph.get(users[1].pk).received
@@ -1,6 +1,7 @@
 import pytest
 from api.friends.friend_requests import sendFriendRequest
-from api.friends.friends import FriendStatus, getFriends, getFriendsWithStatuses
+from api.friends.friends import FriendStatus, getFriends, getFriendship, getFriendsWithStatuses
+from api.friends.models import Friendship
 from users.models import User
 
 
@@ -52,3 +53,17 @@ def test_getFriendsWithStatuses() -> None:
 
     friendsWithStatuses3 = getFriendsWithStatuses(user=user4, referenceStatusUser=user1)
     assert len(friendsWithStatuses3) == 0
+
+
+@pytest.mark.django_db
+def test_friendship_ordering() -> None:
+    user1 = User.objects.create(username="user1")
+    user2 = User.objects.create(username="user2")
+
+    sendFriendRequest(fromUser=user2, toUser=user1)
+    sendFriendRequest(fromUser=user1, toUser=user2)
+
+    friendship = Friendship.objects.get()
+    assert (friendship.user1_id, friendship.user2_id) == (user1.pk, user2.pk)
+    assert getFriendship(user1, user2) == getFriendship(user2, user1) == friendship
+
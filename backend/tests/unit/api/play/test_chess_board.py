@@ -0,0 +1,46 @@
+import random
+
+import chess
+from api.play.chess_board import ChessBoard
+
+
+def play_random_game(seed: int) -> None:
+    """Plays random moves on both boards, mostly between the knights and kings to reach repetitions"""
+    generator = random.Random(seed)
+    board = ChessBoard()
+    referenceBoard = chess.Board()
+
+    while True:
+        legalMoves = sorted(referenceBoard.legal_moves, key=lambda move: move.uci())
+        quietMoves = [move for move in legalMoves if not referenceBoard.is_irreversible(move)]
+        move = generator.choice(quietMoves if quietMoves and generator.random() < 0.9 else legalMoves)
+
+        result = board.move(move)
+        referenceBoard.push(move)
+        assert result == referenceBoard.outcome(claim_draw=True)
+        if result is not None:
+            return
+
+
+def test_outcome_matches_python_chess() -> None:
+    for seed in range(9):
+        play_random_game(seed)
+
+
+def test_threefold_repetition_claimed_in_advance() -> None:
+    board = ChessBoard()
+    for move in ["g1f3", "g8f6", "f3g1", "f6g8", "g1f3", "g8f6"]:
+        assert board.move(move) is None
+
+    # Moving the knight back repeats the position after the 2nd move for the third time, so it can be claimed already
+    outcome = board.move("f3g1")
+    assert isinstance(outcome, chess.Outcome)
+    assert outcome.termination == chess.Termination.THREEFOLD_REPETITION
+
+
+def test_illegal_moves() -> None:
+    board = ChessBoard()
+    assert board.move("e2e5") == ChessBoard.ILLEGAL_MOVE
+    assert board.move("e7e5") == ChessBoard.ILLEGAL_MOVE
+    assert board.move("e2e4") is None
+    assert board.moves == [chess.Move.from_uci("e2e4")]
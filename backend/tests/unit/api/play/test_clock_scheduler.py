@@ -0,0 +1,96 @@
+import threading
+
+from api.play.clock_scheduler import ClockScheduler
+
+
+class FakeTime:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_deadlines_fire_in_order() -> None:
+    fakeTime = FakeTime()
+    scheduler = ClockScheduler(time_source=fakeTime, autostart=False)
+
+    fired: list[str] = []
+    scheduler.schedule(3, lambda: fired.append("third"))
+    scheduler.schedule(1, lambda: fired.append("first"))
+    scheduler.schedule(2, lambda: fired.append("second"))
+
+    assert scheduler.run_pending() == 0
+
+    fakeTime.now = 2
+    assert scheduler.run_pending() == 2
+    assert fired == ["first", "second"]
+
+    fakeTime.now = 10
+    assert scheduler.run_pending() == 1
+    assert fired == ["first", "second", "third"]
+    assert scheduler.stats()["pending"] == 0
+
+
+def test_cancel_and_reschedule() -> None:
+    fakeTime = FakeTime()
+    scheduler = ClockScheduler(time_source=fakeTime, autostart=False)
+
+    fired: list[str] = []
+    cancelled = scheduler.schedule(1, lambda: fired.append("cancelled"))
+    rescheduled = scheduler.schedule(1, lambda: fired.append("rescheduled"))
+
+    cancelled.cancel()
+    rescheduled = scheduler.reschedule(rescheduled, 5)
+    assert scheduler.stats()["pending"] == 1
+
+    fakeTime.now = 2
+    assert scheduler.run_pending() == 0
+
+    fakeTime.now = 5
+    assert scheduler.run_pending() == 1
+    assert fired == ["rescheduled"]
+
+    # Cancelling a fired deadline does nothing
+    rescheduled.cancel()
+    assert scheduler.stats()["cancelled"] == 2
+
+
+def test_many_concurrent_clocks() -> None:
+    fakeTime = FakeTime()
+    scheduler = ClockScheduler(time_source=fakeTime, autostart=False)
+
+    totalClocks = 50_000
+    firedCount = 0
+
+    def onFire() -> None:
+        nonlocal firedCount
+        firedCount += 1
+
+    deadlines = [scheduler.schedule(i % 60, onFire) for i in range(totalClocks)]
+    assert scheduler.stats()["pending"] == totalClocks
+
+    # Every clock is rescheduled once, as it happens on every move
+    deadlines = [scheduler.reschedule(deadline, 60) for deadline in deadlines]
+    stats = scheduler.stats()
+    assert stats["pending"] == totalClocks
+    assert stats["next_deadline_in"] == 60
+    assert len(scheduler._heap) < totalClocks * 2
+
+    for deadline in deadlines[: totalClocks // 2]:
+        deadline.cancel()
+
+    fakeTime.now = 60
+    assert scheduler.run_pending() == totalClocks // 2
+    assert firedCount == totalClocks // 2
+    assert scheduler.stats()["pending"] == 0
+
+
+def test_scheduler_thread_fires_deadline() -> None:
+    scheduler = ClockScheduler()
+
+    fired = threading.Event()
+    scheduler.schedule(0.01, fired.set)
+
+    assert fired.wait(timeout=5)
+    assert scheduler.stats()["fired"] == 1
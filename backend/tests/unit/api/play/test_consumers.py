@@ -0,0 +1,493 @@
+import asyncio
+import json
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, cast
+
+import chess
+import pytest
+from api.play.chess_board import CustomOutcome, CustomTermination
+from api.play.consumers import GameConsumer, QueueConsumer, SpectatorConsumer, start_relay
+from api.play.game import ALL_ACTIVE_GAMES_MANAGER, GameManager
+from api.play.game_modes import GameMode, TimeControl
+from api.play.game_queue import GROUP_QUEUE_MANAGER
+from api.play.game_store import SQLiteGameStore
+from api.play.models import Game as GameModel
+from api.play.models import Player
+from api.play.spectators import SPECTATORS
+from api.utils import in_db_thread, wait_for_db_tasks
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator  # type: ignore
+from django.contrib.auth.models import AnonymousUser
+from users.models import AnonymousSessionUser
+
+
+def create_anonymous_player(session_key: str) -> Player:
+    anonymousUser = AnonymousSessionUser.objects.create(session_key=session_key)
+    return Player.getOrCreatePlayerByUser(anonymousUser)
+
+
+async def connect_player(
+    game_id: str, session_key: str, manager: GameManager = ALL_ACTIVE_GAMES_MANAGER
+) -> WebsocketCommunicator:
+    communicator = WebsocketCommunicator(GameConsumer.as_asgi(manager=manager), f"/api/play/{game_id}")
+    communicator.scope["user"] = AnonymousUser()
+    communicator.scope["session"] = SimpleNamespace(session_key=session_key)
+
+    connected, _ = await communicator.connect()
+    assert connected
+    return communicator
+
+
+async def receive_types(communicator: WebsocketCommunicator, total: int) -> dict[str, Any]:
+    messages = [await communicator.receive_json_from() for _ in range(total)]
+    return {message["type"]: message for message in messages}
+
+
+async def wait_until(condition: Callable[[], bool], timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out waiting for the condition"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_game_consumer_relays_moves() -> None:
+    whitePlayer = create_anonymous_player("session_white")
+    blackPlayer = create_anonymous_player("session_black")
+
+    game = ALL_ACTIVE_GAMES_MANAGER.start_game(
+        (whitePlayer, blackPlayer), GameMode("Blitz", [TimeControl(180)]), TimeControl(180)
+    )
+    if game.players.by_color(chess.WHITE).player != whitePlayer:
+        whitePlayer, blackPlayer = blackPlayer, whitePlayer
+    sessionKeys = {
+        player: cast(AnonymousSessionUser, player.anonymousUser).session_key for player in (whitePlayer, blackPlayer)
+    }
+
+    async def play() -> None:
+        white = await connect_player(game.game_id, sessionKeys[whitePlayer])
+        black = await connect_player(game.game_id, sessionKeys[blackPlayer])
+
+        await white.send_json_to({"type": "join", "game_id": game.game_id})
+        assert (await white.receive_json_from())["type"] == "join"
+
+        await black.send_json_to({"type": "join", "game_id": game.game_id})
+        assert "join" in await receive_types(black, 2)
+        assert (await white.receive_json_from())["type"] == "game_started"
+
+        await white.send_json_to({"type": "move", "move": "e2e4"})
+        move = await black.receive_json_from()
+        assert move["type"] == "move"
+        assert move["move"] == "e2e4"
+        assert move["ply"] == 1
+        # Only the clocks of the players are sent with the moves
+        assert set(move) == {"type", "seq", "move", "ply", "white_time", "black_time"}
+        assert all(179_000 < move[time] <= 180_000 for time in ("white_time", "black_time"))
+
+        await white.send_json_to({"type": "move", "move": "e7e5"})
+        assert (await white.receive_json_from()) == {"type": "error", "message": "It is not your turn"}
+
+        await black.send_json_to({"type": "resign"})
+        for communicator in (white, black):
+            result = await communicator.receive_json_from()
+            assert result == {"type": "game_result", "seq": 3, "termination": "resignation", "winner": "white"}
+
+        await wait_for_db_tasks()
+        assert await in_db_thread(GameModel.objects.count) == 1
+
+        await white.disconnect()
+        await black.disconnect()
+
+    async_to_sync(play)()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_game_consumer_receives_events_from_other_threads() -> None:
+    players = (create_anonymous_player("session1"), create_anonymous_player("session2"))
+    game = ALL_ACTIVE_GAMES_MANAGER.start_game(players, GameMode("Bullet", [TimeControl(60)]), TimeControl(60))
+
+    async def play() -> None:
+        communicators = [await connect_player(game.game_id, f"session{index}") for index in (1, 2)]
+        for communicator in communicators:
+            await communicator.send_json_to({"type": "join", "game_id": game.game_id})
+        for communicator in communicators:
+            assert set(await receive_types(communicator, 2)) == {"join", "game_started"}
+
+        # Flag-falls are published from the clock scheduler thread
+        await asyncio.to_thread(game.ran_out_of_time)
+        for communicator in communicators:
+            result = await communicator.receive_json_from()
+            assert result == {"type": "game_result", "seq": 2, "termination": "timeout", "winner": "black"}
+            await communicator.disconnect()
+
+    async_to_sync(play)()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_game_consumer_plays_premoves() -> None:
+    players = [create_anonymous_player(f"session{index}") for index in (1, 2)]
+    game = ALL_ACTIVE_GAMES_MANAGER.start_game(
+        (players[0], players[1]), GameMode("Bullet", [TimeControl(60)]), TimeControl(60)
+    )
+    blackPlayer = game.players.by_color(chess.BLACK).player
+    blackIndex = players.index(cast(Player, blackPlayer)) + 1
+
+    async def play() -> None:
+        white = await connect_player(game.game_id, f"session{3 - blackIndex}")
+        black = await connect_player(game.game_id, f"session{blackIndex}")
+        for communicator in (white, black):
+            await communicator.send_json_to({"type": "join", "game_id": game.game_id})
+        for communicator in (white, black):
+            assert set(await receive_types(communicator, 2)) == {"join", "game_started"}
+
+        await black.send_json_to({"type": "premove", "move": "e7e5"})
+        await white.send_json_to({"type": "move", "move": "e2e4"})
+        assert [(await black.receive_json_from())["move"] for _ in range(2)] == ["e2e4", "e7e5"]
+        assert (await white.receive_json_from())["move"] == "e7e5"
+        # Black's clock only ran while the premove was played
+        assert game.players.by_color(chess.BLACK).get_current_time() > 59_900
+
+        # The knight can't go to d7 while the pawn is there, the premove is dropped once it is played
+        await black.send_json_to({"type": "premove", "move": "b8d7"})
+        await white.send_json_to({"type": "move", "move": "g1f3"})
+        assert (await black.receive_json_from())["move"] == "g1f3"
+        assert await black.receive_json_from() == {"type": "premove_cancelled", "seq": 5}
+        assert game.get_moves_list() == ["e2e4", "e7e5", "g1f3"]
+
+        await black.send_json_to({"type": "resign"})
+        for communicator in (white, black):
+            assert (await communicator.receive_json_from())["type"] == "game_result"
+            await communicator.disconnect()
+        await wait_for_db_tasks()
+
+    async_to_sync(play)()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_game_consumer_measures_rtt(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(GameConsumer, "PING_INTERVAL", 0.01)
+    players = (create_anonymous_player("session1"), create_anonymous_player("session2"))
+    game = ALL_ACTIVE_GAMES_MANAGER.start_game(players, GameMode("Bullet", [TimeControl(60)]), TimeControl(60))
+
+    async def play() -> None:
+        communicator = await connect_player(game.game_id, "session1")
+        await communicator.send_json_to({"type": "join", "game_id": game.game_id})
+        assert (await communicator.receive_json_from())["type"] == "join"
+
+        ping = await communicator.receive_json_from()
+        assert ping["type"] == "ping"
+        await communicator.send_json_to({"type": "pong", "ping_id": ping["ping_id"]})
+        while game.players.by_player(players[0]).rtt is None:
+            await asyncio.sleep(0.01)
+
+        await communicator.disconnect()
+
+    async_to_sync(play)()
+    game.finish(CustomOutcome(CustomTermination.ABORTED, None))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_game_consumer_closes_games_taken_over() -> None:
+    players = (create_anonymous_player("session1"), create_anonymous_player("session2"))
+    game = ALL_ACTIVE_GAMES_MANAGER.start_game(players, GameMode("Bullet", [TimeControl(60)]), TimeControl(60))
+    store = ALL_ACTIVE_GAMES_MANAGER.store
+
+    async def play() -> None:
+        communicator = await connect_player(game.game_id, "session1")
+        await communicator.send_json_to({"type": "join", "game_id": game.game_id})
+        assert (await communicator.receive_json_from())["type"] == "join"
+
+        # The worker was paused for longer than its lease, another worker took the game over meanwhile
+        now = time.time()
+        ALL_ACTIVE_GAMES_MANAGER.lease_expires[game.game_id] = now
+        store.renew([game.game_id], ALL_ACTIVE_GAMES_MANAGER.worker_id, expires_at=now)
+        assert store.acquire(game.game_id, "other", expires_at=now + 15, now=now)
+
+        await communicator.send_json_to({"type": "offer_draw"})
+        assert await communicator.receive_output() == {
+            "type": "websocket.close",
+            "code": GameConsumer.GAME_MOVED_CLOSE_CODE,
+        }
+        assert ALL_ACTIVE_GAMES_MANAGER.get_local_game(game.game_id) is None
+        assert not game.players.by_player(players[0]).offers_draw
+
+    try:
+        async_to_sync(play)()
+    finally:
+        store.delete(game.game_id, "other")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_game_consumer_renews_stale_leases_off_the_event_loop(monkeypatch: pytest.MonkeyPatch) -> None:
+    players = (create_anonymous_player("session1"), create_anonymous_player("session2"))
+    game = ALL_ACTIVE_GAMES_MANAGER.start_game(players, GameMode("Bullet", [TimeControl(60)]), TimeControl(60))
+    store = ALL_ACTIVE_GAMES_MANAGER.store
+    acquiredIn: list[threading.Thread] = []
+    acquire = store.acquire
+
+    def record_acquire(*args: Any, **kwargs: Any) -> bool:
+        acquiredIn.append(threading.current_thread())
+        return acquire(*args, **kwargs)
+
+    monkeypatch.setattr(store, "acquire", record_acquire)
+
+    async def play() -> None:
+        communicator = await connect_player(game.game_id, "session1")
+        await communicator.send_json_to({"type": "join", "game_id": game.game_id})
+        assert (await communicator.receive_json_from())["type"] == "join"
+
+        # The renewals were held up, but no other worker took the game over
+        ALL_ACTIVE_GAMES_MANAGER.lease_expires[game.game_id] = time.time()
+        await communicator.send_json_to({"type": "offer_draw"})
+        await wait_until(lambda: game.players.by_player(players[0]).offers_draw)
+
+        assert acquiredIn and threading.current_thread() not in acquiredIn
+        assert ALL_ACTIVE_GAMES_MANAGER.holds_lease(game)
+        await communicator.disconnect()
+
+    async_to_sync(play)()
+    game.finish(CustomOutcome(CustomTermination.ABORTED, None))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_spectators_receive_the_same_frames() -> None:
+    players = [create_anonymous_player(f"session{index}") for index in (1, 2)]
+    game = ALL_ACTIVE_GAMES_MANAGER.start_game(
+        (players[0], players[1]), GameMode("Bullet", [TimeControl(60)]), TimeControl(60)
+    )
+    whiteIndex = players.index(cast(Player, game.players.by_color(chess.WHITE).player)) + 1
+
+    async def spectate() -> WebsocketCommunicator:
+        communicator = WebsocketCommunicator(SpectatorConsumer.as_asgi(), "/api/play/spectate")
+        connected, _ = await communicator.connect()
+        assert connected
+        await communicator.send_json_to({"type": "spectate", "game_id": game.game_id})
+        return communicator
+
+    async def play() -> None:
+        white = await connect_player(game.game_id, f"session{whiteIndex}")
+        black = await connect_player(game.game_id, f"session{3 - whiteIndex}")
+        early = await spectate()
+        assert (await early.receive_json_from())["game_started"] is False
+
+        for communicator in (white, black):
+            await communicator.send_json_to({"type": "join", "game_id": game.game_id})
+        for communicator in (white, black):
+            assert set(await receive_types(communicator, 2)) == {"join", "game_started"}
+        started = await early.receive_json_from()
+        assert started["type"] == "game_started"
+        assert started["players"]["white"]["user_type"] == "anonymous"
+
+        await white.send_json_to({"type": "move", "move": "e2e4"})
+        assert (await black.receive_json_from())["move"] == "e2e4"
+        assert (await early.receive_json_from())["move"] == "e2e4"
+
+        late = await spectate()
+        snapshot = await late.receive_json_from()
+        assert snapshot["type"] == "spectate"
+        assert snapshot["moves"] == ["e2e4"] and snapshot["game_started"]
+        assert snapshot["players"]["black"]["time"] <= 60_000
+        assert len(SPECTATORS.games) == 1
+
+        await black.send_json_to({"type": "move", "move": "e7e5"})
+        assert (await white.receive_json_from())["move"] == "e7e5"
+        frames = [await spectator.receive_output() for spectator in (early, late)]
+        assert frames[0] == frames[1]
+        assert json.loads(frames[0]["text"])["ply"] == 2
+
+        await black.send_json_to({"type": "resign"})
+        for communicator in (white, black, early, late):
+            assert (await communicator.receive_json_from())["type"] == "game_result"
+        for spectator in (early, late):
+            assert (await spectator.receive_output())["type"] == "websocket.close"
+        assert not SPECTATORS.games
+
+        await white.disconnect()
+        await black.disconnect()
+        await wait_for_db_tasks()
+
+    async_to_sync(play)()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_player_without_session() -> None:
+    async def connect() -> None:
+        communicator = WebsocketCommunicator(QueueConsumer.as_asgi(), "/api/play/queue")
+        communicator.scope["user"] = AnonymousUser()
+        communicator.scope["session"] = SimpleNamespace(session_key=None)
+        await communicator.connect()
+
+        assert (await communicator.receive_json_from())["message"] == "Session is missing"
+        assert (await communicator.receive_output())["code"] == 4001
+        assert not await AnonymousSessionUser.objects.aexists()
+
+    async_to_sync(connect)()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_spectating_unknown_game() -> None:
+    async def spectate() -> None:
+        communicator = WebsocketCommunicator(SpectatorConsumer.as_asgi(), "/api/play/spectate")
+        await communicator.connect()
+
+        await communicator.send_json_to({"type": "spectate", "game_id": "abc"})
+        assert (await communicator.receive_json_from())["message"].startswith("Invalid game ID length")
+        await communicator.send_json_to({"type": "spectate", "game_id": "abcd1234"})
+        assert (await communicator.receive_json_from())[
+            "message"
+        ] == "There is no active game with the provided Game ID"
+        assert not SPECTATORS.games
+
+        await communicator.disconnect()
+
+    async_to_sync(spectate)()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_game_consumer_resumes_from_last_event() -> None:
+    players = [create_anonymous_player(f"session{index}") for index in (1, 2)]
+    game = ALL_ACTIVE_GAMES_MANAGER.start_game(
+        (players[0], players[1]), GameMode("Bullet", [TimeControl(60)]), TimeControl(60)
+    )
+    whiteIndex = players.index(cast(Player, game.players.by_color(chess.WHITE).player)) + 1
+
+    async def play() -> None:
+        white = await connect_player(game.game_id, f"session{whiteIndex}")
+        black = await connect_player(game.game_id, f"session{3 - whiteIndex}")
+        for communicator in (white, black):
+            await communicator.send_json_to({"type": "join", "game_id": game.game_id})
+        for communicator in (white, black):
+            assert set(await receive_types(communicator, 2)) == {"join", "game_started"}
+
+        # White's connection drops right after the move was sent
+        await white.send_json_to({"type": "move", "move": "e2e4"})
+        assert (await black.receive_json_from())["seq"] == 2
+        await white.disconnect()
+        await black.send_json_to({"type": "move", "move": "e7e5"})
+        await black.send_json_to({"type": "offer_draw"})
+
+        white = await connect_player(game.game_id, f"session{whiteIndex}")
+        await white.send_json_to({"type": "resume", "game_id": game.game_id, "last_seq": 1})
+        replayed = [await white.receive_json_from() for _ in range(4)]
+        assert [(message["type"], message["seq"]) for message in replayed] == [
+            ("move", 2),
+            ("move", 3),
+            ("offer_draw", 4),
+            ("resume", 4),
+        ]
+        assert [message["move"] for message in replayed[:2]] == ["e2e4", "e7e5"]
+
+        # Events that are not kept any more, or were never published, fall back to the full game state
+        for lastSeq in (-1, 5):
+            spare = await connect_player(game.game_id, f"session{whiteIndex}")
+            await spare.send_json_to({"type": "resume", "game_id": game.game_id, "last_seq": lastSeq})
+            state = await spare.receive_json_from()
+            assert state["type"] == "join" and state["seq"] == 4
+            assert state["moves"] == ["e2e4", "e7e5"]
+            await spare.disconnect()
+
+        await black.send_json_to({"type": "resign"})
+        for communicator in (white, black):
+            assert (await communicator.receive_json_from())["seq"] == 5
+            await communicator.disconnect()
+        await wait_for_db_tasks()
+
+    async_to_sync(play)()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_enqueue_into_empty_queue() -> None:
+    player = create_anonymous_player("session1")
+
+    async def enqueue() -> None:
+        communicator = WebsocketCommunicator(QueueConsumer.as_asgi(), "/api/play/queue")
+        communicator.scope["user"] = AnonymousUser()
+        communicator.scope["session"] = SimpleNamespace(session_key="session1")
+        assert (await communicator.connect())[0]
+
+        await communicator.send_json_to({"type": "enqueue", "game_mode": "Blitz", "time_control": 180})
+        assert await communicator.receive_nothing()
+        assert GROUP_QUEUE_MANAGER.is_player_queuing(player)
+
+        await communicator.disconnect()
+        assert not GROUP_QUEUE_MANAGER.is_player_queuing(player)
+
+    async_to_sync(enqueue)()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_players_on_different_workers_play_each_other(tmp_path: Path) -> None:
+    store = SQLiteGameStore(str(tmp_path / "games.db"))
+    owner = GameManager(store, worker_id="owner")
+    other = GameManager(store, worker_id="other")
+
+    players = (create_anonymous_player("session1"), create_anonymous_player("session2"))
+    game = owner.start_game(players, GameMode("Blitz", [TimeControl(180)]), TimeControl(180))
+    whiteSession, blackSession = (
+        ("session1", "session2") if game.players.by_player(players[0]).color else ("session2", "session1")
+    )
+
+    async def play() -> None:
+        start_relay(owner)
+        white = await connect_player(game.game_id, whiteSession, owner)
+        black = await connect_player(game.game_id, blackSession, other)
+
+        await white.send_json_to({"type": "join", "game_id": game.game_id})
+        assert (await white.receive_json_from())["type"] == "join"
+
+        # The other worker forwards the websocket to the owner of the game
+        await black.send_json_to({"type": "join", "game_id": game.game_id})
+        assert set(await receive_types(black, 2)) == {"join", "game_started"}
+        assert (await white.receive_json_from())["type"] == "game_started"
+        assert len(owner.relay.connections) == 1
+        assert other.get_local_game(game.game_id) is None
+
+        await white.send_json_to({"type": "move", "move": "e2e4"})
+        assert (await black.receive_json_from())["move"] == "e2e4"
+        await black.send_json_to({"type": "move", "move": "e7e5"})
+        assert (await white.receive_json_from())["move"] == "e7e5"
+
+        await black.send_json_to({"type": "resign"})
+        for communicator in (white, black):
+            result = await communicator.receive_json_from()
+            assert result == {"type": "game_result", "seq": 4, "termination": "resignation", "winner": "white"}
+            assert (await communicator.receive_output())["type"] == "websocket.close"
+            await communicator.disconnect()
+
+        await wait_for_db_tasks()
+        assert owner.relay.connections == {}
+
+    async_to_sync(play)()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_queue_is_forwarded_to_the_matchmaker(tmp_path: Path) -> None:
+    store = SQLiteGameStore(str(tmp_path / "games.db"))
+    matchmaker = GameManager(store, worker_id="matchmaker")
+    other = GameManager(store, worker_id="other")
+    player = create_anonymous_player("session1")
+    assert matchmaker.get_matchmaker() == "matchmaker"
+
+    async def queue() -> None:
+        start_relay(matchmaker)
+        communicator = WebsocketCommunicator(QueueConsumer.as_asgi(manager=other), "/api/play/queue")
+        communicator.scope["user"] = AnonymousUser()
+        communicator.scope["session"] = SimpleNamespace(session_key="session1")
+        assert (await communicator.connect())[0]
+
+        await communicator.send_json_to({"type": "enqueue", "game_mode": "Blitz", "time_control": 180})
+        await wait_until(lambda: GROUP_QUEUE_MANAGER.is_player_queuing(player))
+        assert len(matchmaker.relay.connections) == 1
+        assert other.relay.connections == {}
+
+        # Leaving the queue on the other worker removes the player from the matchmaker's queue
+        await communicator.disconnect()
+        await wait_until(lambda: not GROUP_QUEUE_MANAGER.is_player_queuing(player))
+
+    try:
+        async_to_sync(queue)()
+    finally:
+        matchmaker.matchmaker_expires = 0
@@ -0,0 +1,24 @@
+from api.play.events import GameEvent, GameEventLog
+
+
+def test_game_event_log() -> None:
+    log = GameEventLog()
+    assert log.since(0) == []
+
+    for _ in range(GameEventLog.SIZE + 10):
+        event: GameEvent = {"type": "offer_draw"}
+        log.append(event)
+    assert log.last_seq == GameEventLog.SIZE + 10
+
+    assert log.since(log.last_seq) == []
+    assert [event["seq"] for event in log.since(log.last_seq - 2) or []] == [log.last_seq - 1, log.last_seq]
+    # The oldest kept event directly follows the sequence number
+    assert len(log.since(10) or []) == GameEventLog.SIZE
+    assert log.since(9) is None
+    assert log.since(log.last_seq + 1) is None
+    assert log.since(-1) is None
+
+    # The numbering continues after a takeover, the events before it are not kept
+    takenOver = GameEventLog(log.last_seq)
+    assert takenOver.since(log.last_seq) == []
+    assert takenOver.since(log.last_seq - 1) is None
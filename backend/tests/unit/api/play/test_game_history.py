@@ -0,0 +1,86 @@
+import pytest
+from api.friends.friend_graph import FRIEND_GRAPH
+from api.friends.friend_requests import sendFriendRequest
+from api.friends.friends import getFriendStatus
+from api.play.models import Game, Move, Player
+from api.play.move_encoding import encode_moves
+from api.play.utils import decode_games_cursor, get_player_games_json
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from users.models import AnonymousSessionUser, User
+
+
+def create_history(player: Player, opponents: list[Player], gameCount: int) -> None:
+    for index in range(gameCount):
+        opponent = opponents[index % len(opponents)]
+        white, black = (player, opponent) if index % 2 == 0 else (opponent, player)
+        game = Game.objects.create(
+            player_white=white,
+            player_black=black,
+            termination=0,
+            winner_color=True,
+            time_control=60,
+            # Every third game is an old one, with its moves kept as Move rows
+            encoded_moves=encode_moves(["e2e4", "e7e5"]) if index % 3 else None,
+        )
+        if index % 3 == 0:
+            Move.objects.bulk_create([Move(game=game, order=0, move="d2d4"), Move(game=game, order=1, move="d7d5")])
+
+
+def count_queries(player: Player, limit: int) -> int:
+    FRIEND_GRAPH.clear()
+    with CaptureQueriesContext(connection) as queries:
+        games, _ = get_player_games_json(player, limit=limit)
+    assert len(games) == limit
+    return len(queries)
+
+
+@pytest.mark.django_db
+def test_game_history_query_count() -> None:
+    me = User.objects.create(username="me")
+    player = Player.getOrCreatePlayerByUser(me)
+
+    opponentUsers = [User.objects.create(username=f"opponent{index}") for index in range(4)]
+    sendFriendRequest(fromUser=me, toUser=opponentUsers[0])
+    sendFriendRequest(fromUser=opponentUsers[0], toUser=me)
+    sendFriendRequest(fromUser=me, toUser=opponentUsers[1])
+    sendFriendRequest(fromUser=opponentUsers[2], toUser=me)
+
+    opponents = [Player.getOrCreatePlayerByUser(user) for user in opponentUsers]
+    opponents.append(Player.getOrCreatePlayerByUser(AnonymousSessionUser.objects.create(session_key="anonymous")))
+    create_history(player, opponents, gameCount=60)
+
+    assert count_queries(player, limit=5) == count_queries(player, limit=60) <= 5
+
+    games, _ = get_player_games_json(player, limit=60)
+    for game in games:
+        assert game["moves"] in (["e2e4", "e7e5"], ["d2d4", "d7d5"])
+        for color in ("white", "black"):
+            playerDict = game["players"][color]
+            if playerDict["user_type"] == "registered" and not playerDict["is_current_user"]:
+                opponentUser = User.objects.get(username=playerDict["username"])
+                assert playerDict["status"] == getFriendStatus(me, opponentUser).value
+
+
+@pytest.mark.django_db
+def test_game_history_cursor_pagination() -> None:
+    player = Player.getOrCreatePlayerByUser(User.objects.create(username="me"))
+    opponent = Player.getOrCreatePlayerByUser(User.objects.create(username="opponent"))
+    create_history(player, [opponent], gameCount=25)
+    # Games finished in the same batch share their date, the game ID breaks the tie
+    tiedGames = list(Game.objects.order_by("game_id")[5:8])
+    Game.objects.filter(game_id__in=[game.game_id for game in tiedGames]).update(date=tiedGames[0].date)
+
+    gameIds: list[int] = []
+    cursor = None
+    while True:
+        games, nextCursor = get_player_games_json(player, limit=10, cursor=decode_games_cursor(cursor) if cursor else None)
+        gameIds.extend(game["game_id"] for game in games)
+        if nextCursor is None:
+            break
+        cursor = nextCursor
+
+    assert gameIds == list(Game.objects.order_by("-date", "-game_id").values_list("game_id", flat=True))
+
+    with pytest.raises(ValueError):
+        decode_games_cursor("not a cursor")
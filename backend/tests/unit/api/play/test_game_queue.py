@@ -1,10 +1,14 @@
+import threading
+from typing import cast
+
 import pytest
-from api.play.chess_board import CustomOutcome
+from api.play.chess_board import CustomOutcome, CustomTermination
 from api.play.game import ALL_ACTIVE_GAMES_MANAGER, Game
 from api.play.game_modes import GameMode, TimeControl
-from api.play.game_queue import GameQueueManager
+from api.play.game_queue import GameQueue, GameQueueManager, GroupQueueManager, QueuingPlayer, RatingWindow
 from api.play.models import Player
 from chess import Termination
+from django.test import Client
 from users.models import AnonymousSessionUser
 
 
@@ -35,6 +39,11 @@ def test_anonymous_user_game() -> None:
 
     queueManager.add_player(player1, queue, onAddPlayer1Callback)
     queueManager.add_player(player2, queue, onAddPlayer2Callback)
+    assert not addedPlayer1, "Players are paired on the next tick"
+
+    assert queueManager.match_players() == 1
+    assert addedPlayer1 and addedPlayer2
+    assert not queueManager.is_player_queuing(player1)
 
     first_game = next(iter(ALL_ACTIVE_GAMES_MANAGER.games.values()))
 
@@ -44,3 +53,142 @@ def test_anonymous_user_game() -> None:
     assert gameId is not None
 
     ALL_ACTIVE_GAMES_MANAGER.remove_game(gameId)
+
+
+def test_ticks_run_in_matchmaking_thread(monkeypatch: pytest.MonkeyPatch) -> None:
+    startedIn: list[str] = []
+    gameFound = threading.Event()
+
+    def start_game(*_: object) -> Game:
+        startedIn.append(threading.current_thread().name)
+        return cast(Game, None)
+
+    monkeypatch.setattr(ALL_ACTIVE_GAMES_MANAGER, "start_game", start_game)
+    gameMode = GameMode("Blitz", [TimeControl(120)])
+    queueManager = GameQueueManager([gameMode])
+    monkeypatch.setattr(queueManager, "TICK_INTERVAL", 0)
+    queue = queueManager.get_game_queue("Blitz", 120)
+    assert queue is not None
+
+    queueManager.add_player(Player(pk=0), queue, lambda _: None)
+    queueManager.add_player(Player(pk=1), queue, lambda _: gameFound.set())
+
+    assert gameFound.wait(timeout=5)
+    assert startedIn == ["matchmaking"], "The game store is not written from the clock scheduler thread"
+    assert not queueManager.queuing_players
+
+
+def test_group_queue_manager_player_index() -> None:
+    players = [Player(pk=index) for index in range(3)]
+    groupQueueManager = GroupQueueManager()
+
+    groupManager = groupQueueManager.get_create_queue_manager(("user2", "user1"))
+    assert groupQueueManager.get_create_queue_manager(("user1", "user2")) is groupManager
+
+    groupQueue = groupManager.get_game_queue("BLITZ", 180)
+    defaultQueue = groupQueueManager.default.get_game_queue("blitz", 300)
+    assert groupQueue is not None and defaultQueue is not None
+    assert groupManager.get_game_queue("Blitz", 181) is None
+
+    groupManager.add_player(players[0], groupQueue, lambda _: None)
+    groupQueueManager.default.add_player(players[1], defaultQueue, lambda _: None)
+    assert groupQueueManager.is_player_queuing(players[0])
+    assert groupQueueManager.is_player_queuing(players[1])
+    assert not groupQueueManager.is_player_queuing(players[2])
+
+    groupQueueManager.remove_player(players[0])
+    assert not groupQueueManager.is_player_queuing(players[0])
+    assert ("user1", "user2") not in groupQueueManager.groups, "Empty groups are removed"
+
+    groupQueueManager.remove_player(players[1])
+    groupQueueManager.remove_player(players[2])
+    assert len(defaultQueue) == 0
+    assert groupQueueManager.player_index == {}
+
+
+def test_group_emptied_by_tick_is_removed(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(ALL_ACTIVE_GAMES_MANAGER, "start_game", lambda *_: None)
+    players = [Player(pk=index) for index in range(3)]
+    groupQueueManager = GroupQueueManager()
+    getCreateQueueManager = groupQueueManager.get_create_queue_manager
+
+    for player in players[:2]:
+        assert groupQueueManager.add_player(("user1", "user2"), player, "blitz", 180, lambda _: None)
+    groupManager = groupQueueManager.groups[("user1", "user2")]
+    assert not groupQueueManager.add_player(("user1", "user2"), players[2], "blitz", 181, lambda _: None)
+
+    assert groupManager.match_players() == 1
+    assert groupQueueManager.groups == {}, "The tick removes the group it emptied"
+
+    # The manager was looked up before the tick removed its group, the player is added to a new one instead
+    lookups = iter([groupManager])
+    monkeypatch.setattr(
+        groupQueueManager, "get_create_queue_manager", lambda group: next(lookups, None) or getCreateQueueManager(group)
+    )
+    assert groupQueueManager.add_player(("user1", "user2"), players[2], "blitz", 180, lambda _: None)
+    assert not groupManager.is_player_queuing(players[2])
+    assert groupQueueManager.groups[("user1", "user2")].is_player_queuing(players[2])
+    groupQueueManager.remove_player(players[2])
+
+
+class MatchingPlayerIndex(dict[Player, GameQueueManager]):
+    """Player index whose lookups race with a tick, which matches the player right after they are looked up"""
+
+    def get(self, player: Player, default: GameQueueManager | None = None) -> GameQueueManager | None:  # type: ignore[override]
+        queue = super().get(player, default)
+        if queue is not None:
+            queue.discard_player(player)
+        return queue
+
+
+def test_remove_matched_player() -> None:
+    players = [Player(pk=index) for index in range(2)]
+    groupQueueManager = GroupQueueManager()
+    groupManager = groupQueueManager.get_create_queue_manager(("user1", "user2"))
+    groupManager.player_index = groupQueueManager.player_index = MatchingPlayerIndex()
+    groupQueue = groupManager.get_game_queue("blitz", 180)
+    assert groupQueue is not None
+
+    for player in players:
+        groupManager.add_player(player, groupQueue, lambda _: None)
+
+    groupQueueManager.remove_player(players[0])
+    assert not groupManager.is_player_queuing(players[0])
+    assert groupQueueManager.groups == {("user1", "user2"): groupManager}, "The group stays for the other player"
+
+    with pytest.raises(ValueError):
+        groupManager.remove_player(players[0])
+
+
+def test_rating_window_widens() -> None:
+    gameMode = GameMode("Blitz", [TimeControl(120)])
+    queue = GameQueue(gameMode, gameMode.time_controls[0])
+    window = RatingWindow(initial=100, widening_per_second=10, maximum=300)
+
+    ratings = [1500, 1550, 1800, 2400]
+    for index, rating in enumerate(ratings):
+        queue.add_player(QueuingPlayer(Player(pk=index), queue, rating=rating, joined_at=0))
+
+    pairs = queue.find_pairs(now=0, window=window)
+    assert [(lower.player.pk, higher.player.pk) for lower, higher in pairs] == [(0, 1)]
+
+    # After waiting, the window covers the 1800 player, but never the gap to 2400
+    queue.remove_player(Player(pk=0))
+    queue.remove_player(Player(pk=1))
+    queue.add_player(QueuingPlayer(Player(pk=4), queue, rating=1600, joined_at=0))
+    assert queue.find_pairs(now=5, window=window) == []
+    assert len(queue.find_pairs(now=20, window=window)) == 1
+    assert len(queue.find_pairs(now=1000, window=window)) == 1
+
+    assert len(queue.find_pairs(now=0, window=None)) == 1
+
+
+@pytest.mark.django_db
+def test_create_link_game() -> None:
+    response = Client().get("/api/play/create_link?game_mode=Blitz&time_control=180")
+    assert response.status_code == 200
+
+    gameId = response.json()["game_id"]
+    game = ALL_ACTIVE_GAMES_MANAGER.get_local_game(gameId)
+    assert game is not None and game.is_link_game
+    game.finish(CustomOutcome(CustomTermination.ABORTED, None))
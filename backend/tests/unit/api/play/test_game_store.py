@@ -0,0 +1,204 @@
+import threading
+import time
+from pathlib import Path
+from typing import cast
+
+import chess
+import pytest
+from api.play.chess_board import CustomOutcome, CustomTermination
+from api.play.game import GameManager, GameStatus
+from api.play.game_modes import GameMode, TimeControl
+from api.play.game_store import GameSnapshot, GameStore, InMemoryGameStore, SQLiteGameStore
+from api.play.models import Player
+from users.models import AnonymousSessionUser
+
+
+@pytest.mark.parametrize("storeType", ["memory", "sqlite"])
+def test_leases(storeType: str, tmp_path: Path) -> None:
+    store: GameStore = InMemoryGameStore() if storeType == "memory" else SQLiteGameStore(str(tmp_path / "games.db"))
+
+    snapshot = cast(
+        GameSnapshot, {"game_id": "abcd1234", "moves": ["e2e4"], "players": [{"player_id": 7}, {"player_id": None}]}
+    )
+    assert store.create(snapshot, "worker1", expires_at=10)
+    assert not store.create(cast(GameSnapshot, {**snapshot, "moves": []}), "worker2", expires_at=10)
+    assert store.load("abcd1234") == snapshot
+    assert store.player_ids() == {7}
+
+    assert store.acquire("abcd1234", "worker1", expires_at=10, now=0)
+    assert not store.acquire("abcd1234", "worker2", expires_at=10, now=5)
+    assert store.owner("abcd1234", now=5) == "worker1"
+
+    assert store.renew(["abcd1234", "missing1"], "worker1", expires_at=20) == ["missing1"]
+    assert not store.acquire("abcd1234", "worker2", expires_at=30, now=15)
+
+    # The lease expired, e.g. the first worker was paused, and the game is taken over
+    assert store.acquire("abcd1234", "worker2", expires_at=30, now=25)
+    assert store.owner("abcd1234", now=25) == "worker2"
+
+    # The writes of the former owner are fenced off
+    movedSnapshot = cast(GameSnapshot, {**snapshot, "moves": ["e2e4", "e7e5"]})
+    assert store.save(movedSnapshot, "worker2")
+    assert not store.save(snapshot, "worker1")
+    assert store.renew(["abcd1234"], "worker1", expires_at=40) == ["abcd1234"]
+    store.delete("abcd1234", "worker1")
+    assert store.load("abcd1234") == movedSnapshot
+
+    store.release("abcd1234", "worker1")
+    assert store.owner("abcd1234", now=25) == "worker2"
+    store.release("abcd1234", "worker2")
+    assert store.owner("abcd1234", now=25) is None
+
+    store.delete("abcd1234", "worker2")
+    assert store.load("abcd1234") is None
+    assert store.player_ids() == set()
+
+
+@pytest.mark.parametrize("storeType", ["memory", "sqlite"])
+def test_roles(storeType: str, tmp_path: Path) -> None:
+    store: GameStore = InMemoryGameStore() if storeType == "memory" else SQLiteGameStore(str(tmp_path / "games.db"))
+
+    assert store.role_owner("matchmaker", now=0) is None
+    assert store.acquire_role("matchmaker", "worker1", expires_at=10, now=0)
+    assert not store.acquire_role("matchmaker", "worker2", expires_at=15, now=5)
+    assert store.role_owner("matchmaker", now=5) == "worker1"
+
+    assert store.acquire_role("matchmaker", "worker1", expires_at=20, now=5), "The owner renews the role"
+    assert store.role_owner("matchmaker", now=15) == "worker1"
+    assert store.acquire_role("matchmaker", "worker2", expires_at=30, now=20), "An expired role is taken over"
+    assert store.role_owner("matchmaker", now=20) == "worker2"
+    assert store.role_owner("matchmaker", now=30) is None
+
+
+@pytest.mark.django_db
+def test_take_over_game(tmp_path: Path) -> None:
+    store = SQLiteGameStore(str(tmp_path / "games.db"))
+    owner = GameManager(store, worker_id="owner")
+    other = GameManager(store, worker_id="other")
+
+    players = [Player.getOrCreatePlayerByUser(AnonymousSessionUser.objects.create(session_key=f"s{i}")) for i in (1, 2)]
+    game = owner.start_game((players[0], players[1]), GameMode("Blitz", [TimeControl(180)]), TimeControl(180))
+    for player in players:
+        game.join_player(player)
+
+    whitePlayer = game.players.by_color(chess.WHITE).player
+    blackPlayer = game.players.by_color(chess.BLACK).player
+    assert not isinstance(whitePlayer, str) and not isinstance(blackPlayer, str)
+    game.move(whitePlayer, "e2e4")
+    game.move(blackPlayer, "e7e5")
+    game.offer_draw(whitePlayer)
+
+    # The owner's lease is valid, other workers can only read the state
+    assert other.get_game(game.game_id) is None
+    snapshot = other.get_snapshot(game.game_id)
+    assert snapshot is not None and snapshot["moves"] == ["e2e4", "e7e5"]
+
+    # The owner crashes and its lease expires
+    for gamePlayer in game.players.gamePlayers:
+        gamePlayer.stop_timer()
+    game.abortTimer.cancel()
+    assert store.renew([game.game_id], "owner", expires_at=0) == []
+
+    restoredGame = other.get_game(game.game_id)
+    assert restoredGame is not None
+    assert store.owner(game.game_id, now=0) == "other"
+
+    assert restoredGame.status == GameStatus.IN_PROGRESS
+    assert restoredGame.get_moves_list() == ["e2e4", "e7e5"]
+    assert restoredGame.board.board.fen() == game.board.board.fen()
+    assert restoredGame.players.by_player(whitePlayer).offers_draw
+    assert restoredGame.is_players_turn(whitePlayer)
+    assert 179_000 < restoredGame.players.by_player(whitePlayer).get_current_time() <= 180_000
+    # The events are numbered on from the owner's last event
+    assert restoredGame.events.last_seq == game.events.last_seq == 4
+
+    for gamePlayer in restoredGame.players.gamePlayers:
+        gamePlayer.stop_timer()
+    restoredGame.abortTimer.cancel()
+
+
+@pytest.mark.django_db
+def test_lost_games_are_dropped(tmp_path: Path) -> None:
+    store = SQLiteGameStore(str(tmp_path / "games.db"))
+    owner = GameManager(store, worker_id="owner")
+    other = GameManager(store, worker_id="other")
+
+    players = [Player.getOrCreatePlayerByUser(AnonymousSessionUser.objects.create(session_key=f"s{i}")) for i in (1, 2)]
+    game = owner.start_game((players[0], players[1]), GameMode("Blitz", [TimeControl(180)]), TimeControl(180))
+    for player in players:
+        game.join_player(player)
+
+    # The owner is paused for longer than its lease and the game is taken over
+    store.renew([game.game_id], "owner", expires_at=0)
+    takenOverGame = other.get_game(game.game_id)
+    assert takenOverGame is not None
+
+    # The owner finds out on its next write, which doesn't reach the store
+    whitePlayer = game.players.by_color(chess.WHITE).player
+    assert not isinstance(whitePlayer, str)
+    game.move(whitePlayer, "e2e4")
+    assert owner.get_local_game(game.game_id) is None
+    snapshot = store.load(game.game_id)
+    assert snapshot is not None and snapshot["moves"] == []
+
+    # Nor does it finish the game of the new owner
+    game.finish(CustomOutcome(CustomTermination.ABORTED, None))
+    assert store.owner(game.game_id, now=time.time()) == "other"
+    assert other.owns(takenOverGame)
+
+    # A lost lease is also noticed by the renewal
+    secondGame = owner.start_game((players[0], players[1]), GameMode("Blitz", [TimeControl(180)]), TimeControl(180))
+    store.renew([secondGame.game_id], "owner", expires_at=0)
+    assert other.get_game(secondGame.game_id) is not None
+    owner.renew_leases()
+    assert owner.games == {}
+    assert not owner.owns(secondGame)
+
+    for manager in (owner, other):
+        for activeGame in list(manager.games.values()):
+            activeGame.stop_timers()
+
+
+class SlowGameStore(InMemoryGameStore):
+    """Game store whose saves wait until `released` is set"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.released = threading.Event()
+        self.saves = 0
+
+    def save(self, snapshot: GameSnapshot, owner: str) -> bool:
+        self.released.wait()
+        self.saves += 1
+        return super().save(snapshot, owner)
+
+
+@pytest.mark.django_db
+def test_game_store_writer() -> None:
+    store = SlowGameStore()
+    manager = GameManager(store, worker_id="owner")
+    manager.writer.start()
+
+    players = [Player.getOrCreatePlayerByUser(AnonymousSessionUser.objects.create(session_key=f"s{i}")) for i in (1, 2)]
+    game = manager.start_game((players[0], players[1]), GameMode("Blitz", [TimeControl(180)]), TimeControl(180))
+    for player in players:
+        game.join_player(player)
+
+    # The moves don't wait for the store, the changes made while it is busy are saved once
+    moves = ["e2e4", "e7e5", "g1f3", "b8c6"]
+    for move in moves:
+        mover = game.players.by_color(game.board.color_to_move).player
+        assert not isinstance(mover, str)
+        game.move(mover, move)
+
+    store.released.set()
+    manager.writer.stop()
+    assert store.saves + manager.writer.coalesced == len(players) + len(moves)
+    assert store.saves <= 2
+    snapshot = store.load(game.game_id)
+    assert snapshot is not None and snapshot["moves"] == moves
+
+    # A finished game is deleted after its pending saves
+    game.stop_timers()
+    manager.remove_game(game.game_id)
+    assert store.load(game.game_id) is None
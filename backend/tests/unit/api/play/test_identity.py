@@ -0,0 +1,126 @@
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from api.play.identity import PLAYER_IDENTITIES, IdentityResolver, has_identity
+from api.play.models import Player
+from api.play.utils import ensure_session_identity, session_identity
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.signed_cookies import SessionStore as SignedCookieSessionStore
+from django.contrib.sessions.models import Session
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from users.models import AnonymousSessionUser, User
+
+
+def session(session_key: str) -> Any:
+    return SimpleNamespace(session_key=session_key)
+
+
+@pytest.mark.django_db
+def test_cached_players() -> None:
+    user = User.objects.create(username="user")
+
+    with CaptureQueriesContext(connection) as queries:
+        anonymousPlayer = PLAYER_IDENTITIES.get_player(AnonymousUser(), session("session"))
+        userPlayer = PLAYER_IDENTITIES.get_player(user, session("user_session"))
+    assert len(queries) > 0
+    assert anonymousPlayer.anonymousUser is not None and anonymousPlayer.anonymousUser.session_key == "session"
+    assert userPlayer.user == user
+
+    with CaptureQueriesContext(connection) as queries:
+        assert PLAYER_IDENTITIES.get_player(AnonymousUser(), session("session")) is anonymousPlayer
+        assert PLAYER_IDENTITIES.get_player(user, session("other_session")) is userPlayer
+    assert len(queries) == 0
+
+    with pytest.raises(ValueError):
+        PLAYER_IDENTITIES.get_player(AnonymousUser(), session(""))
+
+
+@pytest.mark.django_db
+def test_deleted_players_are_dropped() -> None:
+    player = PLAYER_IDENTITIES.get_player(AnonymousUser(), session("session"))
+    assert player.anonymousUser is not None
+    player.anonymousUser.delete()
+
+    newPlayer = PLAYER_IDENTITIES.get_player(AnonymousUser(), session("session"))
+    assert newPlayer.pk != player.pk
+    assert Player.objects.filter(pk=newPlayer.pk).exists()
+
+
+@pytest.mark.django_db
+def test_identity_resolver_eviction_and_expiry() -> None:
+    now = 0.0
+    identities = IdentityResolver(time_source=lambda: now)
+    identities.MAX_PLAYERS = 2
+
+    players = [identities.get_player(AnonymousUser(), session(f"session{index}")) for index in range(3)]
+    assert identities.get_cached_player(("session", "session0")) is None
+    assert identities.get_cached_player(("session", "session1")) is players[1]
+    assert identities.keys == {players[1].pk: ("session", "session1"), players[2].pk: ("session", "session2")}
+
+    now = identities.TTL
+    assert identities.get_cached_player(("session", "session1")) is None
+    assert identities.get_player(AnonymousUser(), session("session1")) == players[1]
+
+
+@pytest.mark.django_db
+def test_get_or_create_player_race(monkeypatch: pytest.MonkeyPatch) -> None:
+    user = User.objects.create(username="user")
+    anonymousUser = AnonymousSessionUser.objects.create(session_key="session")
+    with pytest.raises(IntegrityError), transaction.atomic():
+        AnonymousSessionUser.objects.create(session_key="session")
+
+    # A concurrent connect creates the player right after this one didn't find it
+    get = QuerySet.get
+    concurrentPlayers: list[Player] = []
+
+    def racing_get(self: QuerySet[Any], *args: Any, **kwargs: Any) -> Any:
+        if self.model is Player and not concurrentPlayers:
+            concurrentPlayers.append(Player.objects.create(**kwargs))
+            raise Player.DoesNotExist
+        return get(self, *args, **kwargs)
+
+    monkeypatch.setattr(QuerySet, "get", racing_get)
+    for owner in ({"user": user}, {"anonymousUser": anonymousUser}):
+        concurrentPlayers.clear()
+        player = Player.getOrCreatePlayerByUser(*owner.values())
+        assert player == concurrentPlayers[0]
+        assert Player.objects.filter(**owner).count() == 1
+
+
+@pytest.mark.django_db
+def test_sessions_are_created_once_an_identity_is_needed(client: Client) -> None:
+    assert client.get("/api/auth/is_authenticated").status_code == 200
+    assert client.get("/api/play/game/1").status_code == 404
+    assert not Session.objects.exists()
+    assert settings.SESSION_COOKIE_NAME not in client.cookies
+
+    assert client.post("/api/play/identity").status_code == 200
+    sessionKey = client.cookies[settings.SESSION_COOKIE_NAME].value
+    assert Session.objects.filter(session_key=sessionKey).exists()
+
+    client.post("/api/play/identity")
+    assert client.cookies[settings.SESSION_COOKIE_NAME].value == sessionKey
+    assert Session.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_signed_cookie_session_identity() -> None:
+    session = SignedCookieSessionStore()
+    assert session_identity(session) is None
+    assert not has_identity(AnonymousUser(), session)
+
+    anonymousId = ensure_session_identity(session)
+    assert ensure_session_identity(session) == session_identity(session) == anonymousId
+    session["other"] = "data"
+    session.save()
+
+    # The cookie changes with the session data, the identity stays
+    loadedSession = SignedCookieSessionStore(session_key=session.session_key)
+    assert session_identity(loadedSession) == anonymousId
+    player = PLAYER_IDENTITIES.get_player(AnonymousUser(), loadedSession)
+    assert player.anonymousUser is not None and player.anonymousUser.session_key == anonymousId
@@ -0,0 +1,29 @@
+import pytest
+from api.play.models import Game, Move
+from api.play.move_encoding import decode_moves, encode_moves
+from django.core.management import call_command
+
+
+def test_encode_decode() -> None:
+    moves = ["e2e4", "d7d5", "e4d5", "g8f6", "a7a8q", "h2h1n", "e1g1", "0000"]
+
+    encoded = encode_moves(moves)
+    assert len(encoded) == 2 * len(moves)
+    assert decode_moves(encoded) == moves
+    assert decode_moves(encode_moves([])) == []
+
+    with pytest.raises(ValueError):
+        encode_moves(["e2e9"])
+
+
+@pytest.mark.django_db
+def test_backfill_encoded_moves() -> None:
+    games = [Game.objects.create(termination=0, winner_color=True, time_control=60) for _ in range(3)]
+    for game, moves in zip(games, [["e2e4", "e7e5"], [], ["d2d4"]]):
+        Move.objects.bulk_create([Move(game=game, order=order, move=move) for order, move in enumerate(moves)])
+    assert games[0].get_moves_list() == ["e2e4", "e7e5"]
+
+    call_command("backfill_encoded_moves", chunk_size=2, delete_moves=True)
+
+    assert Move.objects.count() == 0
+    assert [game.get_moves_list() for game in Game.objects.order_by("game_id")] == [["e2e4", "e7e5"], [], ["d2d4"]]
@@ -0,0 +1,69 @@
+import pytest
+from api.play.models import Game, Move, Player, Rating
+from api.play.persistence import FinishedGame, GamePersistenceQueue
+from django.db import OperationalError
+from users.models import AnonymousSessionUser
+
+
+class LockedDatabaseQueue(GamePersistenceQueue):
+    """Fails the first writes the same way SQLite does while another connection holds the write lock"""
+
+    RETRY_DELAY = 0
+
+    def __init__(self, lockedWrites: int) -> None:
+        super().__init__()
+        self.lockedWrites = lockedWrites
+
+    def write_games(self, batch: list[FinishedGame]) -> None:
+        if self.lockedWrites > 0:
+            self.lockedWrites -= 1
+            raise OperationalError("database is locked")
+        super().write_games(batch)
+
+
+def finished_game(whiteId: int, blackId: int) -> FinishedGame:
+    return {
+        "white_id": whiteId,
+        "black_id": blackId,
+        "game_mode": "Bullet",
+        "time_control": 60,
+        "termination": 6,
+        "winner": True,
+        "moves": ["e2e4", "e7e5", "d1h5"],
+    }
+
+
+@pytest.mark.django_db
+def test_batched_writes_with_retries() -> None:
+    white, black = [Player.getOrCreatePlayerByUser(AnonymousSessionUser.objects.create(session_key=f"s{i}")) for i in (1, 2)]
+
+    queue = LockedDatabaseQueue(lockedWrites=2)
+    queue.BATCH_SIZE = 2
+    queue.pending.extend(finished_game(white.pk, black.pk) for _ in range(5))
+    assert queue.stats()["depth"] == 5
+
+    assert queue.flush() == 5
+
+    stats = queue.stats()
+    assert stats["depth"] == 0
+    assert stats["batches"] == 3
+    assert stats["retries"] == 2
+    assert stats["failed"] == 0
+    assert stats["flush_latency_p50"] is not None
+
+    assert Game.objects.count() == 5
+    assert Move.objects.count() == 0, "Moves are only stored encoded"
+    assert Game.objects.latest().get_moves_list() == ["e2e4", "e7e5", "d1h5"]
+    assert Rating.objects.get(player=white, game_mode="Bullet").games == 5
+
+
+@pytest.mark.django_db
+def test_persistent_lock_drops_nothing_silently() -> None:
+    white, black = [Player.getOrCreatePlayerByUser(AnonymousSessionUser.objects.create(session_key=f"s{i}")) for i in (1, 2)]
+
+    queue = LockedDatabaseQueue(lockedWrites=100)
+    queue.pending.extend(finished_game(white.pk, black.pk) for _ in range(2))
+
+    assert queue.flush() == 0
+    assert queue.stats()["failed"] == 2
+    assert Game.objects.count() == 0
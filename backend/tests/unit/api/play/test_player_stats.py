@@ -0,0 +1,95 @@
+import pytest
+from api.friends.friend_requests import sendFriendRequest
+from api.friends.models import Friendship
+from api.play.models import Player, PlayerStats
+from api.play.persistence import FinishedGame, GamePersistenceQueue
+from api.play.stats import rebuild_player_stats
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from users.models import User
+
+
+def finished_game(white: Player, black: Player, gameMode: str, timeControl: int, winner: bool | None) -> FinishedGame:
+    return {
+        "white_id": white.pk,
+        "black_id": black.pk,
+        "game_mode": gameMode,
+        "time_control": timeControl,
+        "termination": 0,
+        "winner": winner,
+        "moves": [],
+    }
+
+
+def stats_fields(player: Player) -> tuple[object, ...]:
+    stats = PlayerStats.objects.get(player=player)
+    return (stats.games, stats.wins, stats.losses, stats.draws, stats.modes, stats.friends, stats.friend_requests)
+
+
+@pytest.mark.django_db
+def test_incremental_stats_match_rebuild() -> None:
+    users = [User.objects.create(username=f"user{index}") for index in range(3)]
+    players = [Player.getOrCreatePlayerByUser(user) for user in users]
+
+    queue = GamePersistenceQueue()
+    queue.submit(finished_game(players[0], players[1], "Blitz", 180, True))
+    queue.submit(finished_game(players[1], players[0], "Bullet", 60, None))
+    queue.submit(finished_game(players[2], players[0], "Bullet", 60, True))
+
+    sendFriendRequest(fromUser=users[0], toUser=users[1])
+    sendFriendRequest(fromUser=users[1], toUser=users[0])
+    sendFriendRequest(fromUser=users[2], toUser=users[0])
+    sendFriendRequest(fromUser=users[1], toUser=users[2])
+    Friendship.objects.get().delete()
+    sendFriendRequest(fromUser=users[2], toUser=users[1])
+
+    incremental = [stats_fields(player) for player in players]
+    assert incremental[0] == (3, 1, 1, 1, {"Blitz": {"wins": 1, "losses": 0, "draws": 0}, "Bullet": {"wins": 0, "losses": 1, "draws": 1}}, 0, 1)
+    assert incremental[2][5] == 1
+
+    PlayerStats.objects.update(games=100, friends=100)
+    call_command("rebuild_player_stats", chunk_size=2)
+    assert [stats_fields(player) for player in players] == incremental
+
+
+@pytest.mark.django_db
+def test_profile_is_a_single_row_lookup() -> None:
+    user = User.objects.create(username="user")
+    opponent = User.objects.create(username="opponent")
+    sendFriendRequest(fromUser=opponent, toUser=user)
+    rebuild_player_stats([Player.getOrCreatePlayerByUser(user).pk])
+    client = Client()
+    assert client.get("/api/user_interactions/profile/user").json()["total_friends"] == 0
+
+    with CaptureQueriesContext(connection) as queries:
+        profile = client.get("/api/user_interactions/profile/user").json()
+    assert profile["total_games"] == 0
+    assert profile["game_stats"] == {"wins": 0, "losses": 0, "draws": 0, "modes": {}}
+
+    statsQueries = [query["sql"] for query in queries if "api_playerstats" in query["sql"]]
+    assert len(statsQueries) == 1
+    assert not any('FROM "api_friendship"' in query["sql"] for query in queries)
+
+
+@pytest.mark.django_db
+def test_profile_lookup_is_read_only() -> None:
+    users = [User.objects.create(username=f"user{index}") for index in range(3)]
+    sendFriendRequest(fromUser=users[1], toUser=users[0])
+    sendFriendRequest(fromUser=users[0], toUser=users[1])
+    sendFriendRequest(fromUser=users[2], toUser=users[0])
+    Player.getOrCreatePlayerByUser(users[1])
+    client = Client()
+
+    with CaptureQueriesContext(connection) as queries:
+        withoutPlayer = client.get("/api/user_interactions/profile/user0").json()
+        withoutStats = client.get("/api/user_interactions/profile/user1").json()
+
+    assert not any(query["sql"].startswith(("INSERT", "UPDATE", "DELETE")) for query in queries)
+    assert not Player.objects.filter(user=users[0]).exists()
+    assert not PlayerStats.objects.exists()
+
+    assert (withoutPlayer["total_games"], withoutPlayer["total_friends"], withoutPlayer["games"]) == (0, 1, [])
+    assert withoutPlayer["game_stats"] == {"wins": 0, "losses": 0, "draws": 0, "modes": {}}
+    assert (withoutStats["total_games"], withoutStats["total_friends"]) == (0, 1)
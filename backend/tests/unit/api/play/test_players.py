@@ -0,0 +1,145 @@
+import random
+from contextlib import contextmanager
+from typing import Iterator
+
+import chess
+import pytest
+from api.play import players
+from api.play.clock_scheduler import ClockScheduler
+from api.play.latency import RttEstimator
+from api.play.players import MAX_LAG_COMPENSATION, NS_PER_MS, NS_PER_S, GamePlayer, seconds_to_ns
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+
+class SimulatedClock:
+    """Monotonic clock of the players and the clock scheduler, which only moves when the test advances it"""
+
+    def __init__(self) -> None:
+        self.now_ns = 10**15
+        self.scheduler = ClockScheduler(time_source=self.monotonic, autostart=False)
+
+    def monotonic_ns(self) -> int:
+        return self.now_ns
+
+    def monotonic(self) -> float:
+        return self.now_ns / NS_PER_S
+
+
+@contextmanager
+def simulated_clock() -> Iterator[SimulatedClock]:
+    clock = SimulatedClock()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(players, "time", clock)
+        monkeypatch.setattr(players, "CLOCK_SCHEDULER", clock.scheduler)
+        yield clock
+
+
+def play_moves(gamePlayer: GamePlayer, clock: SimulatedClock, oneWayLatency: float, thinkTimes: list[float]) -> None:
+    """The opponent's move reaches the player after the latency, and the player's move the server after it again"""
+    for thinkTime in thinkTimes:
+        gamePlayer.start_timer(lambda: None)
+        clock.now_ns += seconds_to_ns(oneWayLatency + thinkTime + oneWayLatency)
+        gamePlayer.stop_timer(moved=True)
+
+
+@pytest.mark.parametrize("oneWayLatency", [0, 0.05, 0.15, 0.4])
+def test_lag_compensation(oneWayLatency: float) -> None:
+    generator = random.Random(0)
+
+    gamePlayer = GamePlayer("UnknownPlayer", chess.WHITE, 60)
+    estimator = RttEstimator()
+    for _ in range(50):
+        estimator.add_sample(2 * oneWayLatency * generator.uniform(0.9, 1.1))
+    gamePlayer.rtt = estimator.rtt
+
+    thinkTimes = [generator.uniform(0.1, 1) for _ in range(40)]
+    with simulated_clock() as clock:
+        play_moves(gamePlayer, clock, oneWayLatency, thinkTimes)
+
+    compensation = min(2 * oneWayLatency, MAX_LAG_COMPENSATION)
+    estimatedCompensation = gamePlayer.get_lag_compensation_ns() / NS_PER_S
+    assert estimatedCompensation == pytest.approx(compensation, abs=0.1 * 2 * oneWayLatency)
+
+    # Only the network delay above the compensation cap and the error of the estimate are charged
+    chargedTime = 60 - gamePlayer.time_ns / NS_PER_S
+    estimateError = abs(estimatedCompensation - compensation)
+    uncompensatedLag = 2 * oneWayLatency - compensation
+    assert (
+        abs(chargedTime - sum(thinkTimes) - len(thinkTimes) * uncompensatedLag)
+        <= len(thinkTimes) * estimateError + 1e-6
+    )
+
+
+def test_no_compensation_without_rtt() -> None:
+    gamePlayer = GamePlayer("UnknownPlayer", chess.WHITE, 60)
+    with simulated_clock() as clock:
+        play_moves(gamePlayer, clock, 0.2, [1.0])
+    assert gamePlayer.time_ns == seconds_to_ns(58.6)
+
+
+def test_time_left_is_never_negative() -> None:
+    gamePlayer = GamePlayer("UnknownPlayer", chess.WHITE, 1)
+    with simulated_clock() as clock:
+        # The move is stopped before the clock scheduler got to the flag-fall
+        play_moves(gamePlayer, clock, 0, [1.5])
+
+    assert gamePlayer.time_ns < 0
+    assert gamePlayer.get_current_time() == 0
+    assert gamePlayer.to_snapshot()["time"] == 0
+
+
+def test_rtt_estimator() -> None:
+    estimator = RttEstimator()
+    assert estimator.pong(0) is None
+
+    pingId = estimator.ping()
+    rtt = estimator.pong(pingId)
+    assert rtt is not None and rtt >= 0
+    # Pongs of unknown or already answered pings are ignored
+    assert estimator.pong(pingId) == rtt
+    assert estimator.pong(pingId + 1) == rtt
+
+    estimator.rtt = 0.1
+    estimator.add_sample(0.9)
+    assert estimator.rtt == pytest.approx(0.2)
+
+
+@settings(deadline=None)
+@given(
+    time=st.sampled_from([10, 30, 60, 180, 600, 1800]),
+    increment=st.integers(0, 30),
+    delay=st.integers(0, 10),
+    rttMs=st.none() | st.integers(0, 1000),
+    moves=st.lists(st.tuples(st.integers(0, 20 * NS_PER_S), st.integers(0, 300 * NS_PER_MS)), max_size=200),
+)
+def test_clock_never_drifts(
+    time: int, increment: int, delay: int, rttMs: int | None, moves: list[tuple[int, int]]
+) -> None:
+    """Plays the moves of a player and compares their clock with the exact remaining time after every move"""
+    gamePlayer = GamePlayer("UnknownPlayer", chess.WHITE, time, increment, delay)
+    gamePlayer.rtt = rttMs / 1000 if rttMs is not None else None
+    compensation = min(rttMs or 0, 500) * NS_PER_MS
+    flagged: list[bool] = []
+
+    remaining = time * NS_PER_S
+    with simulated_clock() as clock:
+        for thinkTime, oneWayLatency in moves:
+            gamePlayer.start_timer(lambda: flagged.append(True))
+            elapsed = thinkTime + 2 * oneWayLatency
+
+            # The clock shown halfway through the move, without the lag compensation
+            clock.now_ns += elapsed // 2
+            shownRemaining = max(remaining - max(elapsed // 2 - delay * NS_PER_S, 0), 0)
+            assert abs(gamePlayer.get_current_time() * NS_PER_MS - shownRemaining) < NS_PER_MS
+
+            clock.now_ns += elapsed - elapsed // 2
+            clock.scheduler.run_pending()
+            if elapsed >= remaining + delay * NS_PER_S + compensation:
+                assert flagged and gamePlayer.time_ns == 0
+                return
+
+            gamePlayer.stop_timer(moved=True)
+            remaining += increment * NS_PER_S - max(elapsed - delay * NS_PER_S - compensation, 0)
+            assert not flagged
+            assert gamePlayer.time_ns == remaining
@@ -0,0 +1,46 @@
+import pytest
+from api.play.models import Player, Rating
+from api.play.persistence import GamePersistenceQueue
+from api.play.ratings import Glicko2Rating, glicko2_update
+from django.core.management import call_command
+from users.models import AnonymousSessionUser
+
+
+def test_glicko2_example() -> None:
+    """Example from Glickman's "Example of the Glicko-2 system" """
+    player = Glicko2Rating(1500, 200, 0.06)
+    results = [(Glicko2Rating(1400, 30), 1.0), (Glicko2Rating(1550, 100), 0.0), (Glicko2Rating(1700, 300), 0.0)]
+
+    rated = glicko2_update(player, results)
+    assert rated.rating == pytest.approx(1464.06, abs=0.01)
+    assert rated.deviation == pytest.approx(151.52, abs=0.01)
+    assert rated.volatility == pytest.approx(0.05999, abs=0.00001)
+
+
+@pytest.mark.django_db
+def test_batched_updates_match_recompute() -> None:
+    players = [Player.getOrCreatePlayerByUser(AnonymousSessionUser.objects.create(session_key=f"s{i}")) for i in range(3)]
+    results = [(0, 1, True), (1, 2, None), (2, 0, False), (0, 2, True), (1, 0, False)]
+
+    queue = GamePersistenceQueue()
+    for white, black, winner in results:
+        queue.submit(
+            {
+                "white_id": players[white].pk,
+                "black_id": players[black].pk,
+                "game_mode": "Blitz",
+                "time_control": 180,
+                "termination": 0,
+                "winner": winner,
+                "moves": [],
+            }
+        )
+
+    liveRatings = {rating.player_id: (rating.rating, rating.games) for rating in Rating.objects.all()}
+    assert liveRatings[players[0].pk][0] > liveRatings[players[2].pk][0]
+    assert sum(games for _, games in liveRatings.values()) == 2 * len(results)
+
+    call_command("recompute_ratings", chunk_size=2)
+
+    recomputedRatings = {rating.player_id: (rating.rating, rating.games) for rating in Rating.objects.all()}
+    assert recomputedRatings == pytest.approx(liveRatings)
@@ -0,0 +1,89 @@
+from collections import deque
+from datetime import timedelta
+from typing import cast
+
+import pytest
+from api.play.game import ALL_ACTIVE_GAMES_MANAGER
+from api.play.game_store import GameSnapshot
+from api.play.identity import PLAYER_IDENTITIES
+from api.play.models import Game, GameTerminations, Player
+from api.play.persistence import GAME_PERSISTENCE
+from api.play.reaper import ANONYMOUS_USER_REAPER
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+from pytest_django import Settings
+from users.models import AnonymousSessionUser, User
+
+
+def create_anonymous_player(session_key: str, expires_in: timedelta | None) -> Player:
+    if expires_in is not None:
+        Session.objects.create(session_key=session_key, session_data="", expire_date=timezone.now() + expires_in)
+    return Player.getOrCreatePlayerByUser(AnonymousSessionUser.objects.create(session_key=session_key))
+
+
+@pytest.mark.django_db
+def test_reap_stale_anonymous_users(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(ANONYMOUS_USER_REAPER, "BATCH_SIZE", 2)
+    monkeypatch.setattr(ANONYMOUS_USER_REAPER, "BATCH_PAUSE", 0)
+
+    expired = [create_anonymous_player(f"expired{index}", timedelta(days=-1)) for index in range(3)]
+    withoutSession = create_anonymous_player("without_session", None)
+    withoutPlayer = AnonymousSessionUser.objects.create(session_key="without_player")
+    live = create_anonymous_player("live", timedelta(days=1))
+    withGame = create_anonymous_player("with_game", timedelta(days=-1))
+    inActiveGame = create_anonymous_player("in_active_game", None)
+
+    registeredPlayer = Player.getOrCreatePlayerByUser(User.objects.create(username="registered"))
+    Game.objects.create(
+        player_white=registeredPlayer, player_black=withGame, termination=GameTerminations.RESIGNATION, time_control=180
+    )
+    snapshot = cast(GameSnapshot, {"game_id": "abcd1234", "players": [{"player_id": inActiveGame.pk}]})
+    ALL_ACTIVE_GAMES_MANAGER.store.create(snapshot, "worker", expires_at=0)
+    Session.objects.create(session_key="registered", session_data="", expire_date=timezone.now() - timedelta(days=1))
+
+    PLAYER_IDENTITIES.add(("session", "expired0"), expired[0])
+    try:
+        stats = ANONYMOUS_USER_REAPER.reap()
+    finally:
+        ALL_ACTIVE_GAMES_MANAGER.store.delete("abcd1234", "worker")
+
+    assert stats == {"sessions": 5, "anonymous_users": 5, "batches": 6}
+    assert set(Session.objects.values_list("session_key", flat=True)) == {"live"}
+    assert set(AnonymousSessionUser.objects.values_list("session_key", flat=True)) == {
+        "live",
+        "with_game",
+        "in_active_game",
+    }
+    assert set(Player.objects.all()) == {registeredPlayer, live, withGame, inActiveGame}
+    assert not Player.objects.filter(pk__in=[player.pk for player in [*expired, withoutSession]]).exists()
+    assert withoutPlayer.session_key not in AnonymousSessionUser.objects.values_list("session_key", flat=True)
+    assert PLAYER_IDENTITIES.get_cached_player(("session", "expired0")) is None
+
+
+@pytest.mark.django_db
+def test_keep_players_of_unwritten_games(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(ANONYMOUS_USER_REAPER, "BATCH_PAUSE", 0)
+    pendingWhite = create_anonymous_player("pending_white", timedelta(days=-1))
+    writingBlack = create_anonymous_player("writing_black", timedelta(days=-1))
+    create_anonymous_player("stale", timedelta(days=-1))
+
+    # Finished games that left the game store, but are not written yet
+    finishedGame = {"game_mode": "Blitz", "time_control": 180, "termination": 0, "winner": None, "moves": []}
+    monkeypatch.setattr(GAME_PERSISTENCE, "pending", deque([{**finishedGame, "white_id": pendingWhite.pk, "black_id": None}]))
+    monkeypatch.setattr(GAME_PERSISTENCE, "writing", [{**finishedGame, "white_id": None, "black_id": writingBlack.pk}])
+
+    assert ANONYMOUS_USER_REAPER.reap()["anonymous_users"] == 1
+    assert set(Player.objects.all()) == {pendingWhite, writingBlack}
+    assert not AnonymousSessionUser.objects.filter(session_key="stale").exists()
+
+
+def test_reaper_refuses_sessions_outside_the_database(settings: Settings, caplog: pytest.LogCaptureFixture) -> None:
+    settings.SESSION_ENGINE = "django.contrib.sessions.backends.signed_cookies"
+
+    ANONYMOUS_USER_REAPER.start(interval=60)
+    assert ANONYMOUS_USER_REAPER.thread is None
+    assert "reaper is not started" in caplog.text
+
+    with pytest.raises(CommandError, match="signed_cookies"):
+        call_command("reap_anonymous_users")
@@ -60,7 +60,7 @@ def test_get_player_games_json() -> None:
         player_white=player2, player_black=anonymousPlayer, time_control=600, termination=GameTerminations.CHECKMATE
     )
 
-    games = get_player_games_json(player1, page=1, limit=10)
+    games, _ = get_player_games_json(player1, limit=10)
     assert len(games) == 1
     assert games[0]["game_id"] == 1
     assert games[0]["players"]["white"] == {"user_type": "registered", "username": "user1", "is_current_user": True}
@@ -71,7 +71,7 @@ def test_get_player_games_json() -> None:
         "status": FriendStatus.notFriends.value,
     }
 
-    games2 = get_player_games_json(player2, page=1, limit=10)
+    games2, _ = get_player_games_json(player2, limit=10)
     assert len(games2) == 2
     assert games2[0]["game_id"] == 2
 
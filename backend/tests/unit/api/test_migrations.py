@@ -0,0 +1,110 @@
+from collections.abc import Iterator
+from typing import Any
+
+import api.friends.models  # noqa: F401
+import api.play.models  # noqa: F401
+import pytest
+from django.core.management import call_command
+from django.db import IntegrityError, connection, models
+from django.db.migrations.executor import MigrationExecutor
+
+
+@pytest.fixture
+def migrate_api() -> Iterator[MigrationExecutor]:
+    """Migration executor for tests that migrate the `api` app back, the app is migrated to the latest state after"""
+    executor = MigrationExecutor(connection)
+    yield executor
+
+    executor.loader.build_graph()
+    executor.migrate(executor.loader.graph.leaf_nodes("api"))
+
+
+def migrate_to(executor: MigrationExecutor, migration: str) -> Any:
+    """Migrates the `api` app to the migration, returns the app registry with the historical models of the migration"""
+    executor.loader.build_graph()
+    executor.migrate([("api", migration)])
+    return executor.loader.project_state(("api", migration)).apps
+
+
+@pytest.mark.django_db
+def test_migrations_match_models() -> None:
+    # Exits with an error when a model change has no migration. The models are registered once their modules are
+    # imported, `api.models` doesn't import them
+    call_command("makemigrations", "api", check=True, dry_run=True, verbosity=0)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_encoded_moves_migration(migrate_api: MigrationExecutor) -> None:
+    apps = migrate_to(migrate_api, "0002_rating")
+    Game = apps.get_model("api", "Game")
+    Move = apps.get_model("api", "Move")
+    game = Game.objects.create(termination=0, winner_color=True, time_control=60)
+    Move.objects.bulk_create([Move(game=game, order=order, move=move) for order, move in enumerate(["e2e4", "e7e5"])])
+
+    apps = migrate_to(migrate_api, "0004_backfill_encoded_moves")
+
+    game = apps.get_model("api", "Game").objects.get(game_id=game.game_id)
+    assert bytes(game.encoded_moves) == b"\x0c\x07\x34\x09"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_friendship_ordered_migration(migrate_api: MigrationExecutor) -> None:
+    apps = migrate_to(migrate_api, "0006_playerstats")
+    User = apps.get_model("users", "User")
+    Friendship = apps.get_model("api", "Friendship")
+    users = [User.objects.create(username=f"user{index}") for index in range(4)]
+    # Friendships saved before the order was enforced
+    Friendship.objects.bulk_create(
+        [
+            Friendship(user1=users[1], user2=users[0]),
+            Friendship(user1=users[0], user2=users[1]),
+            Friendship(user1=users[3], user2=users[2]),
+            Friendship(user1=users[0], user2=users[3]),
+        ]
+    )
+
+    apps = migrate_to(migrate_api, "0007_friendship_ordered")
+
+    pairs = list(apps.get_model("api", "Friendship").objects.values_list("user1_id", "user2_id"))
+    assert sorted(pairs) == [(users[0].pk, users[1].pk), (users[0].pk, users[3].pk), (users[2].pk, users[3].pk)]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_player_unique_user_migration(migrate_api: MigrationExecutor) -> None:
+    apps = migrate_to(migrate_api, "0007_friendship_ordered")
+    User = apps.get_model("users", "User")
+    AnonymousSessionUser = apps.get_model("users", "AnonymousSessionUser")
+    Player = apps.get_model("api", "Player")
+    Game = apps.get_model("api", "Game")
+    Rating = apps.get_model("api", "Rating")
+
+    # A database created before the session keys were unique
+    with connection.schema_editor() as schemaEditor:
+        field = models.CharField(max_length=255)
+        field.set_attributes_from_name("session_key")
+        field.model = AnonymousSessionUser
+        schemaEditor.alter_field(AnonymousSessionUser, AnonymousSessionUser._meta.get_field("session_key"), field)
+
+    user = User.objects.create(username="user")
+    userPlayers = [Player.objects.create(user=user) for _ in range(2)]
+    sessionPlayers = [
+        Player.objects.create(anonymousUser=AnonymousSessionUser.objects.create(session_key="session"))
+        for _ in range(2)
+    ]
+    game = Game.objects.create(
+        termination=0, winner_color=True, time_control=60, player_white=userPlayers[1], player_black=sessionPlayers[1]
+    )
+    Rating.objects.create(player=userPlayers[1], game_mode="Blitz")
+
+    apps = migrate_to(migrate_api, "0008_player_unique_user")
+
+    Player = apps.get_model("api", "Player")
+    assert sorted(Player.objects.values_list("pk", flat=True)) == [userPlayers[0].pk, sessionPlayers[0].pk]
+    game = apps.get_model("api", "Game").objects.get(pk=game.pk)
+    assert (game.player_white_id, game.player_black_id) == (userPlayers[0].pk, sessionPlayers[0].pk)
+    assert apps.get_model("api", "Rating").objects.get().player_id == userPlayers[0].pk
+
+    AnonymousSessionUser = apps.get_model("users", "AnonymousSessionUser")
+    assert AnonymousSessionUser.objects.count() == 1
+    with pytest.raises(IntegrityError):
+        AnonymousSessionUser.objects.create(session_key="session")
@@ -0,0 +1,73 @@
+import importlib.util
+import json
+import sys
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import ModuleType
+
+import pytest
+from api import serialization
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def load_stdlib_serialization() -> ModuleType:
+    """Loads a copy of the serialization module as if orjson wasn't installed"""
+    spec = importlib.util.spec_from_file_location("stdlib_serialization", serialization.__file__)
+    assert spec is not None and spec.loader is not None
+
+    module = importlib.util.module_from_spec(spec)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setitem(sys.modules, "orjson", None)
+        spec.loader.exec_module(module)
+    return module
+
+
+STDLIB_SERIALIZATION = load_stdlib_serialization()
+BACKENDS = [serialization, STDLIB_SERIALIZATION]
+
+DATA = {
+    "game_id": "a1b2c3d4",
+    "moves": ["e2e4", "e7e5"],
+    "players": {"white": {"username": 'Žluťoučký "kůň"\n', "time": 180_000}, "black": None},
+    "date": datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc),
+    "rating": Decimal("1500.5"),
+    "draw": False,
+    1: "integer key",
+}
+
+
+def test_backends() -> None:
+    assert serialization.HAS_ORJSON == (importlib.util.find_spec("orjson") is not None)
+    assert not STDLIB_SERIALIZATION.HAS_ORJSON
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_dumps_matches_django_encoder(backend: ModuleType) -> None:
+    expected = json.loads(json.dumps(DATA, cls=DjangoJSONEncoder))
+    assert backend.loads(backend.dumps(DATA)) == expected
+    assert backend.loads(backend.dumps_bytes(DATA)) == expected
+    assert expected["date"] == "2024-05-01T12:30:15.123Z"
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_message_schema(backend: ModuleType) -> None:
+    moveMessage = backend.MessageSchema("move", move=str, ply=int, draw=bool, players=dict, message=object)
+    values = {"move": 'e2"e4\\', "ply": 12, "draw": True, "players": DATA["players"], "message": None}
+
+    encoded = moveMessage.encode(**values)
+    assert json.loads(encoded) == {"type": "move", **json.loads(json.dumps(values))}
+    assert list(json.loads(encoded)) == ["type", *values]
+
+    assert json.loads(backend.MessageSchema("offer_%draw").encode()) == {"type": "offer_%draw"}
+
+    with pytest.raises(ValueError):
+        moveMessage.encode(move="e2e4")
+    with pytest.raises(ValueError):
+        moveMessage.encode(**values, unknown=1)
+
+
+def test_json_response() -> None:
+    response = serialization.JsonResponse({"error": "User does not exist"}, status=404)
+    assert response.status_code == 404
+    assert response["Content-Type"] == "application/json"
+    assert json.loads(response.content) == {"error": "User does not exist"}
@@ -11,4 +11,4 @@ class User(AbstractUser):
 
 class AnonymousSessionUser(models.Model):
     id = cast(int, models.AutoField(primary_key=True))
-    session_key = models.CharField(max_length=255)
+    session_key = models.CharField(max_length=255, unique=True)
@@ -12,12 +12,15 @@ import {
     JoinApiResponse,
     MoveApiResponse,
     PLAY_API_RESPONSE_TYPE,
+    PingApiResponse,
     PlayApiMessageType,
     PlayGameResultApiResponse,
     PlayOnMessageApiResponse,
+    ResumeApiResponse,
     SendApiMessageData,
 } from "types/api/play";
 import { GamePlayersApi } from "types/api/player";
+import { ensureIdentity } from "utils/api";
 import { validateId } from "utils/chess";
 import { parsePlayerApiResponse } from "utils/players";
 import { typedEntries } from "utils/utils";
@@ -25,6 +28,10 @@ import { getWSUri } from "utils/websockets";
 
 const ColorName = { white: Color.White, black: Color.Black };
 
+const REGULAR_CLOSE_CODE = 1000;
+const RECONNECT_DELAY_MS = 1000;
+const MAX_RECONNECT_ATTEMPTS = 5;
+
 export const CONNECTION_STATE = {
     CONNECTING: "CONNECTING",
     CONNECTED: "CONNECTED",
@@ -47,6 +54,14 @@ export const usePlayApi = (props: Props) => {
     const [gameResult, setGameResult] = React.useState<GameResultApiResponse | null>(null);
     const [highlightDrawButton, setHighlightDrawButton] = React.useState(false);
     const [players, setPlayers] = React.useState<PlayersProps | null>(null);
+    const [premove, setPremoveState] = React.useState<MoveName | null>(null);
+    // The websocket handlers are bound once, they read the premove from the ref
+    const premoveRef = React.useRef<MoveName | null>(null);
+    // Sequence number of the last game event received, the game is resumed from it after a reconnect
+    const lastSeqRef = React.useRef<number | null>(null);
+    // Number of moves on the board, the moves replayed after a reconnect may already be on it
+    const plyRef = React.useRef(0);
+    const reconnectAttemptsRef = React.useRef(0);
 
     const navigate = useNavigate();
     const ws = React.useRef<WebSocket | null>(null);
@@ -65,13 +80,17 @@ export const usePlayApi = (props: Props) => {
 
     const handleOnMessage = (message: MessageEvent) => {
         const data: PlayOnMessageApiResponse = JSON.parse(message.data);
+        if ("seq" in data) lastSeqRef.current = data.seq;
 
         const ON_MESSAGE_HANDLERS: Record<PlayApiMessageType, (data: PlayOnMessageApiResponse) => void> = {
             [PLAY_API_RESPONSE_TYPE.JOIN]: handleJoined,
+            [PLAY_API_RESPONSE_TYPE.RESUME]: handleResumed,
             [PLAY_API_RESPONSE_TYPE.GAME_STARTED]: handleGameStarted,
             [PLAY_API_RESPONSE_TYPE.MOVE]: handleMove,
             [PLAY_API_RESPONSE_TYPE.GAME_RESULT]: handleGameResult,
             [PLAY_API_RESPONSE_TYPE.OFFER_DRAW]: handleReceivedDrawOffer,
+            [PLAY_API_RESPONSE_TYPE.PREMOVE_CANCELLED]: handlePremoveCancelled,
+            [PLAY_API_RESPONSE_TYPE.PING]: handlePing,
             [PLAY_API_RESPONSE_TYPE.ERROR]: handleErrorResponse,
         };
 
@@ -107,12 +126,39 @@ export const usePlayApi = (props: Props) => {
     const updateMove = (moveName: MoveName) => {
         const { move, promotionPiece } = Move.fromName(moveName);
         handleClientMakeMove(move, promotionPiece);
+        plyRef.current++;
+    };
+
+    const updatePlayerTimes = (whiteTime: number, blackTime: number) => {
+        setPlayers(
+            (players) =>
+                players && {
+                    [Color.White]: { ...players[Color.White], time: whiteTime },
+                    [Color.Black]: { ...players[Color.Black], time: blackTime },
+                },
+        );
     };
 
     const handleMove = (data: MoveApiResponse) => {
         setHighlightDrawButton(false);
-        updatePlayersFromAPI(data.players);
-        updateMove(data.move);
+        updatePlayerTimes(data.white_time, data.black_time);
+        if (data.ply > plyRef.current) updateMove(data.move);
+        // Own premoves are sent back once the server plays them
+        if (data.move === premoveRef.current) setPremove(null);
+    };
+
+    const setPremove = (move: MoveName | null) => {
+        premoveRef.current = move;
+        setPremoveState(move);
+    };
+
+    const handlePremoveCancelled = () => {
+        setPremove(null);
+    };
+
+    /** Answered right away, the server compensates the measured network delay on the clock */
+    const handlePing = (data: PingApiResponse) => {
+        sendMessage({ type: "pong", ping_id: data.ping_id });
     };
 
     const handleGameResult = (data: PlayGameResultApiResponse) => {
@@ -129,13 +175,23 @@ export const usePlayApi = (props: Props) => {
         }
         updatePlayersFromAPI(data.players);
 
-        for (const move of data.moves) {
+        // After a reconnect the board already has the moves received before
+        for (const move of data.moves.slice(plyRef.current)) {
             updateMove(move);
         }
 
         setGameStarted(data.game_started);
         setHighlightDrawButton(data.offer_draw);
 
+        reconnectAttemptsRef.current = 0;
+        setConnectionState(CONNECTION_STATE.CONNECTED);
+    };
+
+    /** The events missed while reconnecting were replayed before */
+    const handleResumed = (data: ResumeApiResponse) => {
+        updatePlayerTimes(data.white_time, data.black_time);
+
+        reconnectAttemptsRef.current = 0;
         setConnectionState(CONNECTION_STATE.CONNECTED);
     };
 
@@ -154,31 +210,51 @@ export const usePlayApi = (props: Props) => {
         ws.current.send(messageData);
     };
 
-    React.useEffect(() => {
-        if (!handleGameIdValidation()) return;
-        if (ws.current) return;
+    const connect = async () => {
+        if (!(await ensureIdentity())) {
+            setConnectionState(CONNECTION_STATE.ERROR);
+            return;
+        }
 
         const createWs = new WebSocket(getWSUri() + "/api/play/" + gameId);
 
         createWs.onopen = () => {
             ws.current = createWs;
-            joinGame();
+            if (lastSeqRef.current === null) joinGame();
+            else resumeGame(lastSeqRef.current);
         };
         createWs.onmessage = (event) => {
             handleOnMessage(event);
         };
         createWs.onclose = (event) => {
-            const REGULAR_CLOSE_CODE = 1000;
             if (event.code === REGULAR_CLOSE_CODE) return;
 
+            // A dropped connection of a joined game is resumed from the last event received
+            if (lastSeqRef.current !== null && reconnectAttemptsRef.current < MAX_RECONNECT_ATTEMPTS) {
+                // The delay doubles with every attempt, the attempts outlast the takeover of a game by another worker
+                setConnectionState(CONNECTION_STATE.CONNECTING);
+                setTimeout(connect, RECONNECT_DELAY_MS * 2 ** reconnectAttemptsRef.current);
+                reconnectAttemptsRef.current++;
+                return;
+            }
+
             setError("Connection closed - CODE: " + event.code);
         };
         createWs.onerror = () => {
-            setError("Error connecting to server");
+            if (lastSeqRef.current === null) setError("Error connecting to server");
         };
 
+    };
+
+    React.useEffect(() => {
+        if (!handleGameIdValidation()) return;
+        if (ws.current) return;
+
+        connect();
+
         return () => {
-            if (createWs.readyState === createWs.OPEN) createWs.close();
+            // The websocket may have been replaced by a reconnect meanwhile
+            if (ws.current?.readyState === WebSocket.OPEN) ws.current.close(REGULAR_CLOSE_CODE);
         };
     }, []);
 
@@ -186,11 +262,27 @@ export const usePlayApi = (props: Props) => {
         sendMessage({ type: "join", game_id: gameId });
     };
 
+    const resumeGame = (lastSeq: number) => {
+        sendMessage({ type: "resume", game_id: gameId, last_seq: lastSeq });
+    };
+
     const broadcastMove = (move: MoveInfo) => {
         setHighlightDrawButton(false);
+        plyRef.current++;
         sendMessage({ type: "move", move: move.toName() });
     };
 
+    /** Queues the move to be played by the server as soon as the opponent moves, replaces the previous premove */
+    const broadcastPremove = (move: MoveInfo) => {
+        setPremove(move.toName());
+        sendMessage({ type: "premove", move: move.toName() });
+    };
+
+    const cancelPremove = () => {
+        setPremove(null);
+        sendMessage({ type: "cancel_premove" });
+    };
+
     const handleResign = () => {
         sendMessage({ type: "resign" });
     };
@@ -204,7 +296,10 @@ export const usePlayApi = (props: Props) => {
         gameResult,
         highlightDrawButton,
         connectionState,
+        premove,
         broadcastMove,
+        broadcastPremove,
+        cancelPremove,
         handleResign,
         handleOfferDraw,
     };
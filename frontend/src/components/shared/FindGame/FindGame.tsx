@@ -13,6 +13,7 @@ import {
     GameFoundApiResponse,
 } from "types/api/findGame";
 import { ErrorApiResponse } from "types/api/play";
+import { ensureIdentity } from "utils/api";
 import { getWSUri } from "utils/websockets";
 import FindGameContainer from "./FindGameContainer/FindGameContainer";
 import { CloseFindGamePopupProps, SharedFindGameProps } from "./FindGameContainer/types";
@@ -67,7 +68,13 @@ export default function FindGame(props: FindGameProps) {
     };
 
     React.useLayoutEffect(() => {
-        if (ws.current) return;
+        return () => handleCloseWebSocket();
+    }, []);
+
+    /** Connects to the queue once the visitor starts queuing, so that visitors who don't play get no session */
+    const connectQueue = async (): Promise<boolean> => {
+        if (ws.current && ws.current.readyState === ws.current.OPEN) return true;
+        if (!(await ensureIdentity())) return false;
 
         const createWs = new WebSocket(getWSUri() + "/api/play/queue");
         ws.current = createWs;
@@ -75,18 +82,19 @@ export default function FindGame(props: FindGameProps) {
         createWs.onmessage = (e) => {
             handleOnMessage(e);
         };
-        createWs.onclose = (ev) => {
-            if (ev.code === 1000) return; // Normal closure
-            setError("Connection closed - CODE: " + ev.code);
-        };
-        createWs.onerror = () => {
-            setError("Error connecting to server");
-        };
-
-        return () => {
-            if (createWs.readyState === createWs.OPEN) createWs.close();
-        };
-    }, []);
+        return new Promise((resolve) => {
+            createWs.onopen = () => resolve(true);
+            createWs.onclose = (ev) => {
+                resolve(false);
+                if (ev.code === 1000) return; // Normal closure
+                setError("Connection closed - CODE: " + ev.code);
+            };
+            createWs.onerror = () => {
+                resolve(false);
+                setError("Error connecting to server");
+            };
+        });
+    };
 
     const handleCloseWebSocket = () => {
         if (ws.current && ws.current.readyState === ws.current.OPEN) {
@@ -144,24 +152,24 @@ export default function FindGame(props: FindGameProps) {
         }
     };
 
-    const startQueueing = (queue: QueueState) => {
+    const startQueueing = async (queue: QueueState) => {
         setIsFindGamePopupOpen(false);
         setQueuing(queue);
         setShowQueuing(true);
-        startQueuingAPI(queue);
+        if (await connectQueue()) startQueuingAPI(queue);
     };
 
     const handleStartQueueing: HandleStartQueueingType = async (queue) => {
         switch (playAgainst) {
             case "random":
-                startQueueing(queue);
+                await startQueueing(queue);
                 break;
             case "friend":
                 if (selectedFriend) {
                     queue.group = [selectedFriend!, appContext.username!];
                     queue.group.sort();
                 }
-                startQueueing(queue);
+                await startQueueing(queue);
                 break;
             case "link":
                 await startLinkAPI(queue);
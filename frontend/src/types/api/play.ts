@@ -8,6 +8,9 @@ export const PLAY_API_RESPONSE_TYPE = {
     MOVE: "move",
     GAME_RESULT: "game_result",
     OFFER_DRAW: "offer_draw",
+    PREMOVE_CANCELLED: "premove_cancelled",
+    RESUME: "resume",
+    PING: "ping",
     ERROR: "error",
 } as const;
 export type PlayApiMessageType = (typeof PLAY_API_RESPONSE_TYPE)[keyof typeof PLAY_API_RESPONSE_TYPE];
@@ -18,9 +21,17 @@ export type PlayOnMessageApiResponse =
     | MoveApiResponse
     | PlayGameResultApiResponse
     | OfferDrawApiResponse
+    | PremoveCancelledApiResponse
+    | ResumeApiResponse
+    | PingApiResponse
     | ErrorApiResponse;
 
-export type JoinApiResponse = {
+/** Sequence number of the game event the message was sent for, the game is resumed from the last one received */
+type SequencedApiResponse = {
+    seq: number;
+};
+
+export type JoinApiResponse = SequencedApiResponse & {
     type: typeof PLAY_API_RESPONSE_TYPE.JOIN;
     players: GamePlayersApi;
     moves: MoveName[];
@@ -28,25 +39,45 @@ export type JoinApiResponse = {
     game_started: boolean;
 };
 
-export type GameStartedApiResponse = {
+export type GameStartedApiResponse = SequencedApiResponse & {
     type: typeof PLAY_API_RESPONSE_TYPE.GAME_STARTED;
     players: GamePlayersApi;
 };
 
-export type MoveApiResponse = {
+/** The players are only sent on join and start, the moves carry just the clocks of both players in milliseconds */
+export type MoveApiResponse = SequencedApiResponse & {
     type: typeof PLAY_API_RESPONSE_TYPE.MOVE;
     move: MoveName;
-    players: GamePlayersApi;
+    ply: number;
+    white_time: number;
+    black_time: number;
 };
 
-export type PlayGameResultApiResponse = GameResultApiResponse & {
+export type PlayGameResultApiResponse = GameResultApiResponse & SequencedApiResponse & {
     type: typeof PLAY_API_RESPONSE_TYPE.GAME_RESULT;
 };
 
-type OfferDrawApiResponse = {
+type OfferDrawApiResponse = SequencedApiResponse & {
     type: typeof PLAY_API_RESPONSE_TYPE.OFFER_DRAW;
 };
 
+type PremoveCancelledApiResponse = SequencedApiResponse & {
+    type: typeof PLAY_API_RESPONSE_TYPE.PREMOVE_CANCELLED;
+};
+
+/** Sent after the events missed while reconnecting were replayed, with the current clocks in milliseconds */
+export type ResumeApiResponse = SequencedApiResponse & {
+    type: typeof PLAY_API_RESPONSE_TYPE.RESUME;
+    white_time: number;
+    black_time: number;
+};
+
+/** Sent periodically by the server to measure the round-trip time, answered with a pong of the same ID */
+export type PingApiResponse = {
+    type: typeof PLAY_API_RESPONSE_TYPE.PING;
+    ping_id: number;
+};
+
 export type ErrorApiResponse = {
     type: typeof PLAY_API_RESPONSE_TYPE.ERROR;
     message: string;
@@ -54,22 +85,36 @@ export type ErrorApiResponse = {
 
 export const PLAY_API_MESSAGE_TYPE = {
     JOIN: PLAY_API_RESPONSE_TYPE.JOIN,
+    RESUME: PLAY_API_RESPONSE_TYPE.RESUME,
     MOVE: PLAY_API_RESPONSE_TYPE.MOVE,
     OFFER_DRAW: PLAY_API_RESPONSE_TYPE.OFFER_DRAW,
     RESIGN: "resign",
+    PREMOVE: "premove",
+    CANCEL_PREMOVE: "cancel_premove",
+    PONG: "pong",
 };
 
 export type SendApiMessageData =
     | SendApiJoinMessageData
+    | SendApiResumeMessageData
     | SendApiMoveMessageData
     | SendApiOfferDrawMessageData
-    | SendApiResignMessageData;
+    | SendApiResignMessageData
+    | SendApiPremoveMessageData
+    | SendApiCancelPremoveMessageData
+    | SendApiPongMessageData;
 
 type SendApiJoinMessageData = {
     type: typeof PLAY_API_MESSAGE_TYPE.JOIN;
     game_id: string;
 };
 
+type SendApiResumeMessageData = {
+    type: typeof PLAY_API_MESSAGE_TYPE.RESUME;
+    game_id: string;
+    last_seq: number;
+};
+
 export type SendApiMoveMessageData = {
     type: typeof PLAY_API_MESSAGE_TYPE.MOVE;
     move: MoveName;
@@ -82,3 +127,17 @@ type SendApiOfferDrawMessageData = {
 type SendApiResignMessageData = {
     type: typeof PLAY_API_MESSAGE_TYPE.RESIGN;
 };
+
+export type SendApiPremoveMessageData = {
+    type: typeof PLAY_API_MESSAGE_TYPE.PREMOVE;
+    move: MoveName;
+};
+
+type SendApiCancelPremoveMessageData = {
+    type: typeof PLAY_API_MESSAGE_TYPE.CANCEL_PREMOVE;
+};
+
+type SendApiPongMessageData = {
+    type: typeof PLAY_API_MESSAGE_TYPE.PONG;
+    ping_id: number;
+};
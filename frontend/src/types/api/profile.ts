@@ -1,10 +1,18 @@
 import { Statuses } from "types/friendStatuses";
 import { SimpleGameApiResponse } from "./game";
 
+export type GameScores = {
+    wins: number;
+    losses: number;
+    draws: number;
+};
+
 export type ProfileApiResponse = {
     date_joined: string;
     games: SimpleGameApiResponse[];
     total_games: number;
+    game_stats: GameScores & { modes: Record<string, GameScores> };
+    next_cursor: string | null;
     total_friends: number;
     friend_status?: Statuses;
     friend_requests?: number;
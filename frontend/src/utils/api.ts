@@ -15,3 +15,20 @@ export const handleFriendsAPI = async (friendStatus: FriendStatus, username: str
         ErrorQueueClass.handleError(err);
     }
 };
+
+let identityRequest: Promise<boolean> | null = null;
+
+/**
+ * Makes sure the visitor has a session, which the game websockets identify the player by.
+ * - The session is only created once the visitor plays, requested once per page load
+ */
+export const ensureIdentity = (): Promise<boolean> => {
+    identityRequest ??= axios({ method: "post", url: "/api/play/identity", headers: { "X-CSRFToken": getCSRF() } })
+        .then(() => true)
+        .catch((err) => {
+            identityRequest = null;
+            ErrorQueueClass.handleError(err);
+            return false;
+        });
+    return identityRequest;
+};